@@ -4,11 +4,22 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
 from core.models import User, Plan
 from dashboard.models import Investment, Deposit, Withdrawal, DailyProfit
-from admin_panel.models import AdminLog, AdminNotification, SiteSetting
+from admin_panel.models import AdminLog, AdminNotification, JobRun, SiteSetting, SlowQuery
+
+class ChangedFieldsAdminMixin:
+    """Save edited rows writing only the changed columns"""
+    
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Narrowed inside save(), after the model derives its own
+            # fields (e.g. Deposit.approved_at on a status change)
+            obj.save_changed()
+        else:
+            obj.save()
 
 # === USER ADMIN ===
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ChangedFieldsAdminMixin, UserAdmin):
     list_display = ('username', 'email', 'full_name', 'account_balance', 'active_balance', 
                    'is_active', 'is_staff', 'date_joined')
     list_filter = ('is_active', 'is_staff', 'is_superuser', 'date_joined')
@@ -73,7 +84,7 @@ class PlanAdmin(admin.ModelAdmin):
 
 # === INVESTMENT ADMIN ===
 @admin.register(Investment)
-class InvestmentAdmin(admin.ModelAdmin):
+class InvestmentAdmin(ChangedFieldsAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'plan', 'amount', 'daily_profit', 'total_profit',
                    'status', 'start_date', 'end_date')
     list_filter = ('status', 'plan', 'start_date')
@@ -92,7 +103,7 @@ class InvestmentAdmin(admin.ModelAdmin):
 
 # === DEPOSIT ADMIN ===
 @admin.register(Deposit)
-class DepositAdmin(admin.ModelAdmin):
+class DepositAdmin(ChangedFieldsAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'amount', 'crypto_type', 'status', 'created_at', 'approved_at', 'transaction_hash')
     list_filter = ('status', 'crypto_type', 'created_at')
     search_fields = ('user__username', 'transaction_hash', 'wallet_address')
@@ -104,7 +115,8 @@ class DepositAdmin(admin.ModelAdmin):
     def approve_selected_deposits(self, request, queryset):
         approved_count = 0
         for deposit in queryset.filter(status='PENDING'):
-            deposit.approve()
+            if not deposit.approve():
+                continue
             approved_count += 1
             
             # Log the action
@@ -133,7 +145,7 @@ class DepositAdmin(admin.ModelAdmin):
 
 # === WITHDRAWAL ADMIN ===
 @admin.register(Withdrawal)
-class WithdrawalAdmin(admin.ModelAdmin):
+class WithdrawalAdmin(ChangedFieldsAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'amount', 'crypto_type', 'crypto_address', 'status', 'created_at', 'approved_at')
     list_filter = ('status', 'crypto_type', 'created_at')
     search_fields = ('user__username', 'crypto_address')
@@ -196,6 +208,29 @@ class AdminLogAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False  # Logs should not be editable
 
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('duration_ms', 'view', 'full_scan', 'database', 'created_at')
+    list_filter = ('full_scan', 'view')
+    search_fields = ('sql', 'view', 'path')
+    
+    def has_add_permission(self, request):
+        return False  # Captured by SlowQueryMiddleware only
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'status', 'trigger', 'duration_ms', 'rows', 'queries', 'peak_memory_bytes', 'started_at')
+    list_filter = ('job', 'status', 'trigger')
+    
+    def has_add_permission(self, request):
+        return False  # Recorded by dashboard.telemetry only
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # === ADMIN NOTIFICATION ADMIN ===
 @admin.register(AdminNotification)
 class AdminNotificationAdmin(admin.ModelAdmin):
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0003_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('trigger', models.CharField(blank=True, max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('SUCCESS', 'Success'), ('PARTIAL', 'Stopped at time budget'), ('CONTENDED', 'Locked by another run'), ('FAILED', 'Failed')], max_length=10)),
+                ('duration_ms', models.FloatField()),
+                ('rows', models.IntegerField(default=0)),
+                ('queries', models.IntegerField(default=0)),
+                ('db_ms', models.FloatField(default=0)),
+                ('peak_memory_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('phases', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['job', 'id'], name='jobrun_job_idx')],
+            },
+        ),
+    ]
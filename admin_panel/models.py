@@ -1,3 +1,7 @@
+import io
+import marshal
+import pstats
+
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -48,4 +52,112 @@ class SiteSetting(models.Model):
     description = models.CharField(max_length=255, blank=True)
     
     def __str__(self):
-        return self.key
\ No newline at end of file
+        return self.key
+
+class BoundedLog(models.Model):
+    """A table used as a ring buffer: trim() keeps only the newest rows"""
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def trim(cls, keep):
+        """Delete all but the newest `keep` rows"""
+        oldest_kept = cls.objects.order_by('-id').values_list('id', flat=True)[keep - 1:keep].first()
+        if oldest_kept is not None:
+            cls.objects.filter(id__lt=oldest_kept).delete()
+
+
+class SlowQuery(BoundedLog):
+    """A statement slower than SLOW_QUERY_MS (see core.slow_queries)"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField()
+    sql = models.TextField()
+    params_shape = models.CharField(max_length=255, blank=True)
+    view = models.CharField(max_length=200, blank=True)
+    path = models.CharField(max_length=500, blank=True)
+    stack = models.TextField(blank=True)
+    plan = models.TextField(blank=True)
+    full_scan = models.BooleanField(default=False)
+    database = models.CharField(max_length=20)
+    
+    class Meta:
+        ordering = ['-id']
+        verbose_name_plural = 'slow queries'
+    
+    def __str__(self):
+        return f"{self.duration_ms:.0f}ms {self.view or self.path} - {self.created_at}"
+
+
+class _LoadedStats:
+    """Adapter letting pstats.Stats load a marshalled stats dict"""
+    
+    def __init__(self, stats):
+        self.stats = stats
+    
+    def create_stats(self):
+        pass
+
+
+class RequestProfile(BoundedLog):
+    """A cProfile run of one request, requested by a staff user"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view = models.CharField(max_length=200, blank=True)
+    status_code = models.IntegerField()
+    duration_ms = models.FloatField()
+    queries = models.IntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    stats = models.BinaryField()  # marshalled cProfile stats
+    
+    class Meta:
+        ordering = ['-id']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} {self.duration_ms:.0f}ms - {self.created_at}"
+    
+    def get_stats(self):
+        return pstats.Stats(_LoadedStats(marshal.loads(bytes(self.stats))))
+    
+    def render_stats(self, sort='cumulative', limit=60):
+        """pstats report sorted by `sort`, as text"""
+        out = io.StringIO()
+        stats = self.get_stats()
+        stats.stream = out
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class JobRun(BoundedLog):
+    """Timing, query and memory telemetry of one batch job run (see dashboard.telemetry)"""
+    STATUS_CHOICES = [
+        ('SUCCESS', 'Success'),
+        ('PARTIAL', 'Stopped at time budget'),
+        ('CONTENDED', 'Locked by another run'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    job = models.CharField(max_length=100)
+    trigger = models.CharField(max_length=20, blank=True)
+    started_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    duration_ms = models.FloatField()
+    rows = models.IntegerField(default=0)
+    queries = models.IntegerField(default=0)
+    db_ms = models.FloatField(default=0)
+    peak_memory_bytes = models.BigIntegerField(null=True, blank=True)  # tracemalloc peak
+    phases = models.JSONField(default=dict)  # name -> {seconds, queries, calls}
+    error = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-id']
+        indexes = [models.Index(fields=['job', 'id'], name='jobrun_job_idx')]
+    
+    def __str__(self):
+        return f"{self.job} {self.status} {self.duration_ms:.0f}ms - {self.started_at}"
+    
+    @property
+    def rows_per_second(self):
+        return self.rows / (self.duration_ms / 1000) if self.duration_ms else 0.0
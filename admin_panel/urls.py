@@ -32,4 +32,10 @@ urlpatterns = [
     path('logs/', views.admin_logs, name='admin_logs'),
     path('notifications/', views.notifications, name='notifications'),
     path('settings/', views.site_settings, name='site_settings'),
+    
+    # Performance
+    path('performance/slow-queries/', views.slow_queries, name='slow_queries'),
+    path('performance/profiles/', views.request_profiles, name='request_profiles'),
+    path('performance/profiles/<int:profile_id>/', views.request_profile_detail, name='request_profile_detail'),
+    path('performance/jobs/', views.job_runs, name='job_runs'),
 ]
\ No newline at end of file
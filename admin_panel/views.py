@@ -1,18 +1,25 @@
+import json
+import statistics
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings as django_settings
 from django.contrib import messages
 from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import datetime, timedelta
 from core.models import User, Plan
+from core.query_guards import query_budget
 from dashboard.models import Deposit, Withdrawal, Investment, DailyProfit
-from admin_panel.models import AdminLog, AdminNotification, SiteSetting
+from admin_panel.models import AdminLog, AdminNotification, JobRun, RequestProfile, SiteSetting, SlowQuery
 
 def admin_required(view_func):
     return user_passes_test(lambda u: u.is_superuser)(view_func)
 
 @staff_member_required
+@query_budget(20)
 def admin_dashboard(request):
     # Statistics
     today = timezone.now().date()
@@ -35,8 +42,8 @@ def admin_dashboard(request):
     pending_withdrawals = Withdrawal.objects.filter(status='PENDING').count()
     
     # Recent activities
-    recent_deposits = Deposit.objects.order_by('-created_at')[:10]
-    recent_withdrawals = Withdrawal.objects.order_by('-created_at')[:10]
+    recent_deposits = Deposit.objects.select_related('user').order_by('-created_at')[:10]
+    recent_withdrawals = Withdrawal.objects.select_related('user').order_by('-created_at')[:10]
     recent_users = User.objects.order_by('-date_joined')[:10]
     
     # Notifications
@@ -87,13 +94,14 @@ def user_management(request):
     return render(request, 'admin_panel/user_management.html', context)
 
 @staff_member_required
+@query_budget(10)
 def user_detail(request, user_id):
     user = get_object_or_404(User, id=user_id)
     
     # Get user's activities
     deposits = user.deposits.all().order_by('-created_at')
     withdrawals = user.withdrawals.all().order_by('-created_at')
-    investments = user.investments.all().order_by('-start_date')
+    investments = user.investments.select_related('plan').order_by('-start_date')
     referrals = user.referrals.all().order_by('-date_joined')
     
     context = {
@@ -106,8 +114,9 @@ def user_detail(request, user_id):
     return render(request, 'admin_panel/user_detail.html', context)
 
 @staff_member_required
+@query_budget(5)
 def deposit_management(request):
-    deposits = Deposit.objects.all().order_by('-created_at')
+    deposits = Deposit.objects.select_related('user').order_by('-created_at')
     
     # Filters
     status_filter = request.GET.get('status', '')
@@ -141,17 +150,18 @@ def approve_deposit(request, deposit_id):
     deposit = get_object_or_404(Deposit, id=deposit_id)
     
     if request.method == 'POST':
-        deposit.approve()
-        
-        # Log the action
-        AdminLog.objects.create(
-            admin=request.user,
-            action='DEPOSIT_APPROVE',
-            description=f'Approved deposit #{deposit.id} of ${deposit.amount} from {deposit.user}',
-            ip_address=request.META.get('REMOTE_ADDR')
-        )
+        if deposit.approve():
+            # Log the action
+            AdminLog.objects.create(
+                admin=request.user,
+                action='DEPOSIT_APPROVE',
+                description=f'Approved deposit #{deposit.id} of ${deposit.amount} from {deposit.user}',
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
+            messages.success(request, f'Deposit #{deposit.id} approved successfully.')
+        else:
+            messages.info(request, f'Deposit #{deposit.id} was already processed.')
         
-        messages.success(request, f'Deposit #{deposit.id} approved successfully.')
         return redirect('admin_panel:deposit_management')
     
     return render(request, 'admin_panel/confirm_approval.html', {
@@ -183,8 +193,9 @@ def cancel_deposit(request, deposit_id):
     })
 
 @staff_member_required
+@query_budget(5)
 def withdrawal_management(request):
-    withdrawals = Withdrawal.objects.all().order_by('-created_at')
+    withdrawals = Withdrawal.objects.select_related('user').order_by('-created_at')
     
     # Filters
     status_filter = request.GET.get('status', '')
@@ -229,6 +240,8 @@ def approve_withdrawal(request, withdrawal_id):
                 ip_address=request.META.get('REMOTE_ADDR')
             )
             messages.success(request, f'Withdrawal #{withdrawal.id} approved successfully.')
+        elif withdrawal.status != 'PENDING':
+            messages.info(request, f'Withdrawal #{withdrawal.id} was already processed.')
         else:
             messages.error(request, f'Insufficient balance for withdrawal #{withdrawal.id}.')
         
@@ -310,10 +323,25 @@ def transaction_history(request):
     return render(request, 'admin_panel/transaction_history.html', context)
 
 @staff_member_required
+@query_budget(10)
 def reports(request):
     today = timezone.now().date()
+    first_day = today - timedelta(days=30)
+    
+    # Daily stats for the last 30 days, one grouped query per series
+    def per_day(queryset, field, value):
+        return dict(
+            queryset.filter(**{f'{field}__date__gte': first_day})
+            .annotate(day=TruncDate(field))
+            .values('day')
+            .annotate(value=value)
+            .values_list('day', 'value')
+        )
+    
+    daily_deposits = per_day(Deposit.objects.filter(status='APPROVED'), 'approved_at', Sum('amount'))
+    daily_withdrawals = per_day(Withdrawal.objects.filter(status='APPROVED'), 'approved_at', Sum('amount'))
+    daily_users = per_day(User.objects.all(), 'date_joined', Count('id'))
     
-    # Daily stats for the last 30 days
     dates = []
     deposit_data = []
     withdrawal_data = []
@@ -322,24 +350,9 @@ def reports(request):
     for i in range(30, -1, -1):
         date = today - timedelta(days=i)
         dates.append(date.strftime('%Y-%m-%d'))
-        
-        # Deposits for this day
-        daily_deposits = Deposit.objects.filter(
-            approved_at__date=date,
-            status='APPROVED'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        deposit_data.append(float(daily_deposits))
-        
-        # Withdrawals for this day
-        daily_withdrawals = Withdrawal.objects.filter(
-            approved_at__date=date,
-            status='APPROVED'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        withdrawal_data.append(float(daily_withdrawals))
-        
-        # New users for this day
-        daily_users = User.objects.filter(date_joined__date=date).count()
-        user_data.append(daily_users)
+        deposit_data.append(float(daily_deposits.get(date) or 0))
+        withdrawal_data.append(float(daily_withdrawals.get(date) or 0))
+        user_data.append(daily_users.get(date, 0))
     
     context = {
         'dates': dates,
@@ -354,6 +367,102 @@ def admin_logs(request):
     logs = AdminLog.objects.all().order_by('-created_at')
     return render(request, 'admin_panel/admin_logs.html', {'logs': logs})
 
+@admin_required
+def slow_queries(request):
+    queries = SlowQuery.objects.all()
+    
+    if request.method == 'POST':
+        SlowQuery.objects.all().delete()
+        messages.success(request, 'Slow query log cleared.')
+        return redirect('admin_panel:slow_queries')
+    
+    view_filter = request.GET.get('view', '')
+    full_scan = request.GET.get('full_scan') == '1'
+    if view_filter:
+        queries = queries.filter(view=view_filter)
+    if full_scan:
+        queries = queries.filter(full_scan=True)
+    
+    context = {
+        'queries': queries[:100],
+        'views': SlowQuery.objects.order_by('view').values_list('view', flat=True).distinct(),
+        'view_filter': view_filter,
+        'full_scan': full_scan,
+        'threshold_ms': getattr(django_settings, 'SLOW_QUERY_MS', 0),
+    }
+    return render(request, 'admin_panel/slow_queries.html', context)
+
+PROFILE_SORTS = {
+    'cumulative': 'Cumulative time',
+    'tottime': 'Own time',
+    'ncalls': 'Calls',
+}
+
+@staff_member_required
+def request_profiles(request):
+    profiles = RequestProfile.objects.select_related('user').defer('stats')[:100]
+    return render(request, 'admin_panel/request_profiles.html', {
+        'profiles': profiles,
+        'enabled': getattr(django_settings, 'REQUEST_PROFILING', False),
+    })
+
+@staff_member_required
+def request_profile_detail(request, profile_id):
+    profile = get_object_or_404(RequestProfile, id=profile_id)
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in PROFILE_SORTS:
+        sort = 'cumulative'
+    
+    return render(request, 'admin_panel/request_profile_detail.html', {
+        'profile': profile,
+        'report': profile.render_stats(sort),
+        'sort': sort,
+        'sorts': PROFILE_SORTS,
+    })
+
+# Runs of one job shown in the trend charts
+JOB_TREND_RUNS = 100
+
+@staff_member_required
+def job_runs(request):
+    jobs = list(JobRun.objects.order_by('job').values_list('job', flat=True).distinct())
+    job = request.GET.get('job', '')
+    if job not in jobs:
+        job = jobs[0] if jobs else ''
+    
+    # Oldest first for the charts
+    trend = list(JobRun.objects.filter(job=job).order_by('-id')[:JOB_TREND_RUNS])[::-1]
+    phase_names = sorted({name for run in trend for name in run.phases if '.' not in name})
+    
+    # Latest complete run against the median of the ones before it
+    durations = [run.duration_ms for run in trend if run.status == 'SUCCESS']
+    slowdown = None
+    if len(durations) > 1:
+        baseline = statistics.median(durations[:-1])
+        slowdown = durations[-1] / baseline if baseline else None
+    
+    context = {
+        'jobs': jobs,
+        'job': job,
+        'runs': trend[::-1][:50],
+        'slowdown': slowdown,
+        'baseline_runs': len(durations) - 1,
+        'keep': getattr(django_settings, 'JOB_RUN_KEEP', 2000),
+        'labels': json.dumps([timezone.localtime(run.started_at).strftime('%m-%d %H:%M') for run in trend]),
+        'duration_data': json.dumps([round(run.duration_ms / 1000, 3) for run in trend]),
+        'throughput_data': json.dumps([round(run.rows_per_second, 1) for run in trend]),
+        'query_data': json.dumps([run.queries for run in trend]),
+        'memory_data': json.dumps([
+            round(run.peak_memory_bytes / 2**20, 2) if run.peak_memory_bytes is not None else None
+            for run in trend
+        ]),
+        'phase_data': json.dumps([
+            {'label': name, 'data': [round(run.phases.get(name, {}).get('seconds', 0), 3) for run in trend]}
+            for name in phase_names
+        ]),
+    }
+    return render(request, 'admin_panel/job_runs.html', context)
+
 @staff_member_required
 def notifications(request):
     notifications = AdminNotification.objects.all().order_by('-created_at')
@@ -13,7 +13,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minersurb.settings')
 import django
 django.setup()
 
-from dashboard.models import Investment, UserProfitTracker
+from dashboard.engine import TimeBudget, complete_expired_investments, sync_profit_trackers
+from dashboard.telemetry import job_run
 from django.utils import timezone
 from decimal import Decimal
 from django.http import JsonResponse
@@ -22,46 +23,53 @@ from django.views.decorators.http import require_POST
 
 logger = logging.getLogger(__name__)
 
+
+def run_cleanup():
+    """
+    Run the cleanup jobs within BATCH_TIME_BUDGET. When the budget runs out
+    `more_work` is set and the next invocation resumes from the saved cursor.
+    `contended` means another run already holds the job lock. Each run is
+    saved as a JobRun (dashboard.telemetry).
+    """
+    budget = TimeBudget.from_settings()
+    results = {
+        'timestamp': timezone.now().isoformat(),
+        'expired_investments_processed': 0,
+        'profit_trackers_updated': 0,
+        'more_work': False,
+        'contended': False,
+    }
+    
+    with job_run('cron_cleanup', trigger='cron') as run:
+        # 1. Process expired investments (chunked, set-based)
+        with run.phase('complete_expired'):
+            expired = complete_expired_investments(budget=budget)
+        run.record(expired)
+        results['expired_investments_processed'] = expired.processed
+        results['expired_investments_cursor'] = expired.cursor
+        results['more_work'] = expired.more_work
+        results['contended'] = expired.contended
+        
+        # 2. Update profit trackers (single UPDATE), once the backlog is drained
+        if not expired.more_work and not budget.exhausted():
+            with run.phase('sync_trackers'):
+                results['profit_trackers_updated'] = sync_profit_trackers()
+        else:
+            results['more_work'] = True
+            run.more_work = True
+    
+    results['elapsed_seconds'] = round(budget.elapsed, 3)
+    return results
+
+
 # ==================== ORIGINAL HANDLER CLASS ====================
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Daily cleanup of expired investments and profit tracker updates"""
         try:
-            results = {
-                'timestamp': timezone.now().isoformat(),
-                'expired_investments_processed': 0,
-                'profit_trackers_updated': 0,
-                'errors': []
-            }
-            
-            # 1. Process expired investments
-            expired_investments = Investment.objects.filter(
-                status='ACTIVE',
-                end_date__lt=timezone.now()
-            )
-            
-            for investment in expired_investments:
-                try:
-                    if investment.complete_investment():
-                        results['expired_investments_processed'] += 1
-                        logger.info(f"✅ Completed expired investment #{investment.id} for {investment.user.username}")
-                except Exception as e:
-                    error_msg = f"Investment #{investment.id}: {str(e)}"
-                    results['errors'].append(error_msg)
-                    logger.error(f"❌ Error completing investment #{investment.id}: {str(e)}")
-            
-            # 2. Update profit trackers (sanity check)
-            for tracker in UserProfitTracker.objects.all():
-                try:
-                    # Ensure total_profit_earned matches user's total_earnings
-                    if tracker.total_profit_earned != tracker.user.total_earnings:
-                        tracker.total_profit_earned = tracker.user.total_earnings
-                        tracker.save()
-                        results['profit_trackers_updated'] += 1
-                except Exception as e:
-                    error_msg = f"Tracker user#{tracker.user.id}: {str(e)}"
-                    results['errors'].append(error_msg)
+            results = run_cleanup()
+            logger.info(f"✅ Completed {results['expired_investments_processed']} expired investments")
             
             # Send success response
             self.send_response(200)
@@ -71,6 +79,7 @@ class handler(BaseHTTPRequestHandler):
             response = {
                 'success': True,
                 'message': 'Daily cleanup completed successfully',
+                'more_work': results['more_work'],
                 'data': results
             }
             
@@ -98,45 +107,17 @@ class handler(BaseHTTPRequestHandler):
 def cron_cleanup(request):
     """Django view for cron cleanup - Vercel will call this"""
     try:
-        # Simple implementation using your handler logic
-        results = {
-            'timestamp': timezone.now().isoformat(),
-            'expired_investments_processed': 0,
-            'profit_trackers_updated': 0,
-        }
-        
-        # Process expired investments
-        expired_investments = Investment.objects.filter(
-            status='ACTIVE',
-            end_date__lt=timezone.now()
-        )
-        
-        for investment in expired_investments:
-            try:
-                if hasattr(investment, 'complete_investment'):
-                    if investment.complete_investment():
-                        results['expired_investments_processed'] += 1
-            except Exception as e:
-                logger.error(f"Error completing investment #{investment.id}: {e}")
-        
-        # Update profit trackers
-        for tracker in UserProfitTracker.objects.all():
-            try:
-                user_investments = Investment.objects.filter(user=tracker.user)
-                total_earned = sum([inv.total_profit for inv in user_investments])
-                
-                if tracker.total_profit_earned != total_earned:
-                    tracker.total_profit_earned = total_earned
-                    tracker.save()
-                    results['profit_trackers_updated'] += 1
-            except Exception as e:
-                logger.error(f"Error updating tracker: {e}")
+        results = run_cleanup()
         
         logger.info(f"Cron cleanup completed: {results}")
         
         return JsonResponse({
             'success': True,
-            'message': 'Cron cleanup completed successfully',
+            'message': (
+                'Cron cleanup stopped at its time budget; call again to resume'
+                if results['more_work'] else 'Cron cleanup completed successfully'
+            ),
+            'more_work': results['more_work'],
             'data': results,
             'timestamp': datetime.now().isoformat()
         })
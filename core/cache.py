@@ -0,0 +1,44 @@
+# core/cache.py
+import time
+
+from django.core.cache import cache
+
+SINGLE_FLIGHT_PREFIX = 'single_flight'
+_MISSING = object()
+
+
+def single_flight(key, compute, result_ttl=2, lock_ttl=30, wait=3.0, poll=0.05, default=None):
+    """
+    Run compute() once for concurrent callers sharing `key`.
+
+    The first caller takes the lock (cache.add is atomic) and computes;
+    callers arriving meanwhile poll for its result for up to `wait` seconds
+    and reuse it, as do callers within `result_ttl` afterwards. If the
+    leader doesn't finish in time (or fails) followers get `default`.
+    Coordination spans processes only with a shared cache (REDIS_URL).
+    """
+    result_key = f'{SINGLE_FLIGHT_PREFIX}:{key}:result'
+    lock_key = f'{SINGLE_FLIGHT_PREFIX}:{key}:lock'
+
+    result = cache.get(result_key, _MISSING)
+    if result is not _MISSING:
+        return result
+
+    if cache.add(lock_key, 1, lock_ttl):
+        try:
+            result = compute()
+            cache.set(result_key, result, result_ttl)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(poll)
+        result = cache.get(result_key, _MISSING)
+        if result is not _MISSING:
+            return result
+        if cache.get(lock_key) is None:
+            # The leader gave up without a result
+            break
+    return default
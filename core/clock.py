@@ -0,0 +1,73 @@
+# core/clock.py
+"""
+The time source of the business logic.
+
+Profit accrual, completion, deposits/withdrawals and the batch jobs read
+the time through clock.now() and clock.today() rather than timezone.now(),
+so a test or the simulate_days command can run whole plan lifecycles in
+simulated time:
+
+    with clock.frozen(start) as frozen:
+        ...
+        frozen.advance(days=1)
+
+The override lives in a ContextVar, so it only affects the current thread
+(or async task) and never leaks into concurrent requests. Operational
+timestamps - job leases, telemetry, metrics, health - stay on real time:
+a lease that expires in simulated time would not protect anything.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+class SystemClock:
+    """Real time"""
+
+    def now(self):
+        return timezone.now()
+
+
+class FrozenClock:
+    """Time that only moves when told to"""
+
+    def __init__(self, moment):
+        self.moment = moment
+
+    def now(self):
+        return self.moment
+
+    def advance(self, **delta):
+        """Move forward by timedelta(**delta), e.g. advance(days=1)"""
+        self.moment += timedelta(**delta)
+        return self.moment
+
+
+_clock = ContextVar('clock', default=SystemClock())
+
+
+def now():
+    """Current (possibly simulated) aware datetime"""
+    return _clock.get().now()
+
+
+def today():
+    """Current (possibly simulated) date in TIME_ZONE, the date of a DailyProfit"""
+    return timezone.localdate(now())
+
+
+@contextmanager
+def use(clock):
+    """Read the time from `clock` inside the block"""
+    token = _clock.set(clock)
+    try:
+        yield clock
+    finally:
+        _clock.reset(token)
+
+
+def frozen(moment=None):
+    """use(FrozenClock(moment)), starting from the current time by default"""
+    return use(FrozenClock(moment or now()))
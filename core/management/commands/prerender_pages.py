@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.prerender import get_prerender_root, prerender_all
+
+
+class Command(BaseCommand):
+    help = 'Render the anonymous landing and auth pages to static HTML'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write to (default: PRERENDER_ROOT)')
+
+    def handle(self, *args, **options):
+        root = options['output'] or get_prerender_root()
+        manifest = prerender_all(root)
+
+        for path, filename in manifest.items():
+            self.stdout.write(f'  {path} -> {filename}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Prerendered {len(manifest)} pages into {root}')
+        )
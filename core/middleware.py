@@ -0,0 +1,276 @@
+# core/middleware.py
+import cProfile
+import json
+import logging
+import marshal
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.apps import apps
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import reverse
+
+from core import query_guards, request_metrics, slow_queries, template_profiler
+from core.prerender import MANIFEST_NAME, get_prerender_root, is_current
+
+logger = logging.getLogger(__name__)
+
+
+class PrerenderedPageMiddleware:
+    """
+    Serve prerendered snapshots to anonymous GET requests.
+
+    Requests carrying a session or messages cookie always reach the view,
+    since the page may then depend on the user or show flash messages.
+    Place it before SessionMiddleware so snapshots skip the session lookup;
+    the snapshot response then sets X-Frame-Options itself, as
+    XFrameOptionsMiddleware never sees it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PRERENDER_ENABLED', False)
+        self.root = get_prerender_root()
+        self.cookies = (settings.SESSION_COOKIE_NAME, 'messages')
+        self._manifest = (None, {})
+        self._pages = {}
+
+    def __call__(self, request):
+        if self.enabled and request.method in ('GET', 'HEAD') and not any(
+            name in request.COOKIES for name in self.cookies
+        ):
+            html = self._get_page(request.path_info)
+            if html is not None:
+                response = HttpResponse(html)
+                response['Cache-Control'] = (
+                    f'public, max-age=0, s-maxage={settings.PRERENDER_CDN_MAX_AGE}'
+                )
+                response['Vary'] = 'Cookie'
+                # The login and password-reset forms must not be framed
+                response['X-Frame-Options'] = getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper()
+                return response
+
+        return self.get_response(request)
+
+    def _get_page(self, path):
+        manifest = self._load_manifest()
+        filename = manifest.get('pages', {}).get(path)
+        if not filename or not is_current(manifest.get('built_at', 0)):
+            return None
+
+        file_path = self.root / filename
+        try:
+            mtime = os.stat(file_path).st_mtime
+        except OSError:
+            return None
+
+        cached = self._pages.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, file_path.read_bytes())
+            self._pages[path] = cached
+        return cached[1]
+
+    def _load_manifest(self):
+        # Re-read only when the snapshots were regenerated or invalidated
+        try:
+            mtime = os.stat(self.root / MANIFEST_NAME).st_mtime
+        except OSError:
+            return {}
+
+        if self._manifest[0] != mtime:
+            with open(self.root / MANIFEST_NAME, encoding='utf-8') as f:
+                self._manifest = (mtime, json.load(f))
+        return self._manifest[1]
+
+
+class TemplateProfilerMiddleware:
+    """
+    Log per-template and per-block render cost for every request.
+
+    Enabled with TEMPLATE_PROFILING = True; otherwise it removes itself from
+    the middleware chain at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TEMPLATE_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        template_profiler.install()
+
+    def __call__(self, request):
+        with template_profiler.profile_render() as stats:
+            response = self.get_response(request)
+
+        request.template_stats = stats
+        if stats.templates:
+            breakdown = ', '.join(
+                f'{kind} {name} x{calls} {ms:.1f}ms'
+                for kind, name, calls, ms in stats.report()
+            )
+            logger.info(f"Template render {request.path} {stats.total_ms:.1f}ms: {breakdown}")
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Count SQL queries and DB time, and time template rendering, per request.
+
+    Adds a Server-Timing header (db, tpl, total), logs one JSON line per
+    request, and feeds request_metrics.histograms. Enabled with
+    REQUEST_METRICS = True; place it first so the whole chain is timed.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = request_metrics.QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            render = stack.enter_context(template_profiler.profile_render())
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+
+        timing = (
+            f'db;dur={queries.ms:.1f};desc="{queries.count} queries", '
+            f'tpl;dur={render.total_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        request_metrics.histograms.observe(
+            view, total_ms, queries=queries.count, db_ms=queries.ms,
+            template_ms=render.total_ms, status=response.status_code,
+        )
+        logger.info('request ' + json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'db_ms': round(queries.ms, 1),
+            'queries': queries.count,
+            'max_repeats': queries.max_repeats,
+            'template_ms': round(render.total_ms, 1),
+        }))
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Record statements slower than SLOW_QUERY_MS with their EXPLAIN plan
+    (core.slow_queries). Disabled when SLOW_QUERY_MS is 0. Place it before
+    RequestMetricsMiddleware so the EXPLAINs aren't counted as the view's.
+    """
+
+    def __init__(self, get_response):
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_MS', 0)
+        if not self.threshold_ms:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = slow_queries.SlowQueryCollector(self.threshold_ms)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        slow_queries.store(collector, view=(match.view_name if match else ''), path=request.path)
+        return response
+
+
+class RequestProfilerMiddleware:
+    """
+    cProfile a single request on demand: a staff user adds ?_profile=1 to
+    the URL or sends an X-Profile: 1 header. The profile is stored in the
+    admin_panel RequestProfile table (newest REQUEST_PROFILE_KEEP rows) and
+    linked from the X-Profile-URL response header.
+
+    Enabled with REQUEST_PROFILING = True; otherwise it removes itself from
+    the middleware chain. Place it after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._requested(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        queries = request_metrics.QueryStats()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        profiler.create_stats()
+        match = getattr(request, 'resolver_match', None)
+        RequestProfile = apps.get_model('admin_panel', 'RequestProfile')
+        profile = RequestProfile.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.path[:500],
+            view=(match.view_name if match else '')[:200],
+            status_code=response.status_code,
+            duration_ms=round(duration_ms, 2),
+            queries=queries.count,
+            db_ms=round(queries.ms, 2),
+            stats=marshal.dumps(profiler.stats),
+        )
+        RequestProfile.trim(getattr(settings, 'REQUEST_PROFILE_KEEP', 50))
+
+        response['X-Profile-URL'] = reverse('admin_panel:request_profile_detail', args=[profile.pk])
+        logger.info(f"Profiled {request.method} {request.path} {duration_ms:.1f}ms as #{profile.pk}")
+        return response
+
+    @staticmethod
+    def _requested(request):
+        if request.GET.get('_profile') != '1' and request.headers.get('X-Profile') != '1':
+            return False
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
+
+
+class ReadOnlyGetMiddleware:
+    """
+    Log or refuse database writes made while handling GET/HEAD requests
+    (READ_ONLY_GET = 'log' or 'raise', see core.query_guards). Removed from
+    the chain when READ_ONLY_GET is 'off'. Place it last, next to the view.
+    """
+
+    def __init__(self, get_response):
+        if getattr(settings, 'READ_ONLY_GET', 'off') == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return query_guards.read_only_get(request, self.get_response)
@@ -0,0 +1,142 @@
+# core/mixins.py
+"""Reusable model mixins"""
+import logging
+import traceback
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _caller():
+    """file:line of the first frame outside Django and the save() chain"""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.name != 'save' and '/django/' not in frame.filename:
+            return f'{frame.filename}:{frame.lineno}'
+    return 'unknown'
+
+
+class DirtyFieldsMixin:
+    """
+    Remember the values a row had when it was loaded (or last saved), so
+    that save() only writes the columns that actually changed.
+
+    A save() without update_fields on a loaded instance becomes
+    save(update_fields=<dirty fields>); a save with nothing changed issues no
+    query at all. This also keeps a full-row save from overwriting balance
+    columns another request changed in the meantime.
+
+    With FULL_ROW_SAVE_WARNINGS on (the default under DEBUG) every save() of
+    an existing row that doesn't name its update_fields is logged with its
+    call site, so write paths can be made explicit.
+
+    Put it before models.Model (or the abstract base) in the class bases.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # field_names are the attnames of the columns actually selected
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_loaded_value(self, name, default=None):
+        """Value of a field as it is in the database, as far as we know"""
+        attname = self._meta.get_field(name).attname
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def get_dirty_fields(self):
+        """Names of the concrete fields changed since the row was loaded"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return [f.name for f in self._meta.concrete_fields if not f.primary_key]
+
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if field.attname in loaded:
+                if getattr(self, field.attname) != loaded[field.attname]:
+                    dirty.append(field.name)
+            elif field.attname in self.__dict__:
+                # A deferred field that was assigned after loading
+                dirty.append(field.name)
+        return dirty
+
+    def is_dirty(self, name=None):
+        dirty = self.get_dirty_fields()
+        return name in dirty if name else bool(dirty)
+
+    def mark_clean(self, fields=None):
+        """Record the current values of `fields` (default: all loaded) as saved"""
+        if fields is None:
+            attnames = [f.attname for f in self._meta.concrete_fields if f.attname in self.__dict__]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        snapshot = getattr(self, '_loaded_values', None)
+        if snapshot is None:
+            snapshot = self._loaded_values = {}
+        for attname in attnames:
+            snapshot[attname] = getattr(self, attname)
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and getattr(self, '_loaded_values', None) is not None
+        ):
+            dirty = self.get_dirty_fields()
+            self._warn_implicit_save(dirty)
+            if dirty:
+                # auto_now columns are only written when listed
+                dirty += [
+                    f.name for f in self._meta.concrete_fields
+                    if getattr(f, 'auto_now', False) and f.name not in dirty
+                ]
+            kwargs['update_fields'] = dirty
+
+        elif (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            self._warn_implicit_save(None)
+
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        self.mark_clean(None if update_fields is None else update_fields)
+
+    def save_changed(self):
+        """
+        save() narrowed to the dirty columns on purpose, for generic editors
+        (the admin) that can't name update_fields. The columns are collected
+        after the model's own save() has set any fields it derives.
+        """
+        self._narrowing_intended = True
+        try:
+            self.save()
+        finally:
+            del self._narrowing_intended
+
+    def _warn_implicit_save(self, dirty):
+        if not getattr(settings, 'FULL_ROW_SAVE_WARNINGS', False):
+            return
+        if getattr(self, '_narrowing_intended', False):
+            return
+        if dirty is None:
+            written = 'every column'
+        else:
+            written = f"{', '.join(dirty) or 'nothing'} (narrowed by dirty tracking)"
+        logger.warning(
+            f"{type(self).__name__}.save() without update_fields at {_caller()}; "
+            f"writing {written}"
+        )
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields') or (args[1] if len(args) > 1 else None)
+        self.mark_clean(fields)
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from .mixins import DirtyFieldsMixin
 
-class User(AbstractUser):
+class User(DirtyFieldsMixin, AbstractUser):
     # Add these fields to override the default ones
     groups = models.ManyToManyField(
         'auth.Group',
@@ -0,0 +1,148 @@
+# core/prerender.py
+"""
+Static snapshots of the anonymous marketing and auth pages.
+
+`python manage.py prerender_pages` renders the views below for an anonymous
+visitor into PRERENDER_ROOT. PrerenderedPageMiddleware then answers cookieless
+GET requests for those URLs from the snapshot, with CDN cache headers, so
+marketing traffic never reaches the view (and, once cached, never reaches
+Python at all).
+
+CSRF tokens can't be baked into shared HTML, so the snapshot ships empty
+token fields plus a tiny script that fetches a fresh token on load.
+
+On Vercel the static build step runs apart from the Python functions and
+its files never reach them, so each function instance renders the snapshots
+itself at cold start (prerender_on_startup(), called from wsgi.py) into
+PRERENDER_ROOT under /tmp. When a Plan or SiteSetting changes, invalidate()
+records the time in the cache and re-renders the local snapshots; the
+middleware of every instance stops serving snapshots built before that time
+and falls back to the live views until it renders again at its next cold
+start. Serverless instances only see each other's invalidations through a
+shared cache (REDIS_URL); the CDN may keep a copy for PRERENDER_CDN_MAX_AGE
+seconds.
+"""
+import json
+import logging
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+logger = logging.getLogger(__name__)
+
+PRERENDERED_PAGES = [
+    'core:landing',
+    'core:login',
+    'core:password_reset',
+    'core:password_reset_done',
+    'core:password_reset_complete',
+]
+
+MANIFEST_NAME = 'manifest.json'
+
+INVALIDATED_KEY = 'prerender_invalidated_at'
+
+CSRF_INPUT_RE = re.compile(r'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+CSRF_SCRIPT = (
+    '<script>fetch("{url}",{{credentials:"same-origin"}}).then(function(r){{return r.json()}})'
+    '.then(function(d){{document.querySelectorAll("input[name=csrfmiddlewaretoken]")'
+    '.forEach(function(i){{i.value=d.token}})}});</script>'
+)
+
+
+def get_prerender_root():
+    return Path(settings.PRERENDER_ROOT)
+
+
+def render_page(url_name):
+    """Render a page exactly as an anonymous visitor would get it"""
+    path = reverse(url_name)
+    host = settings.SITE_URL.split('://')[-1].split('/')[0]
+    request = RequestFactory().get(path, HTTP_HOST=host)
+    request.user = AnonymousUser()
+
+    response = resolve(path).func(request)
+    if response.status_code != 200:
+        raise ValueError(f"{url_name} returned HTTP {response.status_code}")
+
+    html = response.content.decode(response.charset)
+    if 'csrfmiddlewaretoken' in html:
+        html = CSRF_INPUT_RE.sub(r'\1\2', html)
+        script = CSRF_SCRIPT.format(url=reverse('core:csrf_token'))
+        html = html.replace('</body>', f'{script}</body>', 1)
+    return path, html
+
+
+def prerender_all(root=None):
+    """Render every page in PRERENDERED_PAGES and write the manifest; returns {path: file}"""
+    root = Path(root) if root else get_prerender_root()
+    root.mkdir(parents=True, exist_ok=True)
+    built_at = time.time()
+
+    pages = {}
+    for url_name in PRERENDERED_PAGES:
+        path, html = render_page(url_name)
+        filename = url_name.replace(':', '-') + '.html'
+        (root / filename).write_text(html, encoding='utf-8')
+        pages[path] = filename
+
+    manifest = {'built_at': built_at, 'pages': pages}
+    (root / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    return pages
+
+
+def is_current(built_at):
+    """False if the content changed after snapshots built at `built_at`"""
+    invalidated_at = cache.get(INVALIDATED_KEY)
+    return invalidated_at is None or invalidated_at < built_at
+
+
+def prerender_on_startup():
+    """
+    Render the snapshots when the process starts (PRERENDER_ON_STARTUP),
+    unless current ones are already there. Failures are logged and leave
+    the live views answering.
+    """
+    if not (settings.PRERENDER_ENABLED and getattr(settings, 'PRERENDER_ON_STARTUP', False)):
+        return
+
+    root = get_prerender_root()
+    try:
+        manifest = json.loads((root / MANIFEST_NAME).read_text(encoding='utf-8'))
+        if is_current(manifest.get('built_at', 0)):
+            return
+    except (OSError, ValueError):
+        pass
+
+    try:
+        pages = prerender_all(root)
+        logger.info(f"Prerendered {len(pages)} pages into {root}")
+    except Exception:
+        logger.warning("Pages not prerendered at startup; serving the live views", exc_info=True)
+
+
+def invalidate():
+    """
+    Mark the snapshots stale after content shown on them changed, and
+    re-render them where the filesystem is writable.
+    """
+    cache.set(INVALIDATED_KEY, time.time(), None)
+
+    root = get_prerender_root()
+    if not (root / MANIFEST_NAME).exists():
+        return
+
+    try:
+        prerender_all(root)
+        logger.info("Prerendered pages refreshed")
+    except Exception:
+        # INVALIDATED_KEY already keeps the stale snapshots from being served
+        logger.warning("Prerendered pages not refreshed; serving the live views until the next build",
+                       exc_info=True)
@@ -0,0 +1,117 @@
+# core/query_guards.py
+"""
+Guards on what a view may do with the database.
+
+Read-only GETs: with READ_ONLY_GET = 'log' or 'raise', ReadOnlyGetMiddleware
+reports every INSERT/UPDATE/DELETE executed while a GET/HEAD request is
+handled, except on READ_ONLY_GET_EXEMPT_TABLES. Views that write on read by
+design say so with @allow_writes_on_get, which also documents the debt.
+
+Query budgets: @query_budget(n) declares the most queries a view may run.
+The count is checked on a QUERY_BUDGET_SAMPLE_RATE fraction of requests;
+an overrun is logged, or raises QueryBudgetExceeded when QUERY_BUDGET_MODE
+is 'raise' (use that in tests with a sample rate of 1).
+"""
+import logging
+import random
+import re
+import traceback
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+from core.request_metrics import QueryStats
+
+logger = logging.getLogger(__name__)
+
+_WRITE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b(?:\s+(?:OR\s+\w+\s+)?(?:INTO|FROM)?\s*)?"?(\w+)', re.IGNORECASE)
+
+
+class WriteOnGetError(RuntimeError):
+    """A GET request tried to write to the database"""
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A view ran more queries than its declared budget"""
+
+
+def allow_writes_on_get(view):
+    """Exempt a view that writes during GET from READ_ONLY_GET"""
+    view.allows_writes_on_get = True
+    return view
+
+
+def write_target(sql):
+    """(statement, table) if sql writes, else None"""
+    match = _WRITE.match(sql)
+    return (match.group(1).upper(), match.group(2)) if match else None
+
+
+class WriteOnGetGuard:
+    """execute_wrapper applying READ_ONLY_GET to one request"""
+
+    def __init__(self, request, mode, exempt_tables):
+        self.request = request
+        self.mode = mode
+        self.exempt_tables = exempt_tables
+
+    def __call__(self, execute, sql, params, many, context):
+        target = write_target(sql)
+        if target and target[1] not in self.exempt_tables and not self._view_allows_writes():
+            match = getattr(self.request, 'resolver_match', None)
+            message = (
+                f"{target[0]} on {target[1]} during {self.request.method} {self.request.path}"
+                f" ({match.view_name if match else 'no view'})"
+            )
+            if self.mode == 'raise':
+                raise WriteOnGetError(message)
+            stack = ''.join(traceback.format_stack(limit=8)[:-1])
+            logger.warning(f"Write on GET: {message}\n{stack}")
+        return execute(sql, params, many, context)
+
+    def _view_allows_writes(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return bool(match and getattr(match.func, 'allows_writes_on_get', False))
+
+
+def read_only_get(request, get_response):
+    """Run get_response under the READ_ONLY_GET guard"""
+    mode = getattr(settings, 'READ_ONLY_GET', 'off')
+    guard = WriteOnGetGuard(request, mode, set(getattr(settings, 'READ_ONLY_GET_EXEMPT_TABLES', ())))
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(guard))
+        return get_response(request)
+
+
+def query_budget(max_queries):
+    """Declare the most queries a view may run (see module docstring)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            mode = getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+            rate = getattr(settings, 'QUERY_BUDGET_SAMPLE_RATE', 0.0)
+            if mode == 'off' or not rate or random.random() >= rate:
+                return view(request, *args, **kwargs)
+
+            queries = QueryStats()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = view(request, *args, **kwargs)
+
+            if queries.count > max_queries:
+                message = (
+                    f"{view.__module__}.{view.__name__} ran {queries.count} queries "
+                    f"(budget {max_queries}, most repeated statement x{queries.max_repeats})"
+                )
+                if mode == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(f"Query budget exceeded: {message}")
+            return response
+
+        wrapped.query_budget = max_queries
+        return wrapped
+    return decorator
@@ -0,0 +1,92 @@
+# core/request_metrics.py
+"""
+Per-request SQL and timing instrumentation.
+
+QueryStats is installed with connection.execute_wrapper() for the duration
+of a request and counts statements and the time spent in the database.
+ViewHistograms aggregates finished requests per view in process memory:
+request counts, cumulative duration buckets, and query totals. A view
+whose query count grows with the data (an N+1) shows up here, and in
+`max_repeats`, long before it shows up in latency.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+# Upper bounds (ms) of the duration buckets; the last bucket is +Inf
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class QueryStats:
+    """execute_wrapper callable counting queries and DB time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def ms(self):
+        return self.seconds * 1000
+
+    @property
+    def max_repeats(self):
+        """Executions of the most repeated statement (N+1 loops repeat one SQL)"""
+        return max(self.statements.values(), default=0)
+
+
+class ViewHistograms:
+    """Thread-safe per-view aggregates of finished requests"""
+
+    def __init__(self, buckets=DURATION_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, duration_ms, queries=0, db_ms=0.0, template_ms=0.0, status=200):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = {
+                    'count': 0,
+                    'errors': 0,
+                    'duration_ms_sum': 0.0,
+                    'duration_buckets': [0] * (len(self.buckets) + 1),
+                    'queries_sum': 0,
+                    'queries_max': 0,
+                    'db_ms_sum': 0.0,
+                    'template_ms_sum': 0.0,
+                }
+            entry['count'] += 1
+            entry['errors'] += status >= 500
+            entry['duration_ms_sum'] += duration_ms
+            entry['duration_buckets'][bisect_left(self.buckets, duration_ms)] += 1
+            entry['queries_sum'] += queries
+            entry['queries_max'] = max(entry['queries_max'], queries)
+            entry['db_ms_sum'] += db_ms
+            entry['template_ms_sum'] += template_ms
+
+    def snapshot(self):
+        """Copy of the aggregates; duration_buckets are per bucket, not cumulative"""
+        with self.lock:
+            return {
+                view: {**entry, 'duration_buckets': list(entry['duration_buckets'])}
+                for view, entry in self.views.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+histograms = ViewHistograms()
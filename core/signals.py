@@ -0,0 +1,16 @@
+# core/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core import prerender
+from core.models import Plan
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+@receiver(post_save, sender='admin_panel.SiteSetting')
+@receiver(post_delete, sender='admin_panel.SiteSetting')
+def refresh_cached_content(sender, **kwargs):
+    """Plans and site settings feed the prerendered public pages"""
+    transaction.on_commit(prerender.invalidate)
@@ -0,0 +1,157 @@
+# core/slow_queries.py
+"""
+Capture SQL statements slower than SLOW_QUERY_MS, with their EXPLAIN plan.
+
+SlowQueryCollector is an execute_wrapper that only remembers slow
+statements (SQL, parameter types, calling view and project stack) while the
+request runs. store() runs after the response is built, outside the
+view's transactions: it EXPLAINs each statement and writes it to the
+admin_panel SlowQuery table, which is trimmed to the newest SLOW_QUERY_KEEP
+rows. Plans that read a whole table are flagged as full_scan.
+
+The same statement is EXPLAINed at most once per SLOW_QUERY_EXPLAIN_INTERVAL
+seconds per process, so a query that is slow on every request doesn't add
+an EXPLAIN to every request.
+"""
+import logging
+import re
+import threading
+import time
+import traceback
+from collections.abc import Mapping
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+STACK_DEPTH = 10
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN \S+$', re.MULTILINE)
+_explained = {}
+_explained_lock = threading.Lock()
+
+
+def params_shape(params, many=False):
+    """Types of the parameters, never their values"""
+    if many:
+        params = list(params or [])
+        first = params_shape(params[0]) if params else '()'
+        return f'{len(params)} x {first}'
+    if isinstance(params, Mapping):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(p).__name__ for p in params or ()) + ')'
+
+
+def project_stack():
+    """The innermost project frames (no Django or site-packages), as text"""
+    base = str(settings.BASE_DIR)
+    frames = [
+        f for f in traceback.extract_stack()[:-2]
+        if f.filename.startswith(base) and 'site-packages' not in f.filename
+        and not f.filename.endswith('slow_queries.py')
+    ]
+    return '\n'.join(
+        f'{f.filename[len(base) + 1:]}:{f.lineno} in {f.name}' for f in frames[-STACK_DEPTH:]
+    )
+
+
+class SlowQueryCollector:
+    """execute_wrapper that remembers statements slower than threshold_ms"""
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms >= self.threshold_ms:
+                self.captured.append({
+                    'sql': sql,
+                    'params': None if many else params,
+                    'params_shape': params_shape(params, many)[:255],
+                    'duration_ms': elapsed_ms,
+                    'alias': context['connection'].alias,
+                    'stack': project_stack(),
+                })
+
+
+def _should_explain(sql):
+    interval = getattr(settings, 'SLOW_QUERY_EXPLAIN_INTERVAL', 60)
+    now = time.monotonic()
+    with _explained_lock:
+        if now - _explained.get(sql, -interval) < interval:
+            return False
+        if len(_explained) > 1000:
+            _explained.clear()
+        _explained[sql] = now
+        return True
+
+
+def explain(sql, params, using='default', analyze=False):
+    """
+    (plan text, full_scan) for a statement, or ('', False) where the
+    backend has no EXPLAIN we understand. ANALYZE only applies to SELECTs,
+    since it executes the statement.
+    """
+    connection = connections[using]
+    analyze = analyze and sql.lstrip().upper().startswith('SELECT')
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        return '', False
+
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        return f'EXPLAIN failed: {e}', False
+
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        plan = '\n'.join(row[-1] for row in rows)
+        return plan, bool(_SQLITE_FULL_SCAN.search(plan))
+    plan = '\n'.join(row[0] for row in rows)
+    return plan, 'Seq Scan' in plan
+
+
+def store(collector, view='', path=''):
+    """EXPLAIN and save what the collector captured; never raises"""
+    if not collector.captured:
+        return
+    SlowQuery = apps.get_model('admin_panel', 'SlowQuery')
+    using = getattr(settings, 'SLOW_QUERY_EXPLAIN_DATABASE', 'default')
+    analyze = getattr(settings, 'SLOW_QUERY_EXPLAIN_ANALYZE', False)
+    try:
+        rows = []
+        for query in collector.captured:
+            plan, full_scan = '', False
+            if query['params'] is not None and _should_explain(query['sql']):
+                alias = using if using in connections.databases else query['alias']
+                plan, full_scan = explain(query['sql'], query['params'], alias, analyze)
+            rows.append(SlowQuery(
+                duration_ms=round(query['duration_ms'], 2),
+                sql=query['sql'],
+                params_shape=query['params_shape'],
+                view=view[:200],
+                path=path[:500],
+                stack=query['stack'],
+                plan=plan,
+                full_scan=full_scan,
+                database=connections[query['alias']].vendor,
+            ))
+            logger.warning(
+                f"Slow query {query['duration_ms']:.1f}ms in {view or path}"
+                f"{' (full scan)' if full_scan else ''}: {query['sql'][:200]}"
+            )
+        SlowQuery.objects.bulk_create(rows)
+        SlowQuery.trim(getattr(settings, 'SLOW_QUERY_KEEP', 500))
+    except DatabaseError as e:
+        logger.error(f'Could not store slow queries: {e}')
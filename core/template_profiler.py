@@ -0,0 +1,110 @@
+# core/template_profiler.py
+"""
+Per-template and per-block render timings.
+
+install() wraps Template._render and BlockNode.render once; the wrappers only
+record while a profile_render() collector is active, so nothing is measured
+(and almost nothing is spent) outside profiled requests. Timings are
+inclusive: a base template's time contains the blocks rendered inside it.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.template.base import Template
+from django.template.loader_tags import BlockNode
+
+_collector = contextvars.ContextVar('template_render_stats', default=None)
+_installed = False
+
+
+class RenderStats:
+    """Render timings collected for one request"""
+
+    def __init__(self):
+        self.templates = {}
+        self.blocks = {}
+        self.depth = 0
+        self.root_time = 0.0
+
+    @staticmethod
+    def _add(bucket, key, elapsed):
+        calls, total = bucket.get(key, (0, 0.0))
+        bucket[key] = (calls + 1, total + elapsed)
+
+    @property
+    def total_ms(self):
+        """Wall time of outermost renders only (nested ones are included)"""
+        return self.root_time * 1000
+
+    def report(self, limit=10):
+        """Rows of (kind, name, calls, total ms), slowest first"""
+        rows = [('template', k, c, t * 1000) for k, (c, t) in self.templates.items()]
+        rows += [('block', k, c, t * 1000) for k, (c, t) in self.blocks.items()]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows[:limit]
+
+
+def _timed_template_render(original):
+    def _render(self, context):
+        stats = _collector.get()
+        if stats is None:
+            return original(self, context)
+
+        stats.depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.depth -= 1
+            if stats.depth == 0:
+                stats.root_time += elapsed
+            stats._add(stats.templates, self.name or '<string>', elapsed)
+    return _render
+
+
+def _timed_block_render(original):
+    def render(self, context):
+        stats = _collector.get()
+        if stats is None:
+            return original(self, context)
+
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            origin = getattr(self, 'origin', None)
+            template_name = getattr(origin, 'template_name', None) or '<string>'
+            stats._add(stats.blocks, f'{template_name}:{self.name}', time.perf_counter() - start)
+    return render
+
+
+def install():
+    """Patch the template engine for profiling (idempotent)"""
+    global _installed
+    if _installed:
+        return
+    Template._render = _timed_template_render(Template._render)
+    BlockNode.render = _timed_block_render(BlockNode.render)
+    _installed = True
+
+
+@contextmanager
+def profile_render():
+    """
+    Collect render timings for everything rendered inside the block. Nested
+    blocks share the outer collector, so stacked profiling middlewares see
+    the same renders.
+    """
+    install()
+    stats = _collector.get()
+    if stats is not None:
+        yield stats
+        return
+    stats = RenderStats()
+    token = _collector.set(stats)
+    try:
+        yield stats
+    finally:
+        _collector.reset(token)
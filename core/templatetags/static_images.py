@@ -0,0 +1,56 @@
+# core/templatetags/static_images.py
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from minersurb.storage import IMAGE_MIME_TYPES, image_variant_name
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def _variant_srcsets(path):
+    """srcset strings per format for the variants collectstatic produced"""
+    # Variants only exist in the collected (manifest) storage; in development
+    # the manifest is empty and the tag falls back to the original image
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    srcsets = []
+    for image_format in getattr(settings, 'STATIC_IMAGE_FORMATS', []):
+        candidates = [
+            f"{static(image_variant_name(path, width, image_format))} {width}w"
+            for width in getattr(settings, 'STATIC_IMAGE_WIDTHS', [])
+            if image_variant_name(path, width, image_format) in hashed_files
+        ]
+        if candidates:
+            srcsets.append((IMAGE_MIME_TYPES[image_format], ', '.join(candidates)))
+    return tuple(srcsets)
+
+
+@register.simple_tag
+def picture(path, alt='', sizes='100vw', **attrs):
+    """
+    Render a <picture> with AVIF/WebP srcsets for a static image.
+
+    Usage: {% picture 'img/logo.png' alt='Logo' sizes='48px' class='glow' %}
+    """
+    attrs.setdefault('decoding', 'async')
+    img = format_html(
+        '<img src="{}" alt="{}"{}>',
+        static(path),
+        alt,
+        format_html_join('', ' {}="{}"', attrs.items()),
+    )
+
+    srcsets = _variant_srcsets(path)
+    if not srcsets:
+        return img
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime_type, srcset, sizes) for mime_type, srcset in srcsets),
+    )
+    return format_html('<picture>{}{}</picture>', sources, img)
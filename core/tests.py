@@ -1,3 +1,515 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import clock
+from core.cache import single_flight
+from core.models import Plan, User
+from admin_panel.models import RequestProfile, SlowQuery
+from core.prerender import INVALIDATED_KEY, MANIFEST_NAME, invalidate, prerender_all, prerender_on_startup
+from core.query_guards import (
+    QueryBudgetExceeded, WriteOnGetError, WriteOnGetGuard, allow_writes_on_get, query_budget,
+    write_target,
+)
+from core.request_metrics import QueryStats, ViewHistograms, histograms
+from core.slow_queries import explain, params_shape
+from core.template_profiler import profile_render
+from minersurb.storage import image_variant_name, purge_css
+
+PLAIN_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+class PurgeCssTests(TestCase):
+    """Test unused-selector purging used by collectstatic"""
+
+    def test_unused_rules_are_dropped(self):
+        css = '.used{color:red}.unused{color:blue}#hero .used{margin:0}'
+        purged = purge_css(css, {'used', 'hero'})
+
+        self.assertIn('.used{color:red}', purged)
+        self.assertIn('#hero .used{margin:0}', purged)
+        self.assertNotIn('.unused', purged)
+
+    def test_selector_lists_are_filtered(self):
+        purged = purge_css('.a,.b,p{margin:0}', {'a'})
+        self.assertEqual(purged, '.a,p{margin:0}')
+
+    def test_media_queries_are_purged_recursively(self):
+        css = '@media (min-width:768px){.a{top:0}.b{top:1px}}@media print{.b{top:0}}'
+        purged = purge_css(css, {'a'})
+
+        self.assertEqual(purged, '@media (min-width:768px){.a{top:0}}')
+
+    def test_at_rules_and_dynamic_prefixes_are_kept(self):
+        css = (
+            '/*! license */@font-face{font-family:x;src:url(x.woff2)}'
+            '@keyframes spin{from{transform:rotate(0)}}'
+            '.card--buy{color:green}.btn:not(.gone){display:block}'
+        )
+        purged = purge_css(css, {'card--', 'btn'})
+
+        self.assertIn('/*! license */', purged)
+        self.assertIn('@font-face', purged)
+        self.assertIn('@keyframes spin', purged)
+        self.assertIn('.card--buy', purged)
+        self.assertIn('.btn:not(.gone)', purged)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class PictureTagTests(TestCase):
+    """Test the {% picture %} tag used for optimized images"""
+
+    def test_variant_names(self):
+        self.assertEqual(image_variant_name('img/logo.png', 320, 'webp'), 'img/logo.w320.webp')
+
+    def test_falls_back_to_plain_img_without_variants(self):
+        html = Template(
+            "{% load static_images %}{% picture 'img/logo.png' alt='Logo' class='glow' %}"
+        ).render(Context())
+
+        self.assertNotIn('<picture>', html)
+        self.assertIn('src="/static/img/logo.png"', html)
+        self.assertIn('alt="Logo"', html)
+        self.assertIn('class="glow"', html)
+
+
+class PrerenderTests(TestCase):
+    """Test prerendered anonymous pages"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.settings_override = override_settings(
+            STORAGES=PLAIN_STORAGES, PRERENDER_ROOT=self.tmp.name, PRERENDER_ENABLED=True
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.delete(INVALIDATED_KEY)
+
+    def test_snapshots_have_no_baked_csrf_token(self):
+        manifest = prerender_all()
+
+        self.assertIn('/', manifest)
+        self.assertIn('/auth/login/', manifest)
+
+        with open(f"{self.tmp.name}/{manifest['/auth/login/']}", encoding='utf-8') as f:
+            html = f.read()
+        self.assertIn('name="csrfmiddlewaretoken" value=""', html)
+        self.assertIn('/auth/csrf/', html)
+
+    def test_anonymous_get_is_served_from_snapshot(self):
+        prerender_all()
+        with open(f'{self.tmp.name}/core-login.html', 'w', encoding='utf-8') as f:
+            f.write('<html>snapshot</html>')
+
+        response = self.client.get('/auth/login/')
+        self.assertEqual(response.content, b'<html>snapshot</html>')
+        self.assertIn('s-maxage', response['Cache-Control'])
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+
+        # Sessions must reach the real view
+        self.client.cookies['sessionid'] = 'abc'
+        response = self.client.get('/auth/login/')
+        self.assertNotEqual(response.content, b'<html>snapshot</html>')
+
+    def test_read_only_snapshots_stop_serving_once_invalidated(self):
+        prerender_all()
+        with open(f'{self.tmp.name}/core-login.html', 'w', encoding='utf-8') as f:
+            f.write('<html>snapshot</html>')
+        self.assertEqual(self.client.get('/auth/login/').content, b'<html>snapshot</html>')
+
+        with mock.patch('core.prerender.prerender_all', side_effect=OSError('Read-only file system')):
+            invalidate()
+
+        response = self.client.get('/auth/login/')
+        self.assertNotEqual(response.content, b'<html>snapshot</html>')
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+
+        # The next build serves snapshots again
+        prerender_all()
+        self.assertIn('s-maxage', self.client.get('/auth/login/')['Cache-Control'])
+
+    def test_failed_refresh_is_logged_and_still_invalidates(self):
+        prerender_all()
+        with open(f'{self.tmp.name}/core-login.html', 'w', encoding='utf-8') as f:
+            f.write('<html>snapshot</html>')
+
+        with mock.patch('core.prerender.prerender_all', side_effect=ValueError('core:login returned HTTP 500')):
+            with self.assertLogs('core.prerender', 'WARNING'):
+                invalidate()
+
+        self.assertNotEqual(self.client.get('/auth/login/').content, b'<html>snapshot</html>')
+
+    def test_startup_renders_missing_or_stale_snapshots(self):
+        manifest = f'{self.tmp.name}/{MANIFEST_NAME}'
+
+        with self.settings(PRERENDER_ON_STARTUP=False):
+            prerender_on_startup()
+        self.assertFalse(os.path.exists(manifest))
+
+        with self.settings(PRERENDER_ON_STARTUP=True):
+            prerender_on_startup()
+            self.assertIn('s-maxage', self.client.get('/auth/login/')['Cache-Control'])
+
+            # Current snapshots are reused, stale ones rendered again
+            with mock.patch('core.prerender.prerender_all') as render:
+                prerender_on_startup()
+                render.assert_not_called()
+                cache.set(INVALIDATED_KEY, time.time() + 1, None)
+                prerender_on_startup()
+                render.assert_called_once()
+
+    def test_startup_render_failure_leaves_live_views(self):
+        with self.settings(PRERENDER_ON_STARTUP=True), \
+                mock.patch('core.prerender.render_page', side_effect=ValueError('core:landing returned HTTP 500')), \
+                self.assertLogs('core.prerender', 'WARNING'):
+            prerender_on_startup()
+
+        response = self.client.get('/auth/login/')
+        self.assertNotIn('s-maxage', response.get('Cache-Control', ''))
+
+    def test_csrf_token_endpoint(self):
+        response = self.client.get('/auth/csrf/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['token'])
+
+
+class TemplateProfilerTests(TestCase):
+    """Test template render profiling"""
+
+    def test_profile_render_records_templates_and_blocks(self):
+        template = Template('{% block sidebar %}nav{% endblock %}{% block content %}x{% endblock %}')
+
+        with profile_render() as stats:
+            template.render(Context())
+
+        self.assertEqual(stats.templates['<string>'][0], 1)
+        self.assertIn('<string>:sidebar', stats.blocks)
+        self.assertIn('<string>:content', stats.blocks)
+        self.assertGreater(stats.total_ms, 0)
+
+        # Nothing is recorded outside a profiled block
+        template.render(Context())
+        self.assertEqual(stats.templates['<string>'][0], 1)
+
+
+class DirtyFieldsTests(TestCase):
+    """Test that saves only write the columns that changed"""
+
+    def setUp(self):
+        User.objects.create_user(username='alice', email='alice@example.com', password='x')
+        self.user = User.objects.get(username='alice')
+
+    def test_save_writes_only_dirty_columns(self):
+        self.user.full_name = 'Alice'
+        self.assertEqual(self.user.get_dirty_fields(), ['full_name'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('full_name', queries[0]['sql'])
+        self.assertNotIn('account_balance', queries[0]['sql'])
+        self.assertFalse(self.user.is_dirty())
+
+    def test_clean_save_issues_no_query(self):
+        with self.assertNumQueries(0):
+            self.user.save()
+
+    def test_stale_instance_does_not_overwrite_other_columns(self):
+        User.objects.filter(pk=self.user.pk).update(account_balance=50)
+
+        self.user.full_name = 'Alice'
+        self.user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.account_balance, 50)
+        self.assertEqual(self.user.get_loaded_value('account_balance'), 50)
+
+    @override_settings(FULL_ROW_SAVE_WARNINGS=True)
+    def test_guard_logs_saves_without_update_fields(self):
+        self.user.full_name = 'Alice'
+        with self.assertLogs('core.mixins', 'WARNING') as logs:
+            self.user.save()
+        self.assertIn('User.save() without update_fields', logs.output[0])
+        self.assertIn('core/tests.py', logs.output[0])
+
+        self.user.full_name = 'Alice B'
+        with self.assertNoLogs('core.mixins', 'WARNING'):
+            self.user.save(update_fields=['full_name'])
+
+        self.user.full_name = 'Alice C'
+        with self.assertNoLogs('core.mixins', 'WARNING'):
+            self.user.save_changed()
+        self.assertEqual(User.objects.get(pk=self.user.pk).full_name, 'Alice C')
+
+
+class SingleFlightTests(TestCase):
+    """Test request coalescing on a shared cache key"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_result_is_reused_within_ttl(self):
+        self.assertEqual(single_flight('k', self.compute), 1)
+        self.assertEqual(single_flight('k', self.compute), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_follower_waits_for_leader(self):
+        from django.core.cache import cache
+        cache.add('single_flight:k:lock', 1, 30)
+
+        # Leader still running: the follower gives up with the default
+        self.assertEqual(single_flight('k', self.compute, wait=0.1, default='late'), 'late')
+        self.assertEqual(self.calls, 0)
+
+        # Leader finished: the follower reuses its result
+        cache.set('single_flight:k:result', 42, 2)
+        self.assertEqual(single_flight('k', self.compute, wait=0.1), 42)
+        self.assertEqual(self.calls, 0)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES, REQUEST_METRICS=True)
+class RequestMetricsTests(TestCase):
+    """Test per-request query counting, Server-Timing and view histograms"""
+
+    def setUp(self):
+        histograms.reset()
+        self.addCleanup(histograms.reset)
+
+    def test_request_gets_server_timing_log_line_and_histogram(self):
+        with self.assertLogs('core.middleware', level='INFO') as logs:
+            response = self.client.get('/auth/login/')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+        line = next(out for out in logs.output if 'request {' in out)
+        record = json.loads(line.split('request ', 1)[1])
+        self.assertEqual(record['view'], 'core:login')
+        self.assertGreater(record['template_ms'], 0)
+
+        entry = histograms.snapshot()['core:login']
+        self.assertEqual(entry['count'], 1)
+        self.assertEqual(sum(entry['duration_buckets']), 1)
+
+    def test_query_stats_expose_repeated_statements(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            for pk in (1, 2, 3):
+                list(User.objects.filter(pk=pk))
+            Plan.objects.count()
+
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.max_repeats, 3)
+        self.assertGreaterEqual(stats.ms, 0)
+
+    def test_histogram_buckets_by_upper_bound(self):
+        views = ViewHistograms(buckets=(10, 100))
+        for ms in (5, 10, 50, 1000):
+            views.observe('v', ms, queries=2, status=200)
+        views.observe('v', 1, status=500)
+
+        entry = views.snapshot()['v']
+        self.assertEqual(entry['duration_buckets'], [3, 1, 1])
+        self.assertEqual(entry['errors'], 1)
+        self.assertEqual(entry['queries_max'], 2)
+
+
+@override_settings(
+    STORAGES=PLAIN_STORAGES, SLOW_QUERY_MS=0.000001, SLOW_QUERY_KEEP=50,
+    SLOW_QUERY_EXPLAIN_INTERVAL=0,
+)
+class SlowQueryTests(TestCase):
+    """Test slow statement capture, EXPLAIN plans and the ring table"""
+
+    def test_request_queries_are_stored_with_plan_and_view(self):
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+
+        response = self.client.get('/admin-panel/performance/slow-queries/')
+        self.assertEqual(response.status_code, 200)
+
+        captured = SlowQuery.objects.filter(view='admin_panel:slow_queries')
+        self.assertTrue(captured.exists())
+        query = captured.first()
+        self.assertEqual(query.database, connection.vendor)
+        self.assertTrue(query.plan)
+        self.assertEqual(query.path, '/admin-panel/performance/slow-queries/')
+
+        # The page lists what was captured on earlier requests
+        response = self.client.get('/admin-panel/performance/slow-queries/')
+        self.assertContains(response, 'admin_panel:slow_queries')
+
+    def test_explain_flags_full_scans(self):
+        plan, full_scan = explain('SELECT * FROM dashboard_deposit WHERE amount > %s', [1])
+        self.assertTrue(plan)
+        self.assertTrue(full_scan)
+
+        plan, full_scan = explain('SELECT * FROM dashboard_deposit WHERE id = %s', [1])
+        self.assertFalse(full_scan)
+
+    def test_params_shape_hides_values(self):
+        self.assertEqual(params_shape(['secret', 5]), '(str, int)')
+        self.assertEqual(params_shape([(1,), (2,)], many=True), '2 x (int)')
+
+    def test_trim_keeps_newest_rows(self):
+        for ms in range(5):
+            SlowQuery.objects.create(duration_ms=ms, sql='SELECT 1', database='sqlite')
+
+        SlowQuery.trim(3)
+
+        self.assertEqual(sorted(SlowQuery.objects.values_list('duration_ms', flat=True)), [2, 3, 4])
+
+
+@override_settings(STORAGES=PLAIN_STORAGES, REQUEST_PROFILING=True, REQUEST_PROFILE_KEEP=2)
+class RequestProfilerTests(TestCase):
+    """Test on-demand request profiling for staff"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            'staff', 'staff@example.com', 'pass12345', is_staff=True
+        )
+
+    def test_staff_request_with_flag_is_profiled(self):
+        self.client.force_login(self.staff)
+
+        response = self.client.get('/dashboard/history/?_profile=1')
+
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-URL'], f'/admin-panel/performance/profiles/{profile.pk}/')
+        self.assertEqual(profile.view, 'dashboard:history')
+        self.assertEqual(profile.user, self.staff)
+        self.assertGreater(profile.queries, 0)
+
+        detail = self.client.get(response['X-Profile-URL'] + '?sort=tottime')
+        self.assertContains(detail, 'function calls')
+
+    def test_header_works_and_old_profiles_are_trimmed(self):
+        self.client.force_login(self.staff)
+        for _ in range(3):
+            self.client.get('/dashboard/', HTTP_X_PROFILE='1')
+
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_customers_cannot_profile(self):
+        customer = User.objects.create_user('bob', 'bob@example.com', 'pass12345')
+        self.client.force_login(customer)
+
+        response = self.client.get('/dashboard/history/?_profile=1')
+
+        self.assertNotIn('X-Profile-URL', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class QueryGuardTests(TestCase):
+    """Test read-only GET enforcement and per-view query budgets"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'pass12345')
+
+    def fake_request(self, func=None):
+        from types import SimpleNamespace
+        match = SimpleNamespace(func=func or (lambda request: None), view_name='test:view')
+        return SimpleNamespace(method='GET', path='/test/', resolver_match=match)
+
+    def test_write_target_parses_statements(self):
+        self.assertEqual(write_target('UPDATE "core_user" SET x = 1'), ('UPDATE', 'core_user'))
+        self.assertEqual(write_target('INSERT OR IGNORE INTO "t" VALUES (1)'), ('INSERT', 't'))
+        self.assertEqual(write_target('DELETE FROM "t" WHERE id = 1'), ('DELETE', 't'))
+        self.assertIsNone(write_target('SELECT "core_user"."id" FROM "core_user"'))
+
+    def test_guard_raises_logs_and_honours_exemptions(self):
+        guard = WriteOnGetGuard(self.fake_request(), 'raise', {'django_session'})
+        with connection.execute_wrapper(guard):
+            User.objects.count()
+            with self.assertRaises(WriteOnGetError), transaction.atomic():
+                User.objects.filter(pk=self.user.pk).update(full_name='x')
+
+        guard = WriteOnGetGuard(self.fake_request(), 'log', set())
+        with self.assertLogs('core.query_guards', level='WARNING'):
+            with connection.execute_wrapper(guard):
+                User.objects.filter(pk=self.user.pk).update(full_name='y')
+
+        view = allow_writes_on_get(lambda request: None)
+        guard = WriteOnGetGuard(self.fake_request(view), 'raise', set())
+        with connection.execute_wrapper(guard):
+            User.objects.filter(pk=self.user.pk).update(full_name='z')
+
+    @override_settings(STORAGES=PLAIN_STORAGES, READ_ONLY_GET='raise')
+    def test_middleware_allows_reads_and_declared_writers(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/dashboard/history/').status_code, 200)
+        # overview settles profit on read and is declared with @allow_writes_on_get
+        self.assertEqual(self.client.get('/dashboard/').status_code, 200)
+
+    def test_query_budget_modes(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+            User.objects.count()
+            return 'ok'
+
+        self.assertEqual(view.query_budget, 1)
+        with override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGET_SAMPLE_RATE=1):
+            with self.assertRaises(QueryBudgetExceeded):
+                view(None)
+        with override_settings(QUERY_BUDGET_MODE='log', QUERY_BUDGET_SAMPLE_RATE=1):
+            with self.assertLogs('core.query_guards', level='WARNING'):
+                self.assertEqual(view(None), 'ok')
+        with override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGET_SAMPLE_RATE=0):
+            self.assertEqual(view(None), 'ok')
+
+
+class ClockTests(TestCase):
+    """Test the injectable clock used by the profit logic"""
+
+    def test_frozen_clock_drives_accrual(self):
+        from dashboard.models import Investment
+        plan = Plan.objects.create(
+            name='BASIC', min_amount=Decimal('100.00'), daily_percentage=Decimal('3.00'), duration_days=30,
+        )
+        user = User.objects.create_user('alice', 'alice@example.com', 'pass12345', active_balance=Decimal('100.00'))
+        start = timezone.now() - timedelta(days=400)
+
+        with clock.frozen(start) as frozen:
+            investment = Investment.objects.create(user=user, plan=plan, amount=Decimal('100.00'))
+            self.assertEqual(investment.start_date, start)
+            self.assertEqual(investment.end_date, start + timedelta(days=30))
+            frozen.advance(days=10)
+            self.assertEqual(investment.days_remaining, 20)
+            self.assertEqual(investment.calculate_profit_up_to_now(), Decimal('30.00'))
+            self.assertEqual(clock.today(), timezone.localdate(start + timedelta(days=10)))
+
+        self.assertEqual(investment.days_remaining, 0)
+        self.assertGreater(clock.now(), start + timedelta(days=300))
+
+    def test_overrides_nest_and_reset(self):
+        outer = timezone.now() - timedelta(days=5)
+        with clock.frozen(outer):
+            with clock.use(clock.FrozenClock(outer - timedelta(days=1))):
+                self.assertEqual(clock.now(), outer - timedelta(days=1))
+            self.assertEqual(clock.now(), outer)
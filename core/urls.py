@@ -26,6 +26,7 @@ urlpatterns = [
     # AJAX Validation Endpoints
     path('auth/check-username/', views.check_username, name='check_username'),
     path('auth/check-email/', views.check_email, name='check_email'),
+    path('auth/csrf/', views.csrf_token, name='csrf_token'),
     
     # User Profile (Protected)
     path('profile/', views.profile_view, name='profile'),
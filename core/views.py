@@ -11,7 +11,9 @@ from django.template.loader import render_to_string
 from django.core.mail import send_mail
 from django.conf import settings
 from django.urls import reverse_lazy
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
 from django.utils import timezone  # ✅ ADDED THIS IMPORT
 from .models import User
 from .forms import CustomUserCreationForm
@@ -96,7 +98,7 @@ def signup(request):
                 try:
                     referrer = User.objects.get(referral_code=referral_code)
                     user.referred_by = referrer
-                    user.save()
+                    user.save(update_fields=['referred_by'])
                     messages.success(request, f'You were referred by {referrer.username}')
                 except User.DoesNotExist:
                     pass
@@ -270,7 +272,7 @@ def password_reset_confirm_view(request, uidb64, token):
             
             # Set new password
             user.set_password(password)
-            user.save()
+            user.save(update_fields=['password'])
             
             # Auto login
             login(request, user)
@@ -303,6 +305,11 @@ def check_email(request):
         return HttpResponse('taken' if exists else 'available')
     return HttpResponse('error')
 
+@never_cache
+def csrf_token(request):
+    """Fresh CSRF token for prerendered pages (see core.prerender)"""
+    return JsonResponse({'token': get_token(request)})
+
 @login_required
 def profile_view(request):
     """User profile view"""
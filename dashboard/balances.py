@@ -0,0 +1,86 @@
+# dashboard/balances.py
+"""
+Balance service: every change to a user's balances goes through here.
+
+Balances are never read into Python, modified and saved back. Credits are
+atomic F() increments and debits are conditional UPDATEs
+(WHERE balance >= amount), so two concurrent requests can't both spend the
+same money, whichever gunicorn worker they land on.
+
+Lock ordering: callers that also change a deposit, withdrawal or investment
+row lock that row first (select_for_update or a conditional UPDATE on its
+status) and the user row second. When several users are locked at once
+they are locked in ascending pk order (lock_users). Keeping one order
+everywhere rules out deadlocks between parallel approvals.
+"""
+from django.db.models import F
+
+from core.models import User
+
+BALANCE_FIELDS = ('account_balance', 'active_balance', 'total_earnings')
+
+
+class InsufficientBalance(ValueError):
+    """A debit would have taken a balance below zero"""
+
+    def __init__(self, field, available, required):
+        self.field = field
+        self.available = available
+        self.required = required
+        label = field.replace('_balance', '')
+        super().__init__(
+            f"Insufficient {label} balance. Available: ${available}, Required: ${required}"
+        )
+
+
+def _check_fields(amounts):
+    unknown = set(amounts) - set(BALANCE_FIELDS)
+    if unknown:
+        raise ValueError(f"Not a balance field: {', '.join(sorted(unknown))}")
+
+
+def _refresh(user, fields):
+    """Reload the changed balances so the caller's instance isn't stale"""
+    if isinstance(user, User):
+        user.refresh_from_db(fields=list(fields))
+
+
+def adjust(user, **deltas):
+    """Add signed amounts to balances in one UPDATE, without any check"""
+    _check_fields(deltas)
+    User.objects.filter(pk=user.pk).update(
+        **{field: F(field) + amount for field, amount in deltas.items()}
+    )
+    _refresh(user, deltas)
+
+
+def credit(user, **amounts):
+    """Increase balances atomically, e.g. credit(user, active_balance=amount)"""
+    adjust(user, **amounts)
+
+
+def debit(user, **amounts):
+    """
+    Decrease balances only if every one of them covers its amount.
+    Raises InsufficientBalance and changes nothing otherwise.
+    """
+    _check_fields(amounts)
+    covered = {f'{field}__gte': amount for field, amount in amounts.items()}
+    updated = User.objects.filter(pk=user.pk, **covered).update(
+        **{field: F(field) - amount for field, amount in amounts.items()}
+    )
+    if not updated:
+        current = User.objects.filter(pk=user.pk).values(*amounts).first() or {}
+        for field, amount in amounts.items():
+            available = current.get(field)
+            if available is None or available < amount:
+                raise InsufficientBalance(field, available, amount)
+        # Another request changed the row between the two statements
+        field, amount = next(iter(amounts.items()))
+        raise InsufficientBalance(field, current.get(field), amount)
+    _refresh(user, amounts)
+
+
+def lock_users(*user_ids):
+    """select_for_update the given users in deterministic (pk) order"""
+    return list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk'))
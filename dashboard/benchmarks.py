@@ -0,0 +1,184 @@
+# dashboard/benchmarks.py
+"""
+Repeatable benchmarks for the batch jobs and the hottest views.
+
+Each benchmark is a setup function returning the callable to time. Every
+run happens inside a transaction that is rolled back afterwards, so jobs
+see the same seeded data (see seed_benchmark_data) on every repetition and
+the database is left untouched. Results record wall time and query counts
+and can be compared with a saved baseline (run_benchmarks --baseline).
+"""
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import SINGLE_FLIGHT_PREFIX
+from core.models import User
+from . import engine
+from .models import DailyProfit, Investment, Transaction
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a setup function under `name`"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class _Rollback(Exception):
+    pass
+
+
+def measure(setup, repeat=3):
+    """Run setup() + the returned callable `repeat` times, each rolled back"""
+    timings, queries = [], []
+    for _ in range(repeat):
+        try:
+            with transaction.atomic():
+                operation = setup()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    operation()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured.captured_queries))
+                raise _Rollback
+        except _Rollback:
+            pass
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': max(queries),
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(names=None, repeat=3):
+    unknown = set(names or []) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmark: {', '.join(sorted(unknown))}")
+    return {
+        'meta': environment(),
+        'results': {
+            name: measure(setup, repeat)
+            for name, setup in BENCHMARKS.items()
+            if not names or name in names
+        },
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Benchmarks that got slower than the baseline median by more than
+    `tolerance` (a fraction), or that issue more queries than before.
+    """
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else 1.0
+        if ratio > 1 + tolerance or current['queries'] > previous['queries']:
+            regressions.append({
+                'name': name,
+                'median_ms': current['median_ms'],
+                'baseline_ms': previous['median_ms'],
+                'ratio': round(ratio, 2),
+                'queries': current['queries'],
+                'baseline_queries': previous['queries'],
+            })
+    return regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'commit': commit,
+        'database': connection.vendor,
+        'rows': {
+            'users': User.objects.count(),
+            'active_investments': Investment.objects.filter(status='ACTIVE').count(),
+            'daily_profits': DailyProfit.objects.count(),
+            'transactions': Transaction.objects.count(),
+        },
+    }
+
+
+def _client(user):
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+    client.force_login(user)
+    return client
+
+
+def _busiest_user():
+    """The customer with the most active investments (the costliest overview)"""
+    user = (
+        User.objects.filter(is_staff=False)
+        .annotate(active=Count('investments', filter=Q(investments__status='ACTIVE')))
+        .order_by('-active').first()
+    )
+    if user is None:
+        raise RuntimeError('No users to benchmark with; run seed_benchmark_data first')
+    return user
+
+
+@benchmark('distribute_daily_profits')
+def bench_distribute_daily_profits():
+    return lambda: engine.distribute_daily_profits(chunk_size=engine.CHUNK_SIZE)
+
+
+@benchmark('complete_expired_investments')
+def bench_complete_expired_investments():
+    # Mature every active investment so the completion path does real work
+    now = timezone.now()
+    Investment.objects.filter(status='ACTIVE').update(end_date=now, next_action_at=now)
+    return lambda: engine.complete_expired_investments()
+
+
+@benchmark('cron_cleanup')
+def bench_cron_cleanup():
+    from api.cron import run_cleanup
+    return run_cleanup
+
+
+@benchmark('overview_view')
+def bench_overview_view():
+    user = _busiest_user()
+    client = _client(user)
+    cache.delete(f'{SINGLE_FLIGHT_PREFIX}:settle_profits:{user.pk}:result')
+    url = reverse('dashboard:overview')
+    return lambda: _expect_ok(client.get(url))
+
+
+@benchmark('admin_reports_view')
+def bench_admin_reports_view():
+    admin = User.objects.create_user(
+        username='benchmark_admin', email='benchmark_admin@example.com',
+        password=None, is_staff=True, is_superuser=True,
+    )
+    client = _client(admin)
+    url = reverse('admin_panel:reports')
+    return lambda: _expect_ok(client.get(url))
+
+
+def _expect_ok(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request["PATH_INFO"]} returned {response.status_code}')
@@ -0,0 +1,402 @@
+# dashboard/engine.py
+"""
+Set-based batch operations on investments.
+
+The per-row model methods (complete_investment(), one tracker save per user)
+cost several queries per investment. These functions do the same work in
+chunked UPDATE statements, so a run costs O(changed rows) queries / chunk
+rather than O(users x investments).
+
+Jobs run against an optional TimeBudget. When the budget is nearly spent
+they stop at a chunk boundary, persist a JobCursor and report more_work, so
+the next invocation resumes where this one stopped instead of being killed
+halfway by the serverless function timeout.
+
+Every run holds a JobLock for its job (or shard), so overlapping triggers
+skip with `contended` set instead of fighting over the same rows. Sharded
+runs split the rows by user_id modulo the shard count; all workers of a job
+must use the same count.
+
+Chunks are timed as `select` and `process` phases of the enclosing
+telemetry.job_run(), if any.
+
+Only rows whose next_action_at has passed are read (through the partial
+investment_due_idx index), so a run costs O(due rows), not O(active book),
+and the jobs can be scheduled every few minutes.
+"""
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from core import clock
+from core.models import User
+from . import balances, metrics, telemetry
+from .locks import JobLock, shard_name
+from .models import PROFIT_INTERVAL, DailyProfit, Investment, JobCursor, Transaction, UserProfitTracker
+from .signals import record_profit
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = getattr(settings, 'BATCH_CHUNK_SIZE', 500)
+
+MONEY_FIELD = DecimalField(max_digits=15, decimal_places=2)
+
+
+def per_user_amounts(amounts):
+    """CASE expression mapping user id -> amount, for one grouped UPDATE"""
+    return Case(
+        *[When(pk=user_id, then=Value(amount)) for user_id, amount in amounts.items()],
+        default=Value(Decimal('0')),
+        output_field=MONEY_FIELD,
+    )
+
+
+class TimeBudget:
+    """Wall-clock allowance for one batch invocation"""
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.slowest_chunk = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(getattr(settings, 'BATCH_TIME_BUDGET', None))
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def record_chunk(self, seconds):
+        self.slowest_chunk = max(self.slowest_chunk, seconds)
+
+    def exhausted(self):
+        """True when another chunk as slow as the slowest so far won't fit"""
+        if self.seconds is None:
+            return False
+        return self.elapsed + self.slowest_chunk >= self.seconds
+
+
+@dataclass
+class JobProgress:
+    """Outcome of one (possibly partial) run of a chunked job"""
+    job: str
+    processed: int = 0
+    more_work: bool = False
+    cursor: int = 0
+    contended: bool = False
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'more_work': self.more_work,
+            'cursor': self.cursor,
+            'contended': self.contended,
+        }
+
+
+def run_chunks(job, select_chunk, process_chunk, budget=None, chunk_size=CHUNK_SIZE, shard=None):
+    """
+    Feed keyset-ordered chunks to process_chunk until the job is drained or
+    the budget runs out.
+
+    select_chunk(last_id) returns a queryset of rows whose first column is
+    the primary key. Each chunk and the cursor advance commit together, so a
+    run killed anyway loses at most the chunk in flight. `shard` is an
+    (index, count) pair restricting the run to users with
+    user_id % count == index.
+    """
+    name = shard_name(job, shard)
+    budget = budget or TimeBudget()
+    progress = JobProgress(name)
+    started = time.monotonic()
+
+    with JobLock(name) as lock:
+        if not lock.acquired:
+            progress.contended = True
+            progress.more_work = True
+            return progress
+
+        cursor, _ = JobCursor.objects.get_or_create(name=name)
+        progress.cursor = cursor.position
+
+        while True:
+            if budget.exhausted():
+                progress.more_work = True
+                break
+
+            queryset = select_chunk(progress.cursor)
+            if shard is not None:
+                index, count = shard
+                queryset = queryset.alias(shard=F('user_id') % count).filter(shard=index)
+
+            chunk_started = time.monotonic()
+            with transaction.atomic():
+                with telemetry.phase('select'):
+                    rows = list(queryset[:chunk_size])
+                if rows:
+                    with telemetry.phase('process'):
+                        progress.processed += process_chunk(rows)
+                    progress.cursor = rows[-1][0]
+
+                # A short chunk means we reached the end: start over next time
+                finished = len(rows) < chunk_size
+                JobCursor.objects.filter(pk=cursor.pk).update(
+                    position=0 if finished else progress.cursor,
+                    updated_at=timezone.now(),
+                )
+            budget.record_chunk(time.monotonic() - chunk_started)
+
+            if finished:
+                progress.cursor = 0
+                break
+
+            if not lock.renew():
+                # The lease expired and another run took over
+                progress.contended = True
+                progress.more_work = True
+                break
+
+    if not progress.contended:
+        metrics.record_job(name, time.monotonic() - started, progress.processed, progress.more_work)
+
+    logger.info(
+        f"{name}: processed {progress.processed} in {budget.elapsed:.2f}s"
+        f"{' (more work pending)' if progress.more_work else ''}"
+    )
+    return progress
+
+
+def complete_expired_investments(now=None, budget=None, chunk_size=CHUNK_SIZE, shard=None):
+    """
+    Complete every ACTIVE investment whose end_date has passed.
+
+    Each chunk pays the unpaid remainder of the profit, returns the capital
+    to account_balance (it left active_balance when the investment was
+    made) and marks the investments COMPLETED: one SELECT, one UPDATE on users and one on investments.
+    """
+    now = now or clock.now()
+
+    def select_chunk(last_id):
+        return (
+            Investment.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='ACTIVE', next_action_at__lte=now, end_date__lt=now, pk__gt=last_id)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'amount', 'total_profit', 'profit_paid')
+        )
+
+    return run_chunks('complete_expired_investments', select_chunk, _complete_rows,
+                      budget=budget, chunk_size=chunk_size, shard=shard)
+
+
+def complete_investments(ids, now=None):
+    """
+    Complete the given investments if they are still ACTIVE and have
+    matured, as one micro-batch under the completion job lock.
+    """
+    now = now or clock.now()
+    progress = JobProgress('complete_expired_investments')
+
+    with JobLock(progress.job) as lock:
+        if not lock.acquired:
+            progress.contended = True
+            return progress
+
+        with transaction.atomic():
+            rows = list(
+                Investment.objects
+                .select_for_update(skip_locked=True)
+                .filter(pk__in=ids, status='ACTIVE', end_date__lte=now)
+                .order_by('pk')
+                .values_list('pk', 'user_id', 'amount', 'total_profit', 'profit_paid')
+            )
+            if rows:
+                progress.processed = _complete_rows(rows)
+
+    return progress
+
+
+def _complete_rows(rows):
+    """Settle the given (pk, user_id, amount, total_profit, profit_paid) rows"""
+    account_credit = defaultdict(Decimal)
+    earnings_credit = defaultdict(Decimal)
+
+    for _, user_id, amount, total_profit, profit_paid in rows:
+        remaining_profit = max(total_profit - profit_paid, Decimal('0'))
+        account_credit[user_id] += amount + remaining_profit
+        earnings_credit[user_id] += remaining_profit
+
+    User.objects.filter(pk__in=account_credit).update(
+        account_balance=F('account_balance') + per_user_amounts(account_credit),
+        total_earnings=F('total_earnings') + per_user_amounts(earnings_credit),
+    )
+
+    return Investment.objects.filter(pk__in=[row[0] for row in rows]).update(
+        status='COMPLETED',
+        capital_returned=True,
+        profit_paid=F('total_profit'),
+        next_action_at=None,
+    )
+
+
+def drifted_trackers():
+    """
+    Trackers whose total_profit_earned differs from the profit actually
+    paid on the user's investments, annotated with the `expected` value.
+    """
+    paid = (
+        Investment.objects
+        .filter(user=OuterRef('user'))
+        .values('user')
+        .annotate(total=Sum('profit_paid'))
+        .values('total')
+    )
+    expected = Coalesce(Subquery(paid), Value(Decimal('0')), output_field=MONEY_FIELD)
+    return UserProfitTracker.objects.annotate(expected=expected).exclude(total_profit_earned=F('expected'))
+
+
+def sync_profit_trackers():
+    """
+    Align every tracker that drifted with the profit actually paid, in a
+    single UPDATE. Returns the number of trackers corrected.
+    """
+    return drifted_trackers().update(total_profit_earned=F('expected'))
+
+
+def settle_accrued_profits(user):
+    """
+    Collect the real-time profit accrued on all of the user's active
+    investments, as the overview does on every load. Returns the amount
+    credited.
+
+    One compare-and-set UPDATE covers every investment, then the balance
+    credit, the profit transactions and the tracker are each written once:
+    a constant number of queries however many investments the user has.
+    """
+    now = clock.now()
+    due = {}
+    unchanged = Q(pk__in=[])
+    for investment in Investment.objects.filter(user=user, status='ACTIVE').select_related('plan'):
+        profit_earned = investment.calculate_profit_up_to_now()
+        if profit_earned > investment.profit_paid:
+            due[investment.pk] = (investment, profit_earned)
+            unchanged |= Q(pk=investment.pk, profit_paid=investment.profit_paid)
+    if not due:
+        return Decimal('0')
+
+    with transaction.atomic():
+        # Only rows whose profit_paid is still the one read above are
+        # collected: a parallel request may have collected the others
+        updated = Investment.objects.filter(unchanged, status='ACTIVE').update(
+            profit_paid=Case(
+                *[When(pk=pk, then=Value(earned)) for pk, (_, earned) in due.items()],
+                output_field=MONEY_FIELD,
+            ),
+            last_profit_date=now,
+        )
+        if updated < len(due):
+            collected = set(Investment.objects.filter(pk__in=due, last_profit_date=now).values_list('pk', flat=True))
+            due = {pk: row for pk, row in due.items() if pk in collected}
+            if not due:
+                return Decimal('0')
+
+        amounts = {pk: earned - investment.profit_paid for pk, (investment, earned) in due.items()}
+        total = sum(amounts.values(), Decimal('0'))
+        balances.credit(user, account_balance=total, total_earnings=total)
+        # bulk_create sends no post_save, so the tracker is updated here
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=user,
+                amount=amounts[pk],
+                transaction_type='profit',
+                description=f'Profit update - {investment.plan.name}',
+                status='completed',
+            )
+            for pk, (investment, _) in due.items()
+        ])
+        record_profit(user.pk, total, count=len(due))
+
+    for investment, earned in due.values():
+        investment.user = user
+        investment.profit_paid = earned
+        investment.last_profit_date = now
+        investment.mark_clean(['profit_paid', 'last_profit_date'])
+        if investment.profit_paid >= investment.total_profit:
+            investment.complete_investment()
+    return total
+
+
+def distribute_daily_profits(budget=None, chunk_size=CHUNK_SIZE, shard=None):
+    """
+    Set-based equivalent of Investment.add_daily_profit() for every ACTIVE
+    investment whose next credit is due and that was not yet paid today.
+    Investments whose profit reaches total_profit are completed in the same
+    chunk.
+    """
+    now = clock.now()
+    today = clock.today()
+
+    def select_chunk(last_id):
+        return (
+            Investment.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='ACTIVE', next_action_at__lte=now, pk__gt=last_id)
+            .exclude(daily_profits__date=today)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'amount', 'daily_profit', 'total_profit', 'profit_paid')
+        )
+
+    return run_chunks('distribute_daily_profits', select_chunk, _pay_daily_profit_rows,
+                      budget=budget, chunk_size=chunk_size, shard=shard)
+
+
+def _pay_daily_profit_rows(rows):
+    """Pay one day of profit on the given rows, completing fully paid ones"""
+    now = clock.now()
+    account_credit = defaultdict(Decimal)
+    earnings_credit = defaultdict(Decimal)
+    finished = []
+
+    credits = {}
+
+    for pk, user_id, amount, daily_profit, total_profit, profit_paid in rows:
+        # Real-time accrual on the overview may already have paid part of
+        # the day; never pay beyond total_profit
+        credit = max(min(daily_profit, total_profit - profit_paid), Decimal('0'))
+        credits[pk] = credit
+        account_credit[user_id] += credit
+        earnings_credit[user_id] += credit
+        if profit_paid + credit >= total_profit:
+            # Capital goes back exactly as complete_investment() does it
+            account_credit[user_id] += amount
+            finished.append(pk)
+
+    DailyProfit.objects.bulk_create(
+        [DailyProfit(investment_id=pk, amount=credit, is_paid=True) for pk, credit in credits.items()],
+        ignore_conflicts=True,
+    )
+    User.objects.filter(pk__in=account_credit).update(
+        account_balance=F('account_balance') + per_user_amounts(account_credit),
+        total_earnings=F('total_earnings') + per_user_amounts(earnings_credit),
+    )
+    paid = Investment.objects.filter(pk__in=[row[0] for row in rows]).update(
+        profit_paid=Least(F('profit_paid') + F('daily_profit'), F('total_profit')),
+        last_profit_date=now,
+        next_action_at=Least(F('next_action_at') + PROFIT_INTERVAL, F('end_date')),
+    )
+    if finished:
+        Investment.objects.filter(pk__in=finished).update(
+            status='COMPLETED',
+            capital_returned=True,
+            next_action_at=None,
+        )
+    return paid
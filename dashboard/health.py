@@ -0,0 +1,251 @@
+# dashboard/health.py
+"""
+Deep health check for /api/health.
+
+Each probe measures one dependency and returns a dict of details. Probes run
+concurrently on a small thread pool and each gets HEALTH_PROBE_TIMEOUT
+seconds; a probe that raises or doesn't answer in time fails. On Postgres,
+the SQL probes also run under a statement_timeout of that length, so an
+abandoned probe doesn't keep a query running.
+
+Critical probes (database, cache, migrations) describe this instance: if
+one fails the endpoint answers 503 so load balancers route around it. The
+job and backlog probes describe the whole deployment: a stale profit run
+marks the result `degraded` but still answers 200, because taking every
+instance out of rotation would not make the jobs run.
+
+Anonymous callers (load balancers, uptime checks) only get the overall
+status and each probe's status and critical flag. Latencies, errors,
+migration names, job ages and backlog lag need the same credentials as
+/api/metrics (metrics.is_authorized).
+
+The result is kept in process memory for HEALTH_CACHE_TTL seconds and only
+one thread per process probes at a time, so frequent checks can't load the
+database. It deliberately doesn't use the shared cache, which is itself
+probed.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Min
+from django.http import JsonResponse
+from django.utils import timezone
+
+from admin_panel.models import JobRun
+from . import metrics
+from .models import Investment
+
+logger = logging.getLogger(__name__)
+
+PROBES = {}
+CRITICAL = set()
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='health')
+_lock = threading.Lock()
+_last = None  # (monotonic time, result)
+
+
+def probe(name, critical=False):
+    """Register a probe function under `name`"""
+    def register(check):
+        PROBES[name] = check
+        if critical:
+            CRITICAL.add(name)
+        return check
+    return register
+
+
+class ProbeFailed(Exception):
+    """A probe answered, but with a value outside its limit"""
+
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.details = details
+
+
+@contextmanager
+def statement_timeout(seconds):
+    """Bound every statement in the block on Postgres; a no-op elsewhere"""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [int(seconds * 1000)])
+        yield
+
+
+def _timeout():
+    return getattr(settings, 'HEALTH_PROBE_TIMEOUT', 2.0)
+
+
+def _age(moment):
+    return round((timezone.now() - moment).total_seconds(), 1) if moment else None
+
+
+@probe('database', critical=True)
+def check_database():
+    with statement_timeout(_timeout()), connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {'vendor': connection.vendor}
+
+
+@probe('cache', critical=True)
+def check_cache():
+    key = f'health:{uuid.uuid4().hex}'
+    cache.set(key, 1, 10)
+    found = cache.get(key)
+    cache.delete(key)
+    if found != 1:
+        raise RuntimeError('value written to the cache was not read back')
+    return {'backend': type(caches['default']).__name__}
+
+
+@probe('migrations', critical=True)
+def check_migrations():
+    """Unapplied migrations, or applied ones this code doesn't know (older deploy)"""
+    with statement_timeout(_timeout()):
+        loader = MigrationLoader(connection, ignore_no_migrations=True)
+    pending = sorted(
+        f'{app}.{name}' for app, name in loader.graph.nodes if (app, name) not in loader.applied_migrations
+    )
+    unknown = sorted(
+        f'{app}.{name}' for app, name in loader.applied_migrations
+        if app in loader.migrated_apps and (app, name) not in loader.graph.nodes
+    )
+    if pending or unknown:
+        raise ProbeFailed('schema does not match the code', pending=pending, unknown=unknown)
+    return {'applied': len(loader.applied_migrations)}
+
+
+def _last_good_run(**filters):
+    with statement_timeout(_timeout()):
+        return (
+            JobRun.objects
+            .filter(status__in=('SUCCESS', 'PARTIAL'), **filters)
+            .order_by('-id')
+            .values_list('started_at', flat=True)
+            .first()
+        )
+
+
+def _check_job_age(**filters):
+    age = _age(_last_good_run(**filters))
+    limit = getattr(settings, 'HEALTH_MAX_JOB_AGE', 26 * 3600)
+    if age is None:
+        raise ProbeFailed('no successful run recorded', age_seconds=None)
+    if age > limit:
+        raise ProbeFailed(f'last successful run is older than {limit}s', age_seconds=age)
+    return {'age_seconds': age}
+
+
+@probe('profit_distribution')
+def check_profit_distribution():
+    # Sharded runs are recorded as distribute_daily_profits[i/n]
+    return _check_job_age(job__startswith='distribute_daily_profits')
+
+
+@probe('cleanup')
+def check_cleanup():
+    return _check_job_age(job='cron_cleanup')
+
+
+@probe('backlog')
+def check_backlog():
+    """How long the oldest due investment has waited for the batch jobs"""
+    with statement_timeout(_timeout()):
+        oldest = (
+            Investment.objects
+            .filter(status='ACTIVE', next_action_at__lte=timezone.now())
+            .aggregate(oldest=Min('next_action_at'))['oldest']
+        )
+    lag = _age(oldest) or 0.0
+    limit = getattr(settings, 'HEALTH_MAX_BACKLOG_LAG', 26 * 3600)
+    if lag > limit:
+        raise ProbeFailed(f'oldest due investment has waited more than {limit}s', lag_seconds=lag)
+    return {'lag_seconds': lag}
+
+
+def _run_probe(check):
+    """Run one probe on a pool thread: (status, latency ms, details)"""
+    start = time.perf_counter()
+    try:
+        details, status = check(), 'ok'
+    except ProbeFailed as e:
+        details, status = {'error': str(e), **e.details}, 'failed'
+    except Exception as e:
+        logger.warning(f'Health probe {check.__name__} failed: {e}')
+        details, status = {'error': type(e).__name__}, 'failed'
+    finally:
+        # Pool threads keep no connections between probes
+        connections.close_all()
+    return status, round((time.perf_counter() - start) * 1000, 2), details
+
+
+def run_checks():
+    """Run every probe concurrently, each bounded by HEALTH_PROBE_TIMEOUT"""
+    timeout = _timeout()
+    futures = {name: _executor.submit(_run_probe, check) for name, check in PROBES.items()}
+    deadline = time.monotonic() + timeout
+    checks = {}
+    for name, future in futures.items():
+        try:
+            status, latency_ms, details = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            future.cancel()
+            status, latency_ms, details = 'failed', None, {'error': f'timed out after {timeout}s'}
+        checks[name] = {'status': status, 'critical': name in CRITICAL, 'latency_ms': latency_ms, **details}
+
+    failed = {name for name, check in checks.items() if check['status'] != 'ok'}
+    return {
+        'status': 'down' if failed & CRITICAL else 'degraded' if failed else 'ok',
+        'service': 'Minersurb',
+        'timestamp': timezone.now().isoformat(),
+        'checks': checks,
+    }
+
+
+def health():
+    """The latest result, re-probed at most every HEALTH_CACHE_TTL seconds per process"""
+    global _last
+    ttl = getattr(settings, 'HEALTH_CACHE_TTL', 5)
+    with _lock:
+        if _last is None or time.monotonic() - _last[0] >= ttl:
+            _last = (time.monotonic(), run_checks())
+        checked_at, result = _last
+    return {**result, 'age_seconds': round(time.monotonic() - checked_at, 2)}
+
+
+def reset():
+    """Forget the cached result (tests)"""
+    global _last
+    with _lock:
+        _last = None
+
+
+def summary(result):
+    """The result without probe details, for anonymous callers"""
+    return {
+        **{key: value for key, value in result.items() if key != 'checks'},
+        'checks': {
+            name: {'status': check['status'], 'critical': check['critical']}
+            for name, check in result['checks'].items()
+        },
+    }
+
+
+def health_view(request):
+    """GET /api/health; 503 when a critical probe fails"""
+    result = health()
+    if not metrics.is_authorized(request):
+        result = summary(result)
+    response = JsonResponse(result, status=503 if result['status'] == 'down' else 200)
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,244 @@
+# dashboard/loadtest.py
+"""
+HTTP load generator for the user and admin flows.
+
+Worker threads each hold their own cookie session and loop over a role's
+flow (customer, newcomer or admin) until the run ends. Every request is
+timed per endpoint; redirects are not followed, so a POST is measured on
+its own rather than together with the page it redirects to.
+
+Only the standard library is used, and LiveServer runs the project's WSGI
+app in-process on a threaded server, so a run needs nothing but the
+database (use seed_benchmark_data first).
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, elapsed_ms, ok):
+        with self.lock:
+            self.samples[endpoint].append(elapsed_ms)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, duration):
+        report = {}
+        with self.lock:
+            for endpoint in sorted(self.samples):
+                values = sorted(self.samples[endpoint])
+                report[endpoint] = {
+                    'requests': len(values),
+                    'errors': self.errors[endpoint],
+                    'rps': round(len(values) / duration, 2) if duration else 0.0,
+                    **{f'p{p}_ms': round(percentile(values, p), 1) for p in PERCENTILES},
+                    'max_ms': round(values[-1], 1),
+                }
+        return report
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """One browser: cookies, CSRF token handling and timed requests"""
+
+    def __init__(self, base_url, recorder, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def get(self, endpoint, path):
+        return self.request(endpoint, Request(self.base_url + path))
+
+    def post(self, endpoint, path, data):
+        data = {'csrfmiddlewaretoken': self.csrf_token(), **data}
+        request = Request(
+            self.base_url + path, data=urlencode(data).encode(),
+            headers={'X-CSRFToken': self.csrf_token(), 'Referer': self.base_url + path},
+        )
+        return self.request(endpoint, request)
+
+    def request(self, endpoint, request):
+        """Time one request; 2xx and 3xx count as success. Returns the status"""
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            e.read()
+            status = e.code
+        except (URLError, OSError):
+            status = 0
+        self.recorder.record(endpoint, (time.perf_counter() - started) * 1000, 0 < status < 400)
+        return status
+
+
+class Flows:
+    """
+    The user journeys. `customers` are (username, password) pairs of
+    existing users; `pending_deposits` / `pending_withdrawals` are ids the
+    admins work through (shared lists, popped under a lock).
+    """
+
+    def __init__(self, customers, admin, pending_deposits=(), pending_withdrawals=(), seed=None):
+        self.customers = list(customers)
+        self.admin = admin
+        self.pending = {'deposits': list(pending_deposits), 'withdrawals': list(pending_withdrawals)}
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.signups = 0
+
+    def next_pending(self, kind):
+        with self.lock:
+            return self.pending[kind].pop() if self.pending[kind] else None
+
+    def login(self, session, username, password):
+        session.get('login (GET)', '/auth/login/')
+        session.post('login (POST)', '/auth/login/', {
+            'username': username, 'password': password, 'remember': 'on',
+        })
+
+    def customer(self, session, first):
+        if first:
+            with self.lock:
+                username, password = self.rng.choice(self.customers)
+            self.login(session, username, password)
+        session.get('overview', '/dashboard/')
+        session.get('history', '/dashboard/history/')
+        session.get('deposit (GET)', '/dashboard/deposit/')
+        session.post('deposit (POST)', '/dashboard/deposit/', {
+            'amount': '150.00', 'crypto_type': 'USDT', 'plan_id': '',
+        })
+        session.get('withdrawal (GET)', '/dashboard/withdrawal/')
+        session.post('withdrawal (POST)', '/dashboard/withdrawal/', {
+            'amount': '1.00', 'crypto_type': 'USDT', 'crypto_address': 'load-test-address',
+        })
+
+    def newcomer(self, session, first):
+        with self.lock:
+            self.signups += 1
+            username = f'load_{threading.get_ident() % 100000}_{self.signups}_{self.rng.randint(0, 10**6)}'
+        email = f'{username}@example.com'
+        session.get('signup (GET)', '/auth/signup/')
+        session.post('signup (POST)', '/auth/signup/', {
+            'full_name': 'Load Test', 'username': username, 'email': email,
+            'confirm_email': email, 'password': 'load-test-pass', 'confirm_password': 'load-test-pass',
+        })
+        session.get('overview', '/dashboard/')
+        # Start over as a fresh visitor
+        session.cookies.clear()
+
+    def admin_flow(self, session, first):
+        if first:
+            self.login(session, *self.admin)
+        session.get('admin deposits', '/admin-panel/deposits/')
+        session.get('admin withdrawals', '/admin-panel/withdrawals/')
+        deposit_id = self.next_pending('deposits')
+        if deposit_id:
+            session.post('admin approve deposit', f'/admin-panel/deposits/{deposit_id}/approve/', {})
+        withdrawal_id = self.next_pending('withdrawals')
+        if withdrawal_id:
+            session.post('admin approve withdrawal', f'/admin-panel/withdrawals/{withdrawal_id}/approve/', {})
+
+    def role(self, index, admins, newcomers):
+        """Worker 0..admins-1 are admins, the next `newcomers` sign up, the rest are customers"""
+        if index < admins:
+            return self.admin_flow
+        if index < admins + newcomers:
+            return self.newcomer
+        return self.customer
+
+
+def run_load(base_url, flows, concurrency=10, duration=30, admins=1, newcomers=1, timeout=30):
+    """Drive `concurrency` workers for `duration` seconds and summarise"""
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        session = Session(base_url, recorder, timeout=timeout)
+        flow = flows.role(index, admins, newcomers)
+        first = True
+        while time.monotonic() < deadline:
+            flow(session, first)
+            first = False
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(e['requests'] for e in endpoints.values())
+    return {
+        'duration_seconds': round(elapsed, 2),
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'rps': round(total / elapsed, 2) if elapsed else 0.0,
+        'endpoints': endpoints,
+    }
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LiveServer:
+    """The project's WSGI app on a threaded server in a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.httpd = ThreadedWSGIServer((host, port), _QuietHandler, allow_reuse_address=True)
+        self.httpd.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,121 @@
+# dashboard/locks.py
+"""
+Mutual exclusion for batch jobs.
+
+Profit distribution and cleanup can be started from celery, the management
+command (run_profits.bat), and the Vercel cron endpoint at the same time.
+JobLock makes sure only one run per job (or per shard of a job) touches the
+rows at a time.
+
+On PostgreSQL with a direct connection (DB_CONNECTION_MODE persistent) it
+takes a session-level advisory lock, which the server drops by itself when
+the holder's connection goes away. Everywhere else it uses a JobLease row
+whose lease expires after `ttl` seconds, so a crashed run never blocks the
+job for longer than that. That includes serverless mode: behind a
+transaction pooler the lock and the unlock can run on different backend
+sessions, leaving the advisory lock held on a pooled backend for good.
+"""
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import JobLease
+
+logger = logging.getLogger(__name__)
+
+
+def shard_name(name, shard=None):
+    """Lock/cursor name of one shard, e.g. distribute_daily_profits[1/4]"""
+    if shard is None:
+        return name
+    index, count = shard
+    return f'{name}[{index}/{count}]'
+
+
+def advisory_key(name):
+    """Stable signed 64-bit key for pg_try_advisory_lock"""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class JobLock:
+    """Non-blocking, lease-based lock for one job name"""
+
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl or getattr(settings, 'BATCH_LOCK_TTL', 300)
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.acquired = False
+        self.use_advisory = (
+            connection.vendor == 'postgresql'
+            and getattr(settings, 'DB_CONNECTION_MODE', 'persistent') != 'serverless'
+        )
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self):
+        """Try to take the lock; returns False if another run holds it"""
+        if self.use_advisory:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', [advisory_key(self.name)])
+                self.acquired = cursor.fetchone()[0]
+        else:
+            self.acquired = self._take_lease()
+
+        if not self.acquired:
+            logger.warning(f"{self.name} is already running elsewhere; skipping")
+        return self.acquired
+
+    def renew(self):
+        """Extend the lease; returns False if it expired and was taken over"""
+        if not self.acquired:
+            return False
+        if self.use_advisory:
+            return True
+        renewed = JobLease.objects.filter(name=self.name, owner=self.owner).update(
+            expires_at=timezone.now() + timedelta(seconds=self.ttl)
+        )
+        if not renewed:
+            logger.warning(f"Lost the lease on {self.name}")
+            self.acquired = False
+        return bool(renewed)
+
+    def release(self):
+        if not self.acquired:
+            return
+        if self.use_advisory:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [advisory_key(self.name)])
+        else:
+            JobLease.objects.filter(name=self.name, owner=self.owner).delete()
+        self.acquired = False
+
+    def _take_lease(self):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        # Take over an expired lease (or refresh our own) atomically
+        if JobLease.objects.filter(name=self.name).filter(
+            Q(expires_at__lte=now) | Q(owner=self.owner)
+        ).update(owner=self.owner, expires_at=expires_at):
+            return True
+
+        try:
+            with transaction.atomic():
+                JobLease.objects.create(name=self.name, owner=self.owner, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
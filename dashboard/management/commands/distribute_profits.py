@@ -1,22 +1,54 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from dashboard.models import Investment
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.engine import TimeBudget, distribute_daily_profits
+from dashboard.locks import shard_name
+from dashboard.telemetry import job_run
 
 class Command(BaseCommand):
     help = 'Distribute daily profits for active investments'
     
-    def handle(self, *args, **kwargs):
-        active_investments = Investment.objects.filter(status='ACTIVE')
-        total_profits = 0
-        count = 0
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=float,
+            default=None,
+            help='Stop after roughly this many seconds and resume on the next run',
+        )
+        parser.add_argument(
+            '--shard',
+            default=None,
+            help='Only process shard INDEX/COUNT (e.g. 0/4); run one worker per index',
+        )
+    
+    def handle(self, *args, **options):
+        shard = None
+        if options['shard']:
+            try:
+                index, count = (int(part) for part in options['shard'].split('/'))
+            except ValueError:
+                raise CommandError('--shard must look like INDEX/COUNT, e.g. 0/4')
+            if not 0 <= index < count:
+                raise CommandError('--shard index must be between 0 and COUNT - 1')
+            shard = (index, count)
+        
+        with job_run(shard_name('distribute_daily_profits', shard), trigger='command') as run:
+            progress = distribute_daily_profits(budget=TimeBudget(options['budget']), shard=shard)
+            run.record(progress)
         
-        for investment in active_investments:
-            if investment.add_daily_profit():
-                count += 1
-                total_profits += investment.daily_profit
+        if progress.contended:
+            self.stdout.write(
+                self.style.WARNING(f'{progress.job} is already running elsewhere; nothing done')
+            )
+            return
         
         self.stdout.write(
             self.style.SUCCESS(
-                f'Distributed ${total_profits} profits to {count} investments'
+                f'Distributed profits to {progress.processed} investments '
+                f'in {run.duration:.2f}s ({run.queries.count} queries)'
+            )
+        )
+        if progress.more_work:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Time budget reached at investment #{progress.cursor}; run again to resume'
+                )
             )
-        )
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+import secrets
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.models import User
+from dashboard.loadtest import PERCENTILES, Flows, LiveServer, run_load
+from dashboard.models import Deposit, Withdrawal
+
+class Command(BaseCommand):
+    help = 'Concurrent HTTP load test of the user and admin flows (p50/p95/p99 per endpoint)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url',
+                            help='Server to test, e.g. http://127.0.0.1:8000 (default: start one in-process)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Worker threads')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--admins', type=int, default=1, help='Workers running the admin flow')
+        parser.add_argument('--newcomers', type=int, default=1, help='Workers signing up new users')
+        parser.add_argument('--prefix', default='bench',
+                            help='Username prefix of the seeded customers to log in as')
+        parser.add_argument('--password', default='benchmark', help='Password of the seeded customers')
+        parser.add_argument('--admin',
+                            help='Existing superuser for the admin flow (default: a temporary one, deleted afterwards)')
+        parser.add_argument('--admin-password', help='Password of --admin')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        customers = [
+            (username, options['password'])
+            for username in User.objects.filter(username__startswith=f"{options['prefix']}_")
+            .order_by('?').values_list('username', flat=True)[:1000]
+        ]
+        if not customers:
+            raise CommandError(
+                f"No users named {options['prefix']}_*; run seed_benchmark_data first"
+            )
+
+        temporary_admin = None
+        if options['admin']:
+            if not options['admin_password']:
+                raise CommandError('--admin needs --admin-password')
+            if not User.objects.filter(username=options['admin'], is_superuser=True, is_active=True).exists():
+                raise CommandError(f"{options['admin']} is not an active superuser")
+            admin = (options['admin'], options['admin_password'])
+        else:
+            # A fresh account with a random name and password, never left behind
+            admin = (f'loadtest_admin_{secrets.token_hex(4)}', secrets.token_urlsafe(16))
+            temporary_admin = User.objects.create_superuser(
+                admin[0], f'{admin[0]}@example.com', admin[1]
+            )
+
+        try:
+            report = self.run_flows(customers, admin, options)
+        finally:
+            if temporary_admin is not None:
+                temporary_admin.delete()
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def run_flows(self, customers, admin, options):
+        flows = Flows(
+            customers,
+            admin=admin,
+            pending_deposits=Deposit.objects.filter(status='PENDING').values_list('pk', flat=True)[:5000],
+            pending_withdrawals=Withdrawal.objects.filter(status='PENDING').values_list('pk', flat=True)[:5000],
+            seed=options['seed'],
+        )
+        run = lambda url: run_load(
+            url, flows,
+            concurrency=options['concurrency'], duration=options['duration'],
+            admins=options['admins'], newcomers=options['newcomers'], timeout=options['timeout'],
+        )
+
+        if options['base_url']:
+            report = run(options['base_url'])
+        else:
+            if connection.vendor == 'sqlite':
+                # Readers don't block the writer (persists in the database file)
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode=WAL')
+            # No external services: keep approval emails in memory
+            settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+            connection.close()
+            with LiveServer() as server:
+                self.stdout.write(f'Serving on {server.url}')
+                report = run(server.url)
+        return report
+
+    def print_report(self, report):
+        columns = ''.join(f'{f"p{p}":>9}' for p in PERCENTILES)
+        self.stdout.write(f"{'endpoint':<26}{'reqs':>7}{'errs':>6}{'rps':>8}{columns}{'max':>9}")
+        for name, e in report['endpoints'].items():
+            values = ''.join(f"{e[f'p{p}_ms']:>9.1f}" for p in PERCENTILES)
+            line = f"{name:<26}{e['requests']:>7}{e['errors']:>6}{e['rps']:>8.1f}{values}{e['max_ms']:>9.1f}"
+            self.stdout.write(self.style.WARNING(line) if e['errors'] else line)
+
+        summary = (
+            f"{report['requests']} requests in {report['duration_seconds']}s "
+            f"({report['rps']} req/s, {report['concurrency']} workers), {report['errors']} errors"
+        )
+        self.stdout.write(self.style.WARNING(summary) if report['errors'] else self.style.SUCCESS(summary))
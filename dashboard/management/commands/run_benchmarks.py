@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.benchmarks import BENCHMARKS, compare, run_benchmarks
+
+class Command(BaseCommand):
+    help = 'Time the batch jobs and hot views; optionally compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                            help='Run only this benchmark (repeatable)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per benchmark; the median is reported')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed slowdown against the baseline, as a fraction')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if any benchmark regressed')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(options['only'], repeat=options['repeat'])
+
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f"{name:<30} {result['median_ms']:>10.2f} ms  {result['queries']:>5} queries"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if not options['baseline']:
+            return
+
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        regressions = compare(results, baseline, options['tolerance'])
+        for r in regressions:
+            self.stdout.write(self.style.WARNING(
+                f"REGRESSION {r['name']}: {r['median_ms']} ms vs {r['baseline_ms']} ms "
+                f"(x{r['ratio']}), {r['queries']} vs {r['baseline_queries']} queries"
+            ))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+        elif options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} benchmark(s) regressed')
@@ -0,0 +1,56 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from dashboard.scheduler import CompletionScheduler
+from dashboard.telemetry import job_run
+
+class Command(BaseCommand):
+    help = 'Long-running worker that completes investments as soon as they mature'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=3600,
+                            help='Seconds ahead to load maturing investments')
+        parser.add_argument('--refill-interval', type=int, default=300,
+                            help='Seconds between reloads from the database')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum investments completed per micro-batch')
+        parser.add_argument('--once', action='store_true',
+                            help='Process what is due now and exit')
+
+    def handle(self, *args, **options):
+        scheduler = CompletionScheduler(
+            horizon=options['horizon'],
+            refill_interval=options['refill_interval'],
+            batch_size=options['batch_size'],
+        )
+
+        if options['once']:
+            completed = self.run_once(scheduler)
+            self.stdout.write(self.style.SUCCESS(f'Completed {completed} investments'))
+            return
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(self.style.SUCCESS('Scheduler started'))
+
+        while self.running:
+            close_old_connections()
+            self.run_once(scheduler)
+            # Sleep in short steps so a stop signal is honoured promptly
+            deadline = time.monotonic() + scheduler.seconds_until_next()
+            while self.running and time.monotonic() < deadline:
+                time.sleep(min(1, deadline - time.monotonic()))
+
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped'))
+
+    def run_once(self, scheduler):
+        # Idle wake-ups aren't worth a JobRun row
+        with job_run('completion_scheduler', trigger='scheduler', keep_idle=False) as run:
+            run.rows = scheduler.run_once()
+        return run.rows
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,266 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from core.models import User, Plan
+from dashboard.models import (
+    DailyProfit, Deposit, Investment, Transaction, UserProfitTracker, Withdrawal,
+)
+
+CENT = Decimal('0.01')
+CRYPTO_TYPES = ['BTC', 'ETH', 'TRX', 'USDT']
+DEFAULT_PLANS = [
+    # name, min, max, daily %, days
+    ('BASIC', 100, 999, Decimal('2.50'), 30),
+    ('STANDARD', 1000, 4999, Decimal('3.00'), 30),
+    ('ADVANCED', 5000, 19999, Decimal('3.50'), 45),
+    ('PREMIUM', 20000, None, Decimal('4.00'), 60),
+]
+
+
+@contextmanager
+def backdated(*models_and_fields):
+    """Let bulk_create keep explicit values for auto_now(_add) fields"""
+    fields = [model._meta.get_field(name) for model, name in models_and_fields]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def money(value):
+    return Decimal(value).quantize(CENT)
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, realistic dataset for benchmarks with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--investments', type=int, default=10,
+                            help='Average investments per user')
+        parser.add_argument('--daily-profit-days', type=int, default=7,
+                            help='DailyProfit rows kept per investment (most recent days)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Users generated (and rows inserted) per batch')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='bench',
+                            help='Username prefix of generated users')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.options = options
+        self.password = make_password('benchmark')
+        self.plans = self.ensure_plans()
+        self.referrers = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_")
+            .values_list('pk', flat=True)[:10000]
+        )
+        self.counts = dict.fromkeys(
+            ['users', 'deposits', 'withdrawals', 'investments', 'daily_profits', 'transactions'], 0
+        )
+
+        started = time.monotonic()
+        first = User.objects.filter(username__startswith=f"{options['prefix']}_").count()
+        remaining = options['users']
+        while remaining > 0:
+            size = min(options['batch_size'], remaining)
+            with transaction.atomic(), backdated(
+                (Deposit, 'created_at'), (Withdrawal, 'created_at'),
+                (Transaction, 'created_at'), (Transaction, 'updated_at'),
+            ):
+                self.seed_batch(first, size)
+            first += size
+            remaining -= size
+            self.stdout.write(f"  {self.counts['users']} users seeded ({time.monotonic() - started:.1f}s)")
+
+        summary = ', '.join(f'{count} {name}' for name, count in self.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {summary} in {time.monotonic() - started:.1f}s'
+        ))
+
+    def ensure_plans(self):
+        plans = list(Plan.objects.filter(is_active=True))
+        if not plans:
+            plans = Plan.objects.bulk_create([
+                Plan(name=name, min_amount=low, max_amount=high,
+                     daily_percentage=pct, duration_days=days)
+                for name, low, high, pct, days in DEFAULT_PLANS
+            ])
+        return plans
+
+    def bulk(self, model, objects):
+        created = model.objects.bulk_create(objects, batch_size=self.options['batch_size'])
+        return created
+
+    def seed_batch(self, first, size):
+        rng, now, prefix = self.rng, self.now, self.options['prefix']
+
+        users = []
+        for n in range(first, first + size):
+            username = f'{prefix}_{n:07d}'
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                password=self.password,
+                full_name=f'Benchmark User {n}',
+                referral_code=f'{prefix.upper()[:6]}{n:09d}',
+                referred_by_id=rng.choice(self.referrers) if self.referrers and rng.random() < 0.3 else None,
+                date_joined=now - timedelta(days=rng.uniform(30, 365)),
+            ))
+        users = self.bulk(User, users)
+        if users[0].pk is None:
+            # Backends that can't return ids from a bulk insert
+            ids = dict(User.objects.filter(username__in=[u.username for u in users])
+                       .values_list('username', 'pk'))
+            for user in users:
+                user.pk = ids[user.username]
+        self.referrers.extend(u.pk for u in users[:1000])
+
+        deposits, withdrawals, investments, transactions, trackers = [], [], [], [], []
+        for user in users:
+            self.seed_user(user, deposits, withdrawals, investments, transactions, trackers)
+
+        self.bulk(Deposit, deposits)
+        self.bulk(Withdrawal, withdrawals)
+        investments = self.bulk(Investment, investments)
+        self.bulk(Transaction, transactions)
+        self.bulk(UserProfitTracker, trackers)
+        User.objects.bulk_update(
+            users, ['account_balance', 'active_balance', 'total_earnings'],
+            batch_size=self.options['batch_size'],
+        )
+
+        daily_profits = self.daily_profits(investments)
+        self.bulk(DailyProfit, daily_profits)
+
+        self.counts['users'] += len(users)
+        self.counts['deposits'] += len(deposits)
+        self.counts['withdrawals'] += len(withdrawals)
+        self.counts['investments'] += len(investments)
+        self.counts['daily_profits'] += len(daily_profits)
+        self.counts['transactions'] += len(transactions)
+
+    def seed_user(self, user, deposits, withdrawals, investments, transactions, trackers):
+        rng, now = self.rng, self.now
+        age_days = (now - user.date_joined).days
+
+        # Deposits: mostly approved, lognormal amounts around a few hundred
+        approved_total = Decimal('0')
+        first_deposit = None
+        for _ in range(rng.randint(1, 4)):
+            created = user.date_joined + timedelta(days=rng.uniform(0, age_days))
+            amount = money(max(100, rng.lognormvariate(6.5, 1.0)))
+            status = rng.choices(['APPROVED', 'PENDING', 'CANCELLED'], [85, 10, 5])[0]
+            deposits.append(Deposit(
+                user_id=user.pk, amount=amount, crypto_type=rng.choice(CRYPTO_TYPES),
+                wallet_address='benchmark-wallet', status=status, created_at=created,
+                approved_at=created + timedelta(hours=2) if status == 'APPROVED' else None,
+            ))
+            transactions.append(Transaction(
+                user_id=user.pk, amount=amount, transaction_type='deposit',
+                description=f'{status.title()} deposit',
+                status='completed' if status == 'APPROVED' else 'pending',
+                created_at=created, updated_at=created,
+            ))
+            if status == 'APPROVED':
+                approved_total += amount
+                first_deposit = min(first_deposit or created, created)
+
+        # Investments funded from approved deposits
+        budget = approved_total
+        invested = returned = profit = Decimal('0')
+        first_investment = None
+        for _ in range(rng.randint(0, 2 * self.options['investments'])):
+            plan = rng.choice(self.plans)
+            if budget < plan.min_amount:
+                continue
+            amount = money(rng.uniform(float(plan.min_amount), float(min(budget, plan.max_amount or budget))))
+            budget -= amount
+
+            start = user.date_joined + timedelta(days=rng.uniform(0, age_days))
+            end = start + timedelta(days=plan.duration_days)
+            daily = money(amount * plan.daily_percentage / 100)
+            total = daily * plan.duration_days
+            days_paid = min(max((now - start).days, 0), plan.duration_days)
+            active = end > now
+
+            investments.append(Investment(
+                user_id=user.pk, plan=plan, amount=amount, daily_profit=daily,
+                total_profit=total, profit_paid=daily * days_paid if active else total,
+                capital_returned=not active, start_date=start, end_date=end,
+                status='ACTIVE' if active else 'COMPLETED',
+                last_profit_date=start + timedelta(days=days_paid),
+                next_action_at=min(start + timedelta(days=days_paid + 1), end) if active else None,
+            ))
+            transactions.append(Transaction(
+                user_id=user.pk, amount=amount, transaction_type='investment',
+                description=f'Investment - {plan.name}', status='completed',
+                created_at=start, updated_at=start,
+            ))
+            invested += amount
+            profit += daily * days_paid if active else total
+            if not active:
+                returned += amount
+            first_investment = min(first_investment or start, start)
+
+        if profit:
+            transactions.append(Transaction(
+                user_id=user.pk, amount=profit, transaction_type='profit',
+                description='Profit update', status='completed',
+                created_at=now, updated_at=now,
+            ))
+
+        # Withdrawals out of what was earned or returned
+        account = profit + returned
+        if account > 0 and rng.random() < 0.4:
+            for _ in range(rng.randint(1, 2)):
+                amount = money(account * Decimal(rng.uniform(0.05, 0.3)))
+                if amount <= 0:
+                    continue
+                status = rng.choices(['APPROVED', 'PENDING', 'CANCELLED'], [70, 25, 5])[0]
+                created = now - timedelta(days=rng.uniform(0, 30))
+                withdrawals.append(Withdrawal(
+                    user_id=user.pk, amount=amount, crypto_address='benchmark-address',
+                    crypto_type=rng.choice(CRYPTO_TYPES), status=status, created_at=created,
+                    approved_at=created + timedelta(hours=6) if status == 'APPROVED' else None,
+                ))
+                transactions.append(Transaction(
+                    user_id=user.pk, amount=amount, transaction_type='withdrawal',
+                    description=f'{status.title()} withdrawal',
+                    status='completed' if status == 'APPROVED' else 'pending',
+                    created_at=created, updated_at=created,
+                ))
+                if status == 'APPROVED':
+                    account -= amount
+
+        user.active_balance = approved_total - invested
+        user.account_balance = account
+        user.total_earnings = profit
+        trackers.append(UserProfitTracker(
+            user_id=user.pk, first_deposit_date=first_deposit,
+            first_investment_date=first_investment, total_profit_earned=profit,
+        ))
+
+    def daily_profits(self, investments):
+        keep = self.options['daily_profit_days']
+        rows = []
+        for investment in investments:
+            days_paid = (investment.last_profit_date - investment.start_date).days
+            for day in range(max(days_paid - keep, 0), days_paid):
+                rows.append(DailyProfit(
+                    investment_id=investment.pk, amount=investment.daily_profit, is_paid=True,
+                    date=(investment.start_date + timedelta(days=day + 1)).date(),
+                ))
+        return rows
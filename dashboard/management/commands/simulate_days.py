@@ -0,0 +1,208 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from core import clock
+from core.models import User
+from dashboard import engine
+from dashboard.models import DailyProfit, Investment
+from dashboard.telemetry import job_run
+
+
+# Money columns are compared to within half a cent: SQLite stores F()
+# arithmetic on decimals as floats (179.70 becomes 179.70000000000002)
+HALF_CENT = Decimal('0.005')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def same_money(a, b):
+    return abs(a - b) < HALF_CENT
+
+
+def totals():
+    """Book-wide sums the invariants compare before and after"""
+    zero = Decimal('0')
+    users = User.objects.aggregate(
+        account=Sum('account_balance', default=zero),
+        active=Sum('active_balance', default=zero),
+        earnings=Sum('total_earnings', default=zero),
+    )
+    investments = Investment.objects.aggregate(
+        profit_paid=Sum('profit_paid', default=zero),
+        active_capital=Sum('amount', filter=Q(status='ACTIVE'), default=zero),
+        active=Count('pk', filter=Q(status='ACTIVE')),
+    )
+    negative = User.objects.filter(
+        Q(account_balance__lt=-HALF_CENT) | Q(active_balance__lt=-HALF_CENT) | Q(total_earnings__lt=-HALF_CENT)
+    ).count()
+    return {**users, **investments, 'negative': negative, 'daily_profits': DailyProfit.objects.count()}
+
+
+def completed_count():
+    return Investment.objects.filter(status='COMPLETED').count()
+
+
+def check_invariants(before, after, paid_rows, now):
+    """(name, ok, detail) for every invariant of the book after the simulation"""
+    profit = after['profit_paid'] - before['profit_paid']
+    capital_returned = before['active_capital'] - after['active_capital']
+    account_delta = after['account'] - before['account']
+    earnings_delta = after['earnings'] - before['earnings']
+    daily_profits = after['daily_profits'] - before['daily_profits']
+
+    overpaid = Investment.objects.filter(profit_paid__gt=F('total_profit') + HALF_CENT).count()
+    unsettled = Investment.objects.filter(status='COMPLETED').filter(
+        Q(profit_paid__lt=F('total_profit') - HALF_CENT) | Q(capital_returned=False)
+    ).count()
+    overdue = Investment.objects.filter(status='ACTIVE', end_date__lt=now).count()
+    missed = Investment.objects.filter(status='ACTIVE', next_action_at__lte=now).count()
+    # Users already negative before the run (data from older code) don't count
+    negative = after['negative'] - before['negative']
+    drifted = engine.drifted_trackers().count()
+
+    return [
+        ('no_overpaid_investments', not overpaid, f'{overpaid} investments paid beyond total_profit'),
+        ('completed_fully_settled', not unsettled, f'{unsettled} completed investments not fully paid out'),
+        ('no_overdue_active', not overdue, f'{overdue} ACTIVE investments past end_date'),
+        ('no_missed_payments', not missed, f'{missed} ACTIVE investments still due'),
+        ('one_daily_profit_per_payment', daily_profits == paid_rows,
+         f'{daily_profits} DailyProfit rows for {paid_rows} payments'),
+        ('earnings_match_profit', same_money(earnings_delta, profit),
+         f'total_earnings +{earnings_delta}, profit_paid +{profit}'),
+        ('account_balance_conserved', same_money(account_delta, profit + capital_returned),
+         f'account_balance +{account_delta}, profit +{profit} and capital returned {capital_returned}'),
+        ('trackers_in_sync', not drifted, f'{drifted} trackers differ from profit paid'),
+        ('no_negative_balances', negative <= 0, f'{negative} more users with a negative balance'),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Advance simulated time day by day over the data, running distribution and cleanup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--start', default=None,
+                            help='Simulated start (ISO date/time); defaults to now')
+        parser.add_argument('--chunk-size', type=int, default=engine.CHUNK_SIZE)
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Seed this many users with seed_benchmark_data first')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit the simulated days instead of rolling them back')
+        parser.add_argument('--output', default=None,
+                            help='Write per-day results and invariants as JSON')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Record the tracemalloc peak per day (slows the jobs down several times)')
+
+    def handle(self, *args, **options):
+        start = self.parse_start(options['start'])
+        try:
+            with transaction.atomic():
+                if options['seed_users']:
+                    call_command('seed_benchmark_data', users=options['seed_users'],
+                                 prefix='sim', stdout=self.stdout)
+                report = self.simulate(start, options['days'], options['chunk_size'], options['trace_memory'])
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write('Rolled back the simulated days (use --keep to commit them)')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        failed = [name for name, ok, _ in report['invariants'] if not ok]
+        if failed:
+            raise CommandError(f"Invariants violated: {', '.join(failed)}")
+
+    def parse_start(self, value):
+        if not value:
+            return clock.now()
+        try:
+            start = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError('--start must be an ISO date or date/time, e.g. 2025-01-01')
+        return start if timezone.is_aware(start) else timezone.make_aware(start)
+
+    def simulate(self, start, days, chunk_size, trace_memory=False):
+        before = totals()
+        self.stdout.write(
+            f"Simulating {days} days from {start:%Y-%m-%d %H:%M} over "
+            f"{before['active']} active investments"
+        )
+
+        results, paid_rows = [], 0
+        completed_so_far = completed_count()
+        with clock.frozen(start) as frozen:
+            for day in range(1, days + 1):
+                frozen.advance(days=1)
+                with job_run('simulate_day', trigger='simulation', trace_memory=trace_memory) as run:
+                    with run.phase('distribute'):
+                        paid = self.drain(engine.distribute_daily_profits, chunk_size=chunk_size)
+                    with run.phase('complete_expired'):
+                        expired = self.drain(engine.complete_expired_investments, chunk_size=chunk_size)
+                    with run.phase('sync_trackers'):
+                        engine.sync_profit_trackers()
+                    run.rows = paid + expired
+                paid_rows += paid
+                # Most investments complete with their last daily credit,
+                # so count status changes rather than the expiry job's rows
+                completed = completed_count() - completed_so_far
+                completed_so_far += completed
+
+                result = {
+                    'day': day,
+                    'date': clock.today().isoformat(),
+                    'profits_paid': paid,
+                    'completed': completed,
+                    'rows': run.rows,
+                    'seconds': round(run.duration, 3),
+                    'rows_per_second': round(run.rows / run.duration, 1) if run.duration else 0.0,
+                    'queries': run.queries.count,
+                    'peak_memory_bytes': run.peak_memory,
+                    'phases': {name: round(p['seconds'], 3) for name, p in run.phases.items() if '.' not in name},
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"  day {day:>3} {result['date']}: {paid} paid, {completed} completed in "
+                    f"{result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s, {result['queries']} queries)"
+                )
+
+            invariants = check_invariants(before, totals(), paid_rows, frozen.now())
+
+        total_seconds = sum(r['seconds'] for r in results)
+        total_rows = sum(r['rows'] for r in results)
+        total_completed = sum(r['completed'] for r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{days} simulated days, {total_rows} rows ({total_completed} completed) in {total_seconds:.2f}s"
+            f" ({total_rows / total_seconds if total_seconds else 0:.0f} rows/s);"
+            f" slowest day {max((r['seconds'] for r in results), default=0):.2f}s"
+        ))
+        for name, ok, detail in invariants:
+            write = self.stdout.write
+            write(self.style.SUCCESS(f'  ok    {name}') if ok else self.style.ERROR(f'  FAIL  {name}: {detail}'))
+
+        return {
+            'start': start.isoformat(),
+            'days': results,
+            'invariants': [(name, ok, detail) for name, ok, detail in invariants],
+        }
+
+    def drain(self, job, **kwargs):
+        """Run a chunked job until it has no more work for the current day"""
+        processed = 0
+        while True:
+            progress = job(**kwargs)
+            processed += progress.processed
+            if progress.contended:
+                raise CommandError(f'{progress.job} is locked by another run; stop it first')
+            if not progress.more_work:
+                return processed
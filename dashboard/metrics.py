@@ -0,0 +1,200 @@
+# dashboard/metrics.py
+"""
+Prometheus text exposition for /api/metrics.
+
+A scrape never runs fresh aggregates over the big tables:
+
+- batch jobs record their last run in the cache as they finish
+  (record_job, called from engine.run_chunks);
+- request latency histograms are the in-process aggregates of
+  core.request_metrics (per worker process, like any client library);
+- queue depth/age and the due-investment backlog come from a rollup that
+  is recomputed at most once per METRICS_ROLLUP_TTL seconds across all
+  workers (single_flight), using the status and next_action_at indexes.
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min
+from django.http import HttpResponse
+from django.utils import timezone
+
+from admin_panel.models import AdminNotification
+from core.cache import single_flight
+from core.request_metrics import histograms
+from .models import Deposit, Investment, JobCursor, Withdrawal
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JOB_KEY_PREFIX = 'metrics:job:'
+JOB_INDEX_KEY = 'metrics:jobs'
+
+
+def record_job(job, duration, processed, more_work):
+    """
+    Remember a finished job run for the metrics endpoint. Runs of one job
+    never overlap (JobLock), so the read-modify-write can't race.
+    """
+    key = f'{JOB_KEY_PREFIX}{job}'
+    stats = cache.get(key) or {'runs': 0, 'rows': 0}
+    stats.update(
+        runs=stats['runs'] + 1,
+        rows=stats['rows'] + processed,
+        last_duration_seconds=duration,
+        last_processed=processed,
+        last_run_timestamp=time.time(),
+        more_work=int(more_work),
+    )
+    cache.set(key, stats, None)
+
+    jobs = cache.get(JOB_INDEX_KEY) or []
+    if job not in jobs:
+        cache.set(JOB_INDEX_KEY, sorted([*jobs, job]), None)
+
+
+def job_stats():
+    jobs = cache.get(JOB_INDEX_KEY) or []
+    stored = cache.get_many([f'{JOB_KEY_PREFIX}{job}' for job in jobs])
+    return {job: stored[f'{JOB_KEY_PREFIX}{job}'] for job in jobs if f'{JOB_KEY_PREFIX}{job}' in stored}
+
+
+def _compute_rollup():
+    now = timezone.now()
+    rollup = {'computed_at': time.time(), 'queues': {}}
+    for name, model in (('deposit', Deposit), ('withdrawal', Withdrawal)):
+        pending = model.objects.filter(status='PENDING').aggregate(
+            depth=Count('pk'), oldest=Min('created_at')
+        )
+        age = (now - pending['oldest']).total_seconds() if pending['oldest'] else 0.0
+        rollup['queues'][name] = (pending['depth'], age)
+
+    active = Investment.objects.filter(status='ACTIVE')
+    rollup['investments_due'] = active.filter(next_action_at__lte=now).count()
+    rollup['investments_expired'] = active.filter(next_action_at__lte=now, end_date__lte=now).count()
+    rollup['cursors'] = dict(JobCursor.objects.values_list('name', 'position'))
+    rollup['notifications_unread'] = AdminNotification.objects.filter(is_read=False).count()
+    return rollup
+
+
+def business_rollup():
+    ttl = getattr(settings, 'METRICS_ROLLUP_TTL', 30)
+    return single_flight('metrics_rollup', _compute_rollup, result_ttl=ttl, default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Exposition:
+    """Builder for the Prometheus text format"""
+
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, kind, help_text, samples):
+        """samples: iterable of (labels dict, value), or a single number"""
+        if isinstance(samples, (int, float)):
+            samples = [({}, samples)]
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.sample(name, labels, value)
+
+    def sample(self, name, labels, value):
+        label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        self.lines.append(f'{name}{{{label_text}}} {float(value)!r}' if label_text else f'{name} {float(value)!r}')
+
+    def histogram(self, name, help_text, series):
+        """series: iterable of (labels, bucket bounds, per-bucket counts, sum)"""
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} histogram')
+        for labels, bounds, counts, total in series:
+            cumulative = 0
+            for bound, count in zip([*bounds, '+Inf'], counts):
+                cumulative += count
+                self.sample(f'{name}_bucket', {**labels, 'le': bound}, cumulative)
+            self.sample(f'{name}_sum', labels, total)
+            self.sample(f'{name}_count', labels, cumulative)
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_metrics():
+    out = Exposition()
+
+    jobs = job_stats()
+    out.add('minersurb_job_last_duration_seconds', 'gauge', 'Wall time of the last run of a batch job',
+            [({'job': job}, s['last_duration_seconds']) for job, s in jobs.items()])
+    out.add('minersurb_job_last_rows_processed', 'gauge', 'Rows processed by the last run',
+            [({'job': job}, s['last_processed']) for job, s in jobs.items()])
+    out.add('minersurb_job_last_run_timestamp_seconds', 'gauge', 'Unix time the last run finished',
+            [({'job': job}, s['last_run_timestamp']) for job, s in jobs.items()])
+    out.add('minersurb_job_more_work', 'gauge', '1 if the last run stopped at its time budget',
+            [({'job': job}, s['more_work']) for job, s in jobs.items()])
+    out.add('minersurb_job_runs_total', 'counter', 'Completed runs of a batch job',
+            [({'job': job}, s['runs']) for job, s in jobs.items()])
+    out.add('minersurb_job_rows_processed_total', 'counter', 'Rows processed by a batch job',
+            [({'job': job}, s['rows']) for job, s in jobs.items()])
+
+    rollup = business_rollup()
+    if rollup:
+        out.add('minersurb_queue_depth', 'gauge', 'Pending deposits/withdrawals awaiting an admin',
+                [({'queue': name}, depth) for name, (depth, _) in rollup['queues'].items()])
+        out.add('minersurb_queue_oldest_age_seconds', 'gauge', 'Age of the oldest pending item',
+                [({'queue': name}, age) for name, (_, age) in rollup['queues'].items()])
+        out.add('minersurb_investments_due', 'gauge', 'Active investments whose next profit/completion is due',
+                rollup['investments_due'])
+        out.add('minersurb_investments_expired_pending', 'gauge', 'Matured investments not yet completed',
+                rollup['investments_expired'])
+        out.add('minersurb_job_cursor_position', 'gauge', 'Saved resume position of a chunked job (0 = idle)',
+                [({'job': name}, position) for name, position in rollup['cursors'].items()])
+        out.add('minersurb_admin_notifications_unread', 'gauge', 'Unread admin notifications',
+                rollup['notifications_unread'])
+        out.add('minersurb_rollup_timestamp_seconds', 'gauge', 'Unix time the backlog rollup was computed',
+                rollup['computed_at'])
+
+    views = histograms.snapshot()
+    bounds = [ms / 1000 for ms in histograms.buckets]
+    out.histogram('minersurb_request_duration_seconds', 'Request wall time per view (this process)', [
+        ({'view': view}, bounds, v['duration_buckets'], v['duration_ms_sum'] / 1000)
+        for view, v in views.items()
+    ])
+    out.add('minersurb_request_queries_total', 'counter', 'SQL statements executed per view (this process)',
+            [({'view': view}, v['queries_sum']) for view, v in views.items()])
+    out.add('minersurb_request_db_seconds_total', 'counter', 'Time spent in the database per view (this process)',
+            [({'view': view}, v['db_ms_sum'] / 1000) for view, v in views.items()])
+    out.add('minersurb_request_errors_total', 'counter', '5xx responses per view (this process)',
+            [({'view': view}, v['errors']) for view, v in views.items()])
+
+    out.add('minersurb_db_connection_mode', 'gauge', 'Configured DB_CONNECTION_MODE',
+            [({'mode': getattr(settings, 'DB_CONNECTION_MODE', 'persistent')}, 1)])
+
+    return out.render()
+
+
+def is_authorized(request):
+    """
+    True for `Authorization: Bearer METRICS_TOKEN`; without a token
+    configured, for staff (or anyone under DEBUG)
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        return hmac.compare_digest(supplied, token)
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    GET /api/metrics; requires `Authorization: Bearer METRICS_TOKEN`. Without
+    a token configured only staff (or anyone under DEBUG) can read it: queue
+    depths and job state are not public.
+    """
+    if not is_authorized(request):
+        if getattr(settings, 'METRICS_TOKEN', ''):
+            return HttpResponse('Unauthorized\n', status=401, content_type=CONTENT_TYPE)
+        return HttpResponse('Not Found\n', status=404, content_type=CONTENT_TYPE)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:28
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Least
+
+
+def schedule_active_investments(apps, schema_editor):
+    """Next action of existing ACTIVE rows: a day after their last credit"""
+    Investment = apps.get_model('dashboard', 'Investment')
+    Investment.objects.filter(status='ACTIVE').update(
+        next_action_at=Least(F('last_profit_date') + timedelta(days=1), F('end_date'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_plan_options_plan_created_at_plan_is_active_and_more'),
+        ('dashboard', '0005_joblease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='investment',
+            name='next_action_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['next_action_at'], name='investment_due_idx'),
+        ),
+        migrations.RunPython(schedule_active_investments, migrations.RunPython.noop),
+    ]
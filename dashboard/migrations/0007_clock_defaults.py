@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:10
+
+import core.clock
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_investment_next_action_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailyprofit',
+            name='date',
+            field=models.DateField(default=core.clock.today, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='investment',
+            name='last_profit_date',
+            field=models.DateTimeField(default=core.clock.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='investment',
+            name='start_date',
+            field=models.DateTimeField(default=core.clock.now, editable=False),
+        ),
+    ]
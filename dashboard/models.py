@@ -1,10 +1,20 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Least
 from django.conf import settings
 from django.utils import timezone
+from django.db.models.signals import post_save
 from decimal import Decimal
+from core import clock
+from core.mixins import DirtyFieldsMixin
+from . import balances
 
 # dashboard/models.py - CORRECTED VERSION
-class Investment(models.Model):
+
+# Time between two daily profit credits of an investment
+PROFIT_INTERVAL = timezone.timedelta(days=1)
+
+class Investment(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('ACTIVE', 'Active'),
         ('COMPLETED', 'Completed'),
@@ -18,29 +28,42 @@ class Investment(models.Model):
     total_profit = models.DecimalField(max_digits=15, decimal_places=2)
     profit_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     capital_returned = models.BooleanField(default=False)
-    start_date = models.DateTimeField(auto_now_add=True)
+    start_date = models.DateTimeField(default=clock.now, editable=False)
     end_date = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
-    last_profit_date = models.DateTimeField(auto_now_add=True)
+    last_profit_date = models.DateTimeField(default=clock.now, editable=False)
+    # When the batch jobs next owe this investment something (a daily profit
+    # credit or completion); only rows with next_action_at <= now are scanned
+    next_action_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_action_at'],
+                name='investment_due_idx',
+                condition=models.Q(status='ACTIVE'),
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         is_new = not self.pk
         
         if is_new:
             # Calculate end date
-            self.end_date = timezone.now() + timezone.timedelta(days=self.plan.duration_days)
+            now = clock.now()
+            self.end_date = now + timezone.timedelta(days=self.plan.duration_days)
             
             # Calculate profits
             self.daily_profit = (Decimal(str(self.amount)) * self.plan.daily_percentage) / Decimal('100')
             self.total_profit = self.daily_profit * Decimal(str(self.plan.duration_days))
+            self.next_action_at = min(now + PROFIT_INTERVAL, self.end_date)
             
-            # Check balance
-            if self.amount > self.user.active_balance:
-                raise ValueError(f"Insufficient active balance. Available: ${self.user.active_balance}, Required: ${self.amount}")
-            
-            # Move money from active_balance to investment
-            self.user.active_balance -= self.amount
-            self.user.save()
+            # Move money from active_balance to investment; raises
+            # InsufficientBalance (a ValueError) if it doesn't cover it
+            with transaction.atomic():
+                balances.debit(self.user, active_balance=self.amount)
+                super().save(*args, **kwargs)
+            return
         
         super().save(*args, **kwargs)
     
@@ -48,14 +71,14 @@ class Investment(models.Model):
     def days_remaining(self):
         if self.status != 'ACTIVE':
             return 0
-        days_left = (self.end_date - timezone.now()).days
+        days_left = (self.end_date - clock.now()).days
         return max(0, days_left)
     
     @property
     def profit_earned(self):
         if self.status != 'ACTIVE':
             return self.profit_paid
-        days_active = (timezone.now() - self.start_date).days
+        days_active = (clock.now() - self.start_date).days
         days_active = min(days_active, self.plan.duration_days)
         earned = self.daily_profit * days_active
         return min(earned, self.total_profit)
@@ -69,27 +92,41 @@ class Investment(models.Model):
         return self.amount + self.total_profit
     
     def complete_investment(self):
-        if self.status == 'ACTIVE':
-            self.status = 'COMPLETED'
+        if self.status != 'ACTIVE':
+            return False
+        
+        with transaction.atomic():
+            # Claim the completion first, so a concurrent caller (cron,
+            # scheduler, another overview) can't return the capital twice
+            claimed = Investment.objects.filter(pk=self.pk, status='ACTIVE').update(
+                status='COMPLETED',
+                capital_returned=True,
+                next_action_at=None,
+            )
+            if not claimed:
+                self.refresh_from_db(fields=['status', 'capital_returned', 'profit_paid', 'next_action_at'])
+                return False
             
-            # Calculate any remaining profit
-            remaining_profit = self.total_profit - self.profit_paid
+            # Calculate any remaining profit from the row we now hold
+            self.profit_paid = Investment.objects.values_list('profit_paid', flat=True).get(pk=self.pk)
+            remaining_profit = max(self.total_profit - self.profit_paid, Decimal('0'))
             if remaining_profit > 0:
-                self.user.account_balance += remaining_profit
-                self.user.total_earnings += remaining_profit
+                Investment.objects.filter(pk=self.pk).update(profit_paid=self.total_profit)
                 self.profit_paid = self.total_profit
             
-            # Return capital to account_balance
-            self.user.account_balance += self.amount
-            self.user.active_balance -= self.amount
-            
-            # Update investment
-            self.capital_returned = True
-            self.user.save()
-            self.save()
-            
-            return True
-        return False
+            # Return capital to account_balance; it already left
+            # active_balance when the investment was made
+            balances.credit(
+                self.user,
+                account_balance=self.amount + remaining_profit,
+                total_earnings=remaining_profit,
+            )
+        
+        self.status = 'COMPLETED'
+        self.capital_returned = True
+        self.next_action_at = None
+        self.mark_clean(['status', 'capital_returned', 'profit_paid', 'next_action_at'])
+        return True
     
     # ========== NEW REAL-TIME METHODS ==========
     def calculate_profit_up_to_now(self):
@@ -98,7 +135,7 @@ class Investment(models.Model):
             return self.profit_paid
         
         # Calculate seconds elapsed since start
-        now = timezone.now()
+        now = clock.now()
         seconds_elapsed = (now - self.start_date).total_seconds()
         days_elapsed = seconds_elapsed / (24 * 3600)
         
@@ -125,24 +162,31 @@ class Investment(models.Model):
         uncollected = profit_earned - self.profit_paid
         
         if uncollected > 0:
-            # Add to user's balance
-            self.user.account_balance += uncollected
-            self.user.total_earnings += uncollected
-            self.profit_paid = profit_earned
-            self.last_profit_date = timezone.now()
-            
-            # Create transaction record
-            from .models import Transaction
-            Transaction.objects.create(
-                user=self.user,
-                amount=uncollected,
-                transaction_type='profit',
-                description=f'Profit update - {self.plan.name}',
-                status='completed'
-            )
-            
-            self.user.save()
-            self.save()
+            now = clock.now()
+            with transaction.atomic():
+                # Compare-and-set on profit_paid: if a parallel request
+                # already collected this profit, credit nothing
+                collected = Investment.objects.filter(
+                    pk=self.pk, status='ACTIVE', profit_paid=self.profit_paid
+                ).update(profit_paid=profit_earned, last_profit_date=now)
+                if not collected:
+                    self.refresh_from_db(fields=['status', 'profit_paid', 'last_profit_date'])
+                    return Decimal('0')
+                
+                # Add to user's balance
+                balances.credit(self.user, account_balance=uncollected, total_earnings=uncollected)
+                self.profit_paid = profit_earned
+                self.last_profit_date = now
+                self.mark_clean(['profit_paid', 'last_profit_date'])
+                
+                # Create transaction record
+                Transaction.objects.create(
+                    user=self.user,
+                    amount=uncollected,
+                    transaction_type='profit',
+                    description=f'Profit update - {self.plan.name}',
+                    status='completed'
+                )
             
             # Check if investment completed
             if self.profit_paid >= self.total_profit:
@@ -157,7 +201,7 @@ class Investment(models.Model):
         if self.status != 'ACTIVE':
             return 100
         
-        now = timezone.now()
+        now = clock.now()
         total_duration = (self.end_date - self.start_date).total_seconds()
         elapsed = (now - self.start_date).total_seconds()
         
@@ -171,36 +215,44 @@ class Investment(models.Model):
         if self.status != 'ACTIVE':
             return False
         
-        today = timezone.now().date()
+        now = clock.now()
         
-        # Check if profit already added today
-        if not DailyProfit.objects.filter(
-            investment=self, 
-            date=today
-        ).exists():
+        with transaction.atomic():
+            # Real-time accrual may already have paid part of the day;
+            # never pay beyond total_profit
+            profit_paid = Investment.objects.values_list('profit_paid', flat=True).get(pk=self.pk)
+            credit = max(min(self.daily_profit, self.total_profit - profit_paid), Decimal('0'))
             
-            # Create daily profit record
-            DailyProfit.objects.create(
-                investment=self,
-                amount=self.daily_profit,
-                is_paid=True
-            )
+            # The (investment, date) unique constraint makes this the
+            # "not paid today yet" check, safe against parallel runs
+            try:
+                with transaction.atomic():
+                    DailyProfit.objects.create(
+                        investment=self,
+                        amount=credit,
+                        is_paid=True
+                    )
+            except IntegrityError:
+                return False
             
             # Add profit to user's account_balance
-            self.user.account_balance += self.daily_profit
-            self.user.total_earnings += self.daily_profit
-            self.profit_paid += self.daily_profit
-            self.last_profit_date = timezone.now()
+            balances.credit(self.user, account_balance=credit, total_earnings=credit)
+            
+            next_action_at = self.next_action_at
+            if next_action_at:
+                next_action_at = min(next_action_at + PROFIT_INTERVAL, self.end_date)
+            Investment.objects.filter(pk=self.pk).update(
+                profit_paid=Least(F('profit_paid') + self.daily_profit, F('total_profit')),
+                last_profit_date=now,
+                next_action_at=next_action_at,
+            )
+            self.refresh_from_db(fields=['profit_paid', 'last_profit_date', 'next_action_at'])
             
             # Update investment if completed
             if self.profit_paid >= self.total_profit:
                 self.complete_investment()
-            else:
-                self.user.save()
-                self.save()
-            
-            return True
-        return False
+        
+        return True
     
     def __str__(self):
         return f"{self.user.username} - {self.plan.name} - ${self.amount}"
@@ -219,13 +271,13 @@ class UserProfitTracker(models.Model):
         """Set first deposit date if not already set"""
         if not self.first_deposit_date or date < self.first_deposit_date:
             self.first_deposit_date = date
-            self.save()
+            self.save(update_fields=['first_deposit_date'])
     
     def update_first_investment(self, date):
         """Set first investment date if not already set"""
         if not self.first_investment_date or date < self.first_investment_date:
             self.first_investment_date = date
-            self.save()
+            self.save(update_fields=['first_investment_date'])
     
     def calculate_total_available_profit(self):
         """Calculate total profit available across all investments"""
@@ -270,7 +322,7 @@ class Transaction(models.Model):
         return f"{self.user.username} - {self.transaction_type} - ${self.amount}"
 
 
-class Deposit(models.Model):
+class Deposit(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('APPROVED', 'Approved'),
@@ -294,61 +346,72 @@ class Deposit(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     
     def save(self, *args, **kwargs):
-        is_new = not self.pk
-        old_status = None
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            return
         
-        if not is_new:
-            try:
-                old_deposit = Deposit.objects.get(pk=self.pk)
-                old_status = old_deposit.status
-            except Deposit.DoesNotExist:
-                pass
+        self._transitioned = False
+        old_status = self.get_loaded_value('status')
+        if old_status is None:
+            # Built by hand rather than loaded: ask the database
+            old_status = Deposit.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        if old_status == self.status:
+            super().save(*args, **kwargs)
+            return
         
-        super().save(*args, **kwargs)
+        if self.status == 'APPROVED':
+            self.approved_at = self.approved_at or clock.now()
+        elif old_status == 'APPROVED':
+            self.approved_at = None
         
-        if not is_new and old_status != self.status:
-            if self.status == 'APPROVED' and old_status != 'APPROVED':
-                self.user.active_balance += self.amount
-                self.user.save()
-                self.approved_at = timezone.now()
-                
-                # Send email
-                from django.core.mail import send_mail
-                send_mail(
-                    'Deposit Approved - Minersurb',
-                    f'Your deposit of ${self.amount} has been approved.',
-                    'noreply@minersurb.com',
-                    [self.user.email],
-                    fail_silently=True,
-                )
-                
-                super().save(update_fields=['approved_at'])
+        changed = list(kwargs.get('update_fields') or self.get_dirty_fields())
+        # The transition itself sets or clears approved_at
+        changed += [name for name in ('status', 'approved_at') if name not in changed]
+        with transaction.atomic():
+            # Compare-and-set on the status we loaded: of two parallel
+            # approvals only one moves the row out of PENDING
+            claimed = Deposit.objects.filter(pk=self.pk, status=old_status).update(**{
+                self._meta.get_field(name).attname: getattr(self, self._meta.get_field(name).attname)
+                for name in changed
+            })
+            if not claimed:
+                self.refresh_from_db()
+                return
+            self.mark_clean(changed)
+            self._transitioned = True
             
-            elif old_status == 'APPROVED' and self.status != 'APPROVED':
-                self.user.active_balance -= self.amount
-                self.user.save()
-                self.approved_at = None
-                super().save(update_fields=['approved_at'])
+            if self.status == 'APPROVED':
+                balances.credit(self.user, active_balance=self.amount)
+            elif old_status == 'APPROVED':
+                balances.adjust(self.user, active_balance=-self.amount)
+        
+        # The conditional UPDATE bypasses Model.save(), so notify receivers
+        post_save.send(
+            sender=Deposit, instance=self, created=False,
+            update_fields=frozenset(changed), raw=False, using=self._state.db,
+        )
+        
+        if self.status == 'APPROVED':
+            # Send email
+            from django.core.mail import send_mail
+            send_mail(
+                'Deposit Approved - Minersurb',
+                f'Your deposit of ${self.amount} has been approved.',
+                'noreply@minersurb.com',
+                [self.user.email],
+                fail_silently=True,
+            )
     
     def approve(self):
+        """Approve the deposit; False if another approval got there first"""
+        # save() credits the balance and emails the user on the transition
         self.status = 'APPROVED'
-        self.approved_at = timezone.now()
-        self.user.active_balance += self.amount
-        self.user.save()
-        self.save()
-        
-        from django.core.mail import send_mail
-        send_mail(
-            'Deposit Approved - Minersurb',
-            f'Your deposit of ${self.amount} has been approved.',
-            'noreply@minersurb.com',
-            [self.user.email],
-            fail_silently=True,
-        )
+        self.save(update_fields=['status', 'approved_at'])
+        return self._transitioned
     
     def cancel(self):
         self.status = 'CANCELLED'
-        self.save()
+        self.save(update_fields=['status', 'approved_at'])
         
         from django.core.mail import send_mail
         send_mail(
@@ -360,7 +423,7 @@ class Deposit(models.Model):
         )
 
 
-class Withdrawal(models.Model):
+class Withdrawal(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('APPROVED', 'Approved'),
@@ -376,27 +439,38 @@ class Withdrawal(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     
     def approve(self):
-        if self.user.account_balance >= self.amount:
-            self.status = 'APPROVED'
-            self.approved_at = timezone.now()
-            self.user.account_balance -= self.amount
-            self.user.save()
-            self.save()
-            
-            from django.core.mail import send_mail
-            send_mail(
-                'Withdrawal Approved - Minersurb',
-                f'Your withdrawal of ${self.amount} has been approved.',
-                'noreply@minersurb.com',
-                [self.user.email],
-                fail_silently=True,
-            )
-            return True
-        return False
+        now = clock.now()
+        try:
+            with transaction.atomic():
+                # Claim the withdrawal row first, then debit the user row
+                claimed = Withdrawal.objects.filter(pk=self.pk, status='PENDING').update(
+                    status='APPROVED',
+                    approved_at=now,
+                )
+                if not claimed:
+                    self.refresh_from_db(fields=['status', 'approved_at'])
+                    return False
+                balances.debit(self.user, account_balance=self.amount)
+        except balances.InsufficientBalance:
+            return False
+        
+        self.status = 'APPROVED'
+        self.approved_at = now
+        self.mark_clean(['status', 'approved_at'])
+        
+        from django.core.mail import send_mail
+        send_mail(
+            'Withdrawal Approved - Minersurb',
+            f'Your withdrawal of ${self.amount} has been approved.',
+            'noreply@minersurb.com',
+            [self.user.email],
+            fail_silently=True,
+        )
+        return True
     
     def cancel(self):
         self.status = 'CANCELLED'
-        self.save()
+        self.save(update_fields=['status'])
         
         from django.core.mail import send_mail
         send_mail(
@@ -411,7 +485,7 @@ class Withdrawal(models.Model):
 class DailyProfit(models.Model):
     investment = models.ForeignKey(Investment, on_delete=models.CASCADE, related_name='daily_profits')
     amount = models.DecimalField(max_digits=15, decimal_places=2)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=clock.today, editable=False)
     is_paid = models.BooleanField(default=False)
     
     class Meta:
@@ -419,4 +493,25 @@ class DailyProfit(models.Model):
         ordering = ['-date']
     
     def __str__(self):
-        return f"{self.investment.user.username} - ${self.amount} - {self.date}"
\ No newline at end of file
+        return f"{self.investment.user.username} - ${self.amount} - {self.date}"
+
+
+class JobCursor(models.Model):
+    """Resume point of a chunked batch job that ran out of time"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+
+class JobLease(models.Model):
+    """Expiring lock row used by JobLock where advisory locks are unavailable"""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name} held by {self.owner} until {self.expires_at}"
@@ -0,0 +1,104 @@
+# dashboard/scheduler.py
+"""
+In-memory completion schedule for the run_scheduler worker.
+
+The worker keeps the end_date of every ACTIVE investment maturing within the
+next `horizon` seconds in a heap, completes them in micro-batches as they
+fall due and refills the heap from the database every `refill_interval`
+seconds. Nothing is kept only in memory: a restarted worker rebuilds the
+heap from the ACTIVE rows, including the ones that matured while it was down.
+"""
+import heapq
+import logging
+from datetime import timedelta
+
+from core import clock
+
+from .engine import complete_investments
+from .models import Investment
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionScheduler:
+    """Min-heap of (end_date, investment id) for investments about to mature"""
+
+    def __init__(self, horizon=3600, refill_interval=300, batch_size=100):
+        self.horizon = timedelta(seconds=horizon)
+        self.refill_interval = timedelta(seconds=refill_interval)
+        self.batch_size = batch_size
+        self.heap = []
+        self.scheduled = set()
+        self.next_refill = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def refill(self, now):
+        """Load ACTIVE investments maturing before now + horizon"""
+        upcoming = (
+            Investment.objects
+            .filter(
+                status='ACTIVE',
+                next_action_at__lte=now + self.horizon,
+                end_date__lte=now + self.horizon,
+            )
+            .values_list('end_date', 'pk')
+        )
+        added = 0
+        for end_date, pk in upcoming.iterator():
+            if pk not in self.scheduled:
+                heapq.heappush(self.heap, (end_date, pk))
+                self.scheduled.add(pk)
+                added += 1
+
+        self.next_refill = now + self.refill_interval
+        logger.info(f"Scheduler refilled: {added} new, {len(self.heap)} pending")
+        return added
+
+    def pop_due(self, now):
+        """Remove and return up to batch_size investment ids due by now"""
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+            _, pk = heapq.heappop(self.heap)
+            self.scheduled.discard(pk)
+            due.append(pk)
+        return due
+
+    def reschedule(self, ids, at):
+        for pk in ids:
+            if pk not in self.scheduled:
+                heapq.heappush(self.heap, (at, pk))
+                self.scheduled.add(pk)
+
+    def run_once(self, now=None):
+        """Refill if due, then complete every investment due by now"""
+        now = now or clock.now()
+        if self.next_refill is None or now >= self.next_refill:
+            self.refill(now)
+
+        completed = 0
+        while True:
+            due = self.pop_due(now)
+            if not due:
+                break
+
+            progress = complete_investments(due, now=now)
+            if progress.contended:
+                # The cron cleanup is settling right now; retry shortly
+                self.reschedule(due, now + timedelta(seconds=5))
+                break
+            completed += progress.processed
+
+        if completed:
+            logger.info(f"Scheduler completed {completed} investments")
+        return completed
+
+    def seconds_until_next(self, now=None, max_wait=60):
+        """How long the worker can sleep before something needs doing"""
+        now = now or clock.now()
+        wake = [self.next_refill or now]
+        if self.heap:
+            wake.append(self.heap[0][0])
+        wait = (min(wake) - now).total_seconds()
+        return min(max(wait, 0), max_wait)
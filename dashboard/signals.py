@@ -1,53 +1,81 @@
 # dashboard/signals.py
-from django.db.models.signals import post_save, post_delete
+"""
+Keep UserProfitTracker in step with deposits, investments and profit.
+
+Each handler is a single UPDATE (an F() increment, or a CASE keeping the
+earlier of the stored and new first-* date) rather than GET + save; it
+only INSERTs when the user has no tracker yet. Handlers
+return early for saves that can't affect the tracker. The bulk engines
+write with .update()/bulk_create(), which fire no signals, and maintain the
+tracker themselves (engine.sync_profit_trackers).
+"""
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.utils import timezone
+from core import clock
 from core.models import User
 from .models import UserProfitTracker, Deposit, Investment, Transaction
-from decimal import Decimal
+
+
+def _update_tracker(user_id, defaults, **changes):
+    """
+    UPDATE the user's tracker; if the user has none yet, create it with
+    `defaults` (ignoring a concurrent insert by another request).
+    """
+    if UserProfitTracker.objects.filter(user_id=user_id).update(**changes):
+        return
+    UserProfitTracker.objects.bulk_create(
+        [UserProfitTracker(user_id=user_id, **defaults)], ignore_conflicts=True
+    )
+
+
+def record_first_date(user_id, field, date):
+    """Set tracker.<field> to `date` if it is unset or later"""
+    # The row always matches, so an existing tracker never falls through
+    # to the INSERT just because its date is already earlier
+    earliest = Case(
+        When(Q(**{f'{field}__isnull': True}) | Q(**{f'{field}__gt': date}), then=Value(date)),
+        default=F(field),
+    )
+    _update_tracker(user_id, {field: date}, **{field: earliest})
+
+
+def record_profit(user_id, amount, count=1):
+    """Add `count` profit transactions totalling `amount` to the tracker"""
+    _update_tracker(
+        user_id,
+        {'total_profit_earned': amount, 'profit_calculation_count': count},
+        total_profit_earned=F('total_profit_earned') + amount,
+        profit_calculation_count=F('profit_calculation_count') + count,
+        last_profit_calculation=clock.now(),
+    )
+
 
 @receiver(post_save, sender=User)
-def create_user_profit_tracker(sender, instance, created, **kwargs):
+def create_user_profit_tracker(sender, instance, created, raw=False, **kwargs):
     """Create profit tracker when user is created"""
-    if created:
+    if created and not raw:
         UserProfitTracker.objects.create(user=instance)
 
 @receiver(post_save, sender=Deposit)
-def update_deposit_tracker(sender, instance, created, **kwargs):
+def update_deposit_tracker(sender, instance, created, raw=False, update_fields=None, **kwargs):
     """Update profit tracker when deposit is approved"""
-    if instance.status == 'APPROVED':
-        try:
-            tracker = UserProfitTracker.objects.get(user=instance.user)
-            tracker.update_first_deposit(instance.created_at)
-            tracker.save()
-        except UserProfitTracker.DoesNotExist:
-            tracker = UserProfitTracker.objects.create(user=instance.user)
-            tracker.update_first_deposit(instance.created_at)
+    if raw or instance.status != 'APPROVED':
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    record_first_date(instance.user_id, 'first_deposit_date', instance.created_at)
 
 @receiver(post_save, sender=Investment)
-def update_investment_tracker(sender, instance, created, **kwargs):
+def update_investment_tracker(sender, instance, created, raw=False, **kwargs):
     """Update profit tracker when investment is created"""
-    if created:
-        try:
-            tracker = UserProfitTracker.objects.get(user=instance.user)
-            tracker.update_first_investment(timezone.now())
-            tracker.save()
-        except UserProfitTracker.DoesNotExist:
-            tracker = UserProfitTracker.objects.create(user=instance.user)
-            tracker.update_first_investment(timezone.now())
+    if created and not raw:
+        record_first_date(instance.user_id, 'first_investment_date', instance.start_date)
 
 @receiver(post_save, sender=Transaction)
-def update_profit_earned(sender, instance, created, **kwargs):
+def update_profit_earned(sender, instance, created, raw=False, **kwargs):
     """Update total profit earned in tracker"""
-    if created and instance.transaction_type == 'profit' and instance.status == 'completed':
-        try:
-            tracker = UserProfitTracker.objects.get(user=instance.user)
-            tracker.total_profit_earned += instance.amount
-            tracker.profit_calculation_count += 1
-            tracker.save()
-        except UserProfitTracker.DoesNotExist:
-            tracker = UserProfitTracker.objects.create(
-                user=instance.user,
-                total_profit_earned=instance.amount,
-                profit_calculation_count=1
-            )
\ No newline at end of file
+    if raw or not created:
+        return
+    if instance.transaction_type == 'profit' and instance.status == 'completed':
+        record_profit(instance.user_id, instance.amount)
@@ -1,47 +1,45 @@
 from celery import shared_task
 from django.utils import timezone
-from dashboard.models import Investment
+from dashboard.engine import TimeBudget, distribute_daily_profits
+from dashboard.locks import shard_name
+from dashboard.telemetry import job_run
 import logging
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def distribute_profits():
+def distribute_profits(shard_index=None, shard_count=None):
     """
-    Task to distribute daily profits to all active investments
+    Task to distribute daily profits to all active investments.
+    Runs within BATCH_TIME_BUDGET and re-queues itself while work remains.
+    Pass shard_index/shard_count to split the work across workers.
     """
     logger.info(f"[{timezone.now()}] Starting profit distribution task")
     
     try:
-        active_investments = Investment.objects.filter(status='ACTIVE')
-        total_distributed = 0
-        count_success = 0
-        count_failed = 0
+        shard = (shard_index, shard_count) if shard_count else None
+        with job_run(shard_name('distribute_daily_profits', shard), trigger='celery') as run:
+            progress = distribute_daily_profits(budget=TimeBudget.from_settings(), shard=shard)
+            run.record(progress)
         
-        for investment in active_investments:
-            try:
-                if investment.add_daily_profit():
-                    count_success += 1
-                    total_distributed += float(investment.daily_profit)
-                    logger.info(f"Added profit to Investment {investment.id}: ${investment.daily_profit}")
-                else:
-                    count_failed += 1
-                    logger.warning(f"Failed to add profit to Investment {investment.id}")
-            except Exception as e:
-                count_failed += 1
-                logger.error(f"Error processing Investment {investment.id}: {str(e)}")
-                continue
+        if progress.contended:
+            logger.warning(f"{progress.job} is already running elsewhere; skipping")
+            return f"Stopped: {progress.job} is locked by another run ({progress.processed} processed)"
         
         result_message = (
             f"Profit distribution completed: "
-            f"Distributed ${total_distributed:.2f} to {count_success} investments. "
-            f"Failed: {count_failed}"
+            f"Distributed profit to {progress.processed} investments "
+            f"in {run.duration:.2f}s ({run.queries.count} queries)."
         )
         
+        if progress.more_work:
+            result_message += f" Resuming after investment #{progress.cursor}."
+            distribute_profits.delay(shard_index, shard_count)
+        
         logger.info(result_message)
         return result_message
         
     except Exception as e:
         error_message = f"Profit distribution task failed: {str(e)}"
         logger.error(error_message)
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,164 @@
+# dashboard/telemetry.py
+"""
+Timing, query and memory telemetry for batch jobs.
+
+Every batch entry point (the distribute_profits task and command, the cron
+cleanup and the completion scheduler) runs its work inside job_run(),
+which records:
+
+- wall time and SQL statements per phase. Entry points name their steps
+  with phase(); engine.run_chunks adds `select` and `process` phases for
+  every chunk, nested under the caller's phase;
+- rows processed (record(progress)) and so rows per second;
+- total queries and database time;
+- the tracemalloc peak, when JOB_TELEMETRY_TRACEMALLOC is on.
+
+On exit the run is saved to the admin_panel JobRun table, which keeps the
+newest JOB_RUN_KEEP rows, and logged as one JSON line. This happens whether
+the job finished, stopped at its budget, found its lock taken or raised.
+The admin Job Runs page charts these rows, so a nightly run that slows
+down as the book grows is visible long before it hits the time budget.
+"""
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from core.request_metrics import QueryStats
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('job_run', default=None)
+
+
+class JobTelemetry:
+    """What job_run() measures for one run"""
+
+    def __init__(self, job, trigger=''):
+        self.job = job
+        self.trigger = trigger
+        self.started_at = timezone.now()
+        self.duration = 0.0
+        self.rows = 0
+        self.more_work = False
+        self.contended = False
+        self.error = ''
+        self.peak_memory = None
+        self.queries = QueryStats()
+        self.phases = {}
+        self._open_phases = []
+
+    def record(self, progress):
+        """Fold an engine.JobProgress into the run"""
+        self.rows += progress.processed
+        self.more_work |= progress.more_work
+        self.contended |= progress.contended
+
+    @contextmanager
+    def phase(self, name):
+        """Time a step; nested phases are named outer.inner"""
+        self._open_phases.append(name)
+        key = '.'.join(self._open_phases)
+        queries_before = self.queries.count
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(key, {'seconds': 0.0, 'queries': 0, 'calls': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['queries'] += self.queries.count - queries_before
+            entry['calls'] += 1
+            self._open_phases.pop()
+
+    @property
+    def status(self):
+        if self.error:
+            return 'FAILED'
+        if self.contended:
+            return 'CONTENDED'
+        return 'PARTIAL' if self.more_work else 'SUCCESS'
+
+    def as_dict(self):
+        return {
+            'job': self.job,
+            'trigger': self.trigger,
+            'status': self.status,
+            'duration_ms': round(self.duration * 1000, 2),
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / self.duration, 1) if self.duration else 0.0,
+            'queries': self.queries.count,
+            'db_ms': round(self.queries.ms, 2),
+            'peak_memory_bytes': self.peak_memory,
+            'phases': {
+                name: {**entry, 'seconds': round(entry['seconds'], 4)}
+                for name, entry in self.phases.items()
+            },
+        }
+
+    def save(self):
+        """Store the run as a JobRun row; never raises"""
+        JobRun = apps.get_model('admin_panel', 'JobRun')
+        data = self.as_dict()
+        del data['rows_per_second']
+        try:
+            JobRun.objects.create(started_at=self.started_at, error=self.error, **data)
+            JobRun.trim(getattr(settings, 'JOB_RUN_KEEP', 2000))
+        except DatabaseError as e:
+            logger.error(f'Could not store telemetry for {self.job}: {e}')
+
+
+def current():
+    """The JobTelemetry of the run in progress, if any"""
+    return _current.get()
+
+
+def phase(name):
+    """JobTelemetry.phase() on the current run; a no-op outside job_run()"""
+    run = _current.get()
+    return run.phase(name) if run else nullcontext()
+
+
+@contextmanager
+def job_run(job, trigger='', keep_idle=True, trace_memory=None):
+    """
+    Measure the enclosed batch work as one run of `job` and save it.
+    keep_idle=False skips saving runs that processed nothing, for entry
+    points that poll frequently. trace_memory overrides
+    JOB_TELEMETRY_TRACEMALLOC.
+    """
+    run = JobTelemetry(job, trigger)
+    token = _current.set(run)
+    trace = getattr(settings, 'JOB_TELEMETRY_TRACEMALLOC', True) if trace_memory is None else trace_memory
+    started_tracing = trace and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace:
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(run.queries))
+            yield run
+    except Exception as e:
+        run.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        run.duration = time.perf_counter() - start
+        if trace:
+            run.peak_memory = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        _current.reset(token)
+
+        if keep_idle or run.rows or run.error:
+            logger.info('job ' + json.dumps(run.as_dict()))
+            run.save()
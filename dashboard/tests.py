@@ -1,9 +1,25 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core import mail
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from datetime import timedelta
+import time
+from unittest import mock
 from decimal import Decimal
-from .models import Deposit, Investment, Withdrawal, DailyProfit
+from .models import (
+    Deposit, Investment, Withdrawal, DailyProfit, JobCursor, JobLease, Transaction, UserProfitTracker,
+)
+from . import balances
+from .locks import JobLock
+from .scheduler import CompletionScheduler
+from .engine import (
+    TimeBudget, complete_expired_investments, distribute_daily_profits, sync_profit_trackers,
+)
 from core.models import Plan
+from core.tests import PLAIN_STORAGES
 
 User = get_user_model()
 
@@ -221,9 +237,10 @@ class InvestmentFlowTests(TestCase):
         self.assertEqual(investment.status, 'COMPLETED')
         self.assertTrue(investment.capital_returned)
         
-        # Capital should return to account_balance
+        # Capital should return to account_balance; it already left
+        # active_balance when the investment was made
         expected_account_balance = initial_account_balance + investment.amount
-        expected_active_balance = initial_active_balance - investment.amount
+        expected_active_balance = initial_active_balance
         
         self.assertEqual(self.user.account_balance, expected_account_balance)
         self.assertEqual(self.user.active_balance, expected_active_balance)
@@ -301,6 +318,1077 @@ class InvestmentFlowTests(TestCase):
         
         print(f"✅ Correctly rejected withdrawal (insufficient funds)")
 
+class CronCleanupTests(TestCase):
+    """Test the set-based daily cleanup"""
+    
+    def setUp(self):
+        self.plan = Plan.objects.create(
+            name='BASIC',
+            min_amount=Decimal('100.00'),
+            daily_percentage=Decimal('3.00'),
+            duration_days=30,
+        )
+    
+    def make_expired_investments(self, username, count, amount=Decimal('100.00')):
+        user = User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='testpass123',
+            active_balance=amount * count,
+        )
+        for _ in range(count):
+            Investment.objects.create(user=user, plan=self.plan, amount=amount)
+        Investment.objects.filter(user=user).update(
+            end_date=timezone.now() - timedelta(hours=1),
+            next_action_at=timezone.now() - timedelta(hours=1),
+            profit_paid=Decimal('60.00'),
+        )
+        return user
+    
+    def test_expired_investments_are_settled(self):
+        """Set-based completion credits users exactly like complete_investment()"""
+        alice = self.make_expired_investments('alice', 2)
+        bob = self.make_expired_investments('bob', 1)
+        reference = self.make_expired_investments('reference', 2)
+        
+        for investment in Investment.objects.filter(user=reference):
+            investment.complete_investment()
+        
+        progress = complete_expired_investments(chunk_size=2)
+        
+        self.assertEqual(progress.processed, 3)
+        self.assertFalse(progress.more_work)
+        alice.refresh_from_db()
+        bob.refresh_from_db()
+        reference.refresh_from_db()
+        
+        # 90 profit per investment, 60 already paid -> 30 remaining + 100 capital
+        self.assertEqual(alice.account_balance, Decimal('260.00'))
+        self.assertEqual(alice.total_earnings, Decimal('60.00'))
+        self.assertEqual(bob.account_balance, Decimal('130.00'))
+        for field in ('account_balance', 'active_balance', 'total_earnings'):
+            self.assertEqual(getattr(alice, field), getattr(reference, field))
+        
+        for investment in Investment.objects.all():
+            self.assertEqual(investment.status, 'COMPLETED')
+            self.assertTrue(investment.capital_returned)
+            self.assertEqual(investment.profit_paid, investment.total_profit)
+        
+        # Nothing left to do on a second run
+        self.assertEqual(complete_expired_investments().processed, 0)
+    
+    def test_query_count_does_not_grow_with_rows(self):
+        """A chunk costs the same number of queries for 1 or many users"""
+        complete_expired_investments()  # creates the job cursor
+        self.make_expired_investments('small', 1)
+        with CaptureQueriesContext(connection) as small_run:
+            complete_expired_investments()
+        
+        for i in range(5):
+            self.make_expired_investments(f'user{i}', 2)
+        with CaptureQueriesContext(connection) as large_run:
+            complete_expired_investments()
+        
+        self.assertEqual(len(small_run), len(large_run))
+    
+    def test_tracker_sync_only_touches_drifted_rows(self):
+        """Trackers are aligned with profit paid in a single statement"""
+        alice = self.make_expired_investments('alice', 2)
+        self.make_expired_investments('bob', 1)
+        UserProfitTracker.objects.filter(user__username='bob').update(
+            total_profit_earned=Decimal('60.00')
+        )
+        
+        with self.assertNumQueries(1):
+            updated = sync_profit_trackers()
+        
+        self.assertEqual(updated, 1)
+        tracker = UserProfitTracker.objects.get(user=alice)
+        self.assertEqual(tracker.total_profit_earned, Decimal('120.00'))
+    
+    def test_budget_stops_at_chunk_boundary_and_resumes(self):
+        """An exhausted budget persists the cursor and the next run resumes"""
+        for i in range(5):
+            self.make_expired_investments(f'user{i}', 1)
+        
+        progress = complete_expired_investments(budget=ChunkBudget(chunks=2), chunk_size=2)
+        
+        self.assertEqual(progress.processed, 4)
+        self.assertTrue(progress.more_work)
+        self.assertEqual(JobCursor.objects.get(name=progress.job).position, progress.cursor)
+        self.assertEqual(Investment.objects.filter(status='ACTIVE').count(), 1)
+        
+        progress = complete_expired_investments(chunk_size=2)
+        
+        self.assertEqual(progress.processed, 1)
+        self.assertFalse(progress.more_work)
+        self.assertEqual(JobCursor.objects.get(name=progress.job).position, 0)
+    
+    def test_cron_endpoint_reports_more_work(self):
+        """The cron view surfaces the more_work flag"""
+        self.make_expired_investments('alice', 1)
+        
+        with override_settings(BATCH_TIME_BUDGET=0):
+            response = self.client.post('/api/cron/cleanup')
+        self.assertTrue(response.json()['more_work'])
+        
+        response = self.client.post('/api/cron/cleanup')
+        self.assertFalse(response.json()['more_work'])
+        self.assertEqual(response.json()['data']['expired_investments_processed'], 1)
+
+
+class ChunkBudget(TimeBudget):
+    """Budget that runs out after a fixed number of chunks"""
+    
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = chunks
+    
+    def record_chunk(self, seconds):
+        self.chunks -= 1
+    
+    def exhausted(self):
+        return self.chunks <= 0
+
+
+class ActiveInvestmentFixtures:
+    """Plan and one-investment users shared by the batch job tests"""
+    
+    def setUp(self):
+        self.plan = Plan.objects.create(
+            name='BASIC',
+            min_amount=Decimal('100.00'),
+            daily_percentage=Decimal('3.00'),
+            duration_days=30,
+        )
+    
+    def make_investment(self, username, profit_paid=Decimal('0.00')):
+        user = User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='testpass123',
+            active_balance=Decimal('100.00'),
+        )
+        investment = Investment.objects.create(user=user, plan=self.plan, amount=Decimal('100.00'))
+        Investment.objects.filter(pk=investment.pk).update(
+            profit_paid=profit_paid,
+            next_action_at=timezone.now() - timedelta(minutes=1),
+        )
+        return user
+
+
+class DistributeProfitsTests(ActiveInvestmentFixtures, TestCase):
+    """Test the set-based daily profit distribution"""
+    
+    def test_matches_add_daily_profit(self):
+        """Balances match the per-row legacy method, including completion"""
+        for prefix, profit_paid in (('fresh', Decimal('0.00')), ('last', Decimal('87.00'))):
+            engine_user = self.make_investment(f'{prefix}_engine', profit_paid)
+            reference = self.make_investment(f'{prefix}_reference', profit_paid)
+            
+            reference.investments.get().add_daily_profit()
+            distribute_daily_profits()
+            
+            engine_user.refresh_from_db()
+            reference.refresh_from_db()
+            for field in ('account_balance', 'active_balance', 'total_earnings'):
+                self.assertEqual(getattr(engine_user, field), getattr(reference, field))
+            engine_investment = engine_user.investments.get()
+            reference_investment = reference.investments.get()
+            self.assertEqual(engine_investment.status, reference_investment.status)
+            self.assertEqual(engine_investment.profit_paid, reference_investment.profit_paid)
+    
+    def test_part_accrued_investment_is_not_overpaid(self):
+        """A day already partly paid by real-time accrual only gets the remainder"""
+        engine_user = self.make_investment('engine', Decimal('88.50'))
+        reference = self.make_investment('reference', Decimal('88.50'))
+        
+        distribute_daily_profits()
+        reference.investments.get().add_daily_profit()
+        
+        for user in (engine_user, reference):
+            user.refresh_from_db()
+            investment = user.investments.get()
+            self.assertEqual(investment.profit_paid, investment.total_profit)
+            self.assertEqual(investment.status, 'COMPLETED')
+            self.assertEqual(investment.daily_profits.get().amount, Decimal('1.50'))
+            self.assertEqual(user.total_earnings, Decimal('1.50'))
+            self.assertEqual(user.account_balance, Decimal('101.50'))
+    
+    def test_pays_once_per_day(self):
+        """A second run on the same day is a no-op"""
+        user = self.make_investment('alice')
+        
+        self.assertEqual(distribute_daily_profits().processed, 1)
+        self.assertEqual(distribute_daily_profits().processed, 0)
+        
+        user.refresh_from_db()
+        self.assertEqual(user.account_balance, Decimal('3.00'))
+        self.assertEqual(DailyProfit.objects.count(), 1)
+    
+    def test_only_due_investments_are_read(self):
+        """Rows whose next_action_at is in the future are never selected"""
+        due = self.make_investment('due').investments.get()
+        not_due = self.make_investment('not_due').investments.get()
+        Investment.objects.filter(pk=not_due.pk).update(
+            next_action_at=timezone.now() + timedelta(hours=3)
+        )
+        
+        with CaptureQueriesContext(connection) as queries:
+            progress = distribute_daily_profits()
+        
+        self.assertEqual(progress.processed, 1)
+        self.assertTrue(any('next_action_at' in q['sql'] for q in queries))
+        self.assertFalse(DailyProfit.objects.filter(investment=not_due).exists())
+        
+        # The paid row is rescheduled a day later
+        previous = due.next_action_at
+        due.refresh_from_db()
+        self.assertEqual(due.next_action_at, previous + timedelta(days=1))
+    
+    def test_new_investments_are_scheduled(self):
+        """Creating an investment schedules its first credit a day later"""
+        user = User.objects.create_user(
+            username='carol', email='carol@example.com', password='testpass123',
+            active_balance=Decimal('100.00'),
+        )
+        investment = Investment.objects.create(user=user, plan=self.plan, amount=Decimal('100.00'))
+        
+        self.assertGreaterEqual(investment.next_action_at - investment.start_date, timedelta(hours=23))
+        self.assertEqual(distribute_daily_profits().processed, 0)
+
+
+
+class JobLockTests(ActiveInvestmentFixtures, TestCase):
+    """Test that overlapping batch runs are excluded"""
+    
+    def test_contended_run_does_nothing(self):
+        """A run that finds the job locked reports contention and skips"""
+        self.make_investment('alice')
+        
+        with JobLock('distribute_daily_profits') as lock:
+            self.assertTrue(lock.acquired)
+            progress = distribute_daily_profits()
+        
+        self.assertTrue(progress.contended)
+        self.assertEqual(progress.processed, 0)
+        self.assertEqual(DailyProfit.objects.count(), 0)
+        
+        # Released on exit, so the next run goes ahead
+        self.assertEqual(distribute_daily_profits().processed, 1)
+    
+    def test_expired_lease_is_taken_over(self):
+        """A crashed holder blocks the job only until its lease expires"""
+        crashed = JobLock('cleanup')
+        self.assertTrue(crashed.acquire())
+        self.assertFalse(JobLock('cleanup').acquire())
+        
+        JobLease.objects.filter(name='cleanup').update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        successor = JobLock('cleanup')
+        self.assertTrue(successor.acquire())
+        self.assertFalse(crashed.renew())
+        
+        successor.release()
+        self.assertFalse(JobLease.objects.exists())
+    
+    @override_settings(DB_CONNECTION_MODE='serverless')
+    def test_serverless_mode_uses_lease_row(self):
+        """Behind a transaction pooler the lock never takes a session-level advisory lock"""
+        postgres = mock.MagicMock(vendor='postgresql')
+        with mock.patch('dashboard.locks.connection', postgres):
+            lock = JobLock('cleanup')
+            self.assertFalse(lock.use_advisory)
+            self.assertTrue(lock.acquire())
+            self.assertTrue(JobLease.objects.filter(name='cleanup').exists())
+            lock.release()
+        
+        postgres.cursor.assert_not_called()
+        self.assertFalse(JobLease.objects.exists())
+    
+    def test_shards_split_users(self):
+        """Shards lock independently and together cover every user once"""
+        for i in range(6):
+            self.make_investment(f'user{i}')
+        
+        with JobLock('distribute_daily_profits[0/2]'):
+            first = distribute_daily_profits(shard=(0, 2))
+            second = distribute_daily_profits(shard=(1, 2))
+        
+        self.assertTrue(first.contended)
+        self.assertFalse(second.contended)
+        paid_users = set(DailyProfit.objects.values_list('investment__user_id', flat=True))
+        self.assertEqual(len(paid_users), second.processed)
+        self.assertTrue(all(user_id % 2 == 1 for user_id in paid_users))
+        
+        third = distribute_daily_profits(shard=(0, 2))
+        self.assertEqual(second.processed + third.processed, 6)
+        self.assertEqual(DailyProfit.objects.count(), 6)
+
+
+class CompletionSchedulerTests(ActiveInvestmentFixtures, TestCase):
+    """Test the in-memory completion schedule of the run_scheduler worker"""
+    
+    def mature_at(self, user, when):
+        Investment.objects.filter(user=user).update(end_date=when, next_action_at=when)
+    
+    def test_completes_investments_at_their_due_time(self):
+        """Only matured investments are completed; later ones wait in the heap"""
+        now = timezone.now()
+        soon = self.make_investment('soon')
+        later = self.make_investment('later')
+        self.mature_at(soon, now - timedelta(seconds=1))
+        self.mature_at(later, now + timedelta(minutes=10))
+        
+        scheduler = CompletionScheduler(horizon=3600)
+        self.assertEqual(scheduler.run_once(now), 1)
+        self.assertEqual(len(scheduler), 1)
+        self.assertEqual(soon.investments.get().status, 'COMPLETED')
+        self.assertEqual(later.investments.get().status, 'ACTIVE')
+        self.assertEqual(scheduler.seconds_until_next(now, max_wait=3600), 300)
+        
+        self.assertEqual(scheduler.run_once(now + timedelta(minutes=11)), 1)
+        self.assertEqual(later.investments.get().status, 'COMPLETED')
+    
+    def test_restart_picks_up_missed_completions(self):
+        """A fresh scheduler rebuilds its heap from the database"""
+        user = self.make_investment('alice')
+        self.mature_at(user, timezone.now() - timedelta(hours=5))
+        
+        self.assertEqual(CompletionScheduler().run_once(), 1)
+        # Already completed rows are not loaded again
+        self.assertEqual(CompletionScheduler().run_once(), 0)
+    
+    def test_contention_reschedules_batch(self):
+        """While the cron holds the completion lock, due ids are retried"""
+        user = self.make_investment('alice')
+        self.mature_at(user, timezone.now() - timedelta(seconds=1))
+        scheduler = CompletionScheduler()
+        
+        with JobLock('complete_expired_investments'):
+            self.assertEqual(scheduler.run_once(), 0)
+        self.assertEqual(len(scheduler), 1)
+        
+        self.assertEqual(scheduler.run_once(timezone.now() + timedelta(seconds=10)), 1)
+
+
+
+class BalanceServiceTests(TestCase):
+    """Test that balance changes are atomic and can't be applied twice"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='alice',
+            email='alice@example.com',
+            password='testpass123',
+            account_balance=Decimal('100.00'),
+        )
+    
+    def test_debit_is_conditional(self):
+        """A debit larger than the balance changes nothing"""
+        stale = User.objects.get(pk=self.user.pk)
+        balances.debit(self.user, account_balance=Decimal('80.00'))
+        
+        # The stale copy still believes 100 is available; the database knows better
+        with self.assertRaises(balances.InsufficientBalance) as context:
+            balances.debit(stale, account_balance=Decimal('80.00'))
+        
+        self.assertEqual(context.exception.available, Decimal('20.00'))
+        self.assertEqual(self.user.account_balance, Decimal('20.00'))
+    
+    def test_credit_is_an_atomic_increment(self):
+        """Credits from stale instances don't overwrite each other"""
+        first = User.objects.get(pk=self.user.pk)
+        second = User.objects.get(pk=self.user.pk)
+        
+        balances.credit(first, account_balance=Decimal('10.00'))
+        balances.credit(second, account_balance=Decimal('5.00'))
+        
+        self.assertEqual(second.account_balance, Decimal('115.00'))
+    
+    def test_withdrawal_double_approval_debits_once(self):
+        """A double-clicked approval only takes the money once"""
+        withdrawal = Withdrawal.objects.create(
+            user=self.user, amount=Decimal('60.00'), crypto_address='addr', crypto_type='BTC'
+        )
+        duplicate = Withdrawal.objects.get(pk=withdrawal.pk)
+        
+        self.assertTrue(withdrawal.approve())
+        self.assertFalse(duplicate.approve())
+        self.assertEqual(duplicate.status, 'APPROVED')
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.account_balance, Decimal('40.00'))
+    
+    def test_deposit_double_approval_credits_once(self):
+        """Approving the same deposit twice credits it once"""
+        deposit = Deposit.objects.create(user=self.user, amount=Decimal('50.00'), crypto_type='BTC')
+        duplicate = Deposit.objects.get(pk=deposit.pk)
+        
+        self.assertTrue(deposit.approve())
+        self.assertFalse(duplicate.approve())
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_balance, Decimal('50.00'))
+        self.assertEqual(len(mail.outbox), 1)
+    
+    @override_settings(STORAGES=PLAIN_STORAGES)
+    def test_lost_approval_race_reports_already_processed(self):
+        """The admin panel doesn't log or announce an approval that lost the race"""
+        from admin_panel.models import AdminLog
+        deposit = Deposit.objects.create(user=self.user, amount=Decimal('50.00'), crypto_type='BTC')
+        Deposit.objects.get(pk=deposit.pk).approve()
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+        
+        with mock.patch('admin_panel.views.get_object_or_404', return_value=deposit):
+            response = self.client.post(f'/admin-panel/deposits/{deposit.pk}/approve/', follow=True)
+        
+        self.assertContains(response, f'Deposit #{deposit.pk} was already processed.')
+        self.assertFalse(AdminLog.objects.filter(action='DEPOSIT_APPROVE').exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_balance, Decimal('50.00'))
+    
+    def test_deposit_approval_is_one_update_of_changed_columns(self):
+        """No read-before-write: the transition is one conditional UPDATE"""
+        Deposit.objects.create(user=self.user, amount=Decimal('50.00'), crypto_type='BTC')
+        deposit = Deposit.objects.get(user=self.user)
+        
+        with CaptureQueriesContext(connection) as queries:
+            deposit.approve()
+        
+        deposit_queries = [q['sql'] for q in queries if 'dashboard_deposit' in q['sql']]
+        self.assertEqual(len(deposit_queries), 1)
+        self.assertTrue(deposit_queries[0].startswith('UPDATE'))
+        self.assertNotIn('crypto_type', deposit_queries[0])
+        self.assertFalse(deposit.is_dirty())
+    
+    def test_status_only_save_writes_approved_at(self):
+        """save(update_fields=['status']) still stores and clears approved_at"""
+        deposit = Deposit.objects.create(user=self.user, amount=Decimal('50.00'), crypto_type='BTC')
+        
+        deposit.status = 'APPROVED'
+        deposit.save(update_fields=['status'])
+        self.assertIsNotNone(Deposit.objects.get(pk=deposit.pk).approved_at)
+        
+        deposit.status = 'PENDING'
+        deposit.save(update_fields=['status'])
+        self.assertIsNone(Deposit.objects.get(pk=deposit.pk).approved_at)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_balance, Decimal('0.00'))
+    
+    def test_admin_change_form_approval(self):
+        """Approving in the Django admin change form credits and stores approved_at"""
+        deposit = Deposit.objects.create(user=self.user, amount=Decimal('50.00'), crypto_type='BTC')
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+        
+        response = self.client.post(f'/admin/dashboard/deposit/{deposit.pk}/change/', {
+            'user': self.user.pk, 'amount': '50.00', 'crypto_type': 'BTC',
+            'transaction_hash': '', 'wallet_address': '', 'status': 'APPROVED',
+        })
+        
+        self.assertEqual(response.status_code, 302)
+        deposit.refresh_from_db()
+        self.assertEqual(deposit.status, 'APPROVED')
+        self.assertIsNotNone(deposit.approved_at)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_balance, Decimal('50.00'))
+    
+    def test_investment_completion_returns_capital_once(self):
+        """Completing the same investment from two instances pays once"""
+        plan = Plan.objects.create(
+            name='BASIC', min_amount=Decimal('100.00'), daily_percentage=Decimal('3.00'), duration_days=30
+        )
+        self.user.active_balance = Decimal('100.00')
+        self.user.save()
+        investment = Investment.objects.create(user=self.user, plan=plan, amount=Decimal('100.00'))
+        duplicate = Investment.objects.get(pk=investment.pk)
+        
+        self.assertTrue(investment.complete_investment())
+        self.assertFalse(duplicate.complete_investment())
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.account_balance, Decimal('290.00'))
+    
+    def test_completion_does_not_debit_active_balance_again(self):
+        """Investing then completing, per row or in bulk, never leaves active_balance negative"""
+        plan = Plan.objects.create(
+            name='BASIC', min_amount=Decimal('100.00'), daily_percentage=Decimal('3.00'), duration_days=30
+        )
+        User.objects.filter(pk=self.user.pk).update(active_balance=Decimal('200.00'))
+        first = Investment.objects.create(user=self.user, plan=plan, amount=Decimal('100.00'))
+        second = Investment.objects.create(user=self.user, plan=plan, amount=Decimal('100.00'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.active_balance, Decimal('0.00'))
+        
+        self.assertTrue(first.complete_investment())
+        Investment.objects.filter(pk=second.pk).update(
+            end_date=timezone.now() - timedelta(minutes=1),
+            next_action_at=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(complete_expired_investments().processed, 1)
+        
+        self.user.refresh_from_db()
+        self.assertGreaterEqual(self.user.active_balance, Decimal('0.00'))
+        self.assertEqual(self.user.active_balance, Decimal('0.00'))
+        self.assertEqual(self.user.account_balance, Decimal('100.00') + 2 * (Decimal('100.00') + first.total_profit))
+
+
+
+class TrackerSignalTests(TestCase):
+    """Test that tracker handlers are single conditional statements"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='alice', email='alice@example.com', password='testpass123'
+        )
+    
+    def tracker(self):
+        return UserProfitTracker.objects.get(user=self.user)
+    
+    def test_profit_transaction_is_one_increment(self):
+        """A profit transaction adds to the tracker without reading it"""
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(2):
+                Transaction.objects.create(
+                    user=self.user, amount=Decimal('7.50'), transaction_type='profit',
+                    description='Profit', status='completed',
+                )
+        
+        tracker_queries = [q['sql'] for q in queries if 'userprofittracker' in q['sql']]
+        self.assertEqual(len(tracker_queries), 2)
+        self.assertTrue(all(sql.startswith('UPDATE') for sql in tracker_queries))
+        self.assertEqual(self.tracker().total_profit_earned, Decimal('15.00'))
+        self.assertEqual(self.tracker().profit_calculation_count, 2)
+    
+    def test_first_deposit_date_only_moves_earlier(self):
+        """Later approvals and unrelated saves leave the first date alone"""
+        first = Deposit.objects.create(user=self.user, amount=Decimal('10.00'), crypto_type='BTC')
+        second = Deposit.objects.create(user=self.user, amount=Decimal('10.00'), crypto_type='BTC')
+        Deposit.objects.filter(pk=second.pk).update(created_at=timezone.now() + timedelta(days=1))
+        second.refresh_from_db()
+        
+        first.approve()
+        with CaptureQueriesContext(connection) as queries:
+            second.approve()
+        self.assertEqual(self.tracker().first_deposit_date, first.created_at)
+        
+        # The later date still matches the tracker row: no INSERT attempt
+        tracker_queries = [q['sql'] for q in queries if 'userprofittracker' in q['sql']]
+        self.assertEqual(len(tracker_queries), 1)
+        self.assertTrue(tracker_queries[0].startswith('UPDATE'))
+        
+        first.transaction_hash = 'abc'
+        with CaptureQueriesContext(connection) as queries:
+            first.save()
+        self.assertFalse(any('userprofittracker' in q['sql'] for q in queries))
+    
+    def test_missing_tracker_is_created(self):
+        """Handlers still work for users created without a tracker"""
+        UserProfitTracker.objects.filter(user=self.user).delete()
+        
+        Transaction.objects.create(
+            user=self.user, amount=Decimal('5.00'), transaction_type='profit',
+            description='Profit', status='completed',
+        )
+        
+        self.assertEqual(self.tracker().total_profit_earned, Decimal('5.00'))
+
+
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class OverviewSettlementTests(ActiveInvestmentFixtures, TestCase):
+    """Test that concurrent overview loads share one profit settlement"""
+    
+    def test_burst_of_refreshes_settles_once(self):
+        """Refreshes within the single-flight window don't settle again"""
+        from django.core.cache import cache
+        cache.clear()
+        user = self.make_investment('alice')
+        Investment.objects.filter(user=user).update(
+            start_date=timezone.now() - timedelta(days=2)
+        )
+        self.client.force_login(user)
+        
+        for _ in range(3):
+            response = self.client.get('/dashboard/')
+            self.assertEqual(response.status_code, 200)
+        
+        self.assertEqual(Transaction.objects.filter(user=user, transaction_type='profit').count(), 1)
+        user.refresh_from_db()
+        self.assertEqual(response.context['user'].account_balance, user.account_balance)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class BenchmarkToolingTests(TestCase):
+    """Test the benchmark seeding command and runner"""
+    
+    def seed(self, users=20):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command(
+            'seed_benchmark_data', users=users, investments=3, daily_profit_days=2,
+            batch_size=8, stdout=StringIO(),
+        )
+    
+    def test_seed_creates_consistent_data(self):
+        """Seeded users get trackers, funded investments and non-negative balances"""
+        User = get_user_model()
+        self.seed()
+        
+        users = User.objects.filter(username__startswith='bench_')
+        self.assertEqual(users.count(), 20)
+        self.assertEqual(UserProfitTracker.objects.filter(user__in=users).count(), 20)
+        self.assertTrue(Investment.objects.filter(status='ACTIVE', next_action_at__isnull=False).exists())
+        self.assertFalse(users.filter(active_balance__lt=0).exists())
+        self.assertFalse(users.filter(account_balance__lt=0).exists())
+        
+        # A second run appends new users rather than colliding
+        self.seed(users=5)
+        self.assertEqual(users.count(), 25)
+    
+    def test_runner_rolls_back_and_reports(self):
+        """Benchmarks leave the data unchanged and record time and queries"""
+        from .benchmarks import run_benchmarks
+        self.seed()
+        Investment.objects.update(next_action_at=timezone.now() - timedelta(hours=1))
+        before = DailyProfit.objects.count()
+        
+        results = run_benchmarks(['distribute_daily_profits', 'overview_view'], repeat=2)
+        
+        self.assertEqual(DailyProfit.objects.count(), before)
+        self.assertEqual(set(results['results']), {'distribute_daily_profits', 'overview_view'})
+        for result in results['results'].values():
+            self.assertGreater(result['queries'], 0)
+            self.assertGreaterEqual(result['median_ms'], result['min_ms'])
+    
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        """Only benchmarks beyond the tolerance or with more queries regress"""
+        from .benchmarks import compare
+        baseline = {'results': {
+            'a': {'median_ms': 100, 'queries': 10},
+            'b': {'median_ms': 100, 'queries': 10},
+            'c': {'median_ms': 100, 'queries': 10},
+        }}
+        current = {'results': {
+            'a': {'median_ms': 120, 'queries': 10},
+            'b': {'median_ms': 150, 'queries': 10},
+            'c': {'median_ms': 90, 'queries': 11},
+            'new': {'median_ms': 500, 'queries': 99},
+        }}
+        
+        regressions = compare(current, baseline, tolerance=0.25)
+        
+        self.assertEqual([r['name'] for r in regressions], ['b', 'c'])
+
+
+class LoadTestReportTests(TestCase):
+    """Test the load test percentile and per-endpoint reporting"""
+    
+    def test_percentile_is_nearest_rank(self):
+        """p50/p95/p99 pick an observed sample, never interpolate"""
+        from .loadtest import percentile
+        values = list(range(1, 101))
+        
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+    
+    def test_recorder_summary_counts_errors_and_throughput(self):
+        """Each endpoint reports requests, errors, rps and percentiles"""
+        from .loadtest import Recorder
+        recorder = Recorder()
+        for ms in (10, 20, 30, 40):
+            recorder.record('overview', ms, ok=True)
+        recorder.record('withdrawal (POST)', 500, ok=False)
+        
+        report = recorder.summary(duration=2)
+        
+        self.assertEqual(report['overview']['requests'], 4)
+        self.assertEqual(report['overview']['rps'], 2.0)
+        self.assertEqual(report['overview']['p50_ms'], 20)
+        self.assertEqual(report['overview']['max_ms'], 40)
+        self.assertEqual(report['withdrawal (POST)']['errors'], 1)
+    
+    def test_temporary_admin_is_always_deleted(self):
+        """The command's own superuser doesn't outlive the run, even a failed one"""
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        User.objects.create_user(username='bench_0000001', email='b@example.com', password='benchmark')
+        admins = []
+        
+        def run_load(url, flows, **kwargs):
+            admins.append(User.objects.get(username=flows.admin[0]))
+            raise RuntimeError('server went away')
+        
+        with mock.patch('dashboard.management.commands.load_test.run_load', side_effect=run_load):
+            with self.assertRaises(RuntimeError):
+                call_command('load_test', base_url='http://testserver', stdout=StringIO())
+        
+        self.assertTrue(admins[0].is_superuser)
+        self.assertFalse(User.objects.filter(is_superuser=True).exists())
+        
+        with self.assertRaisesMessage(CommandError, 'is not an active superuser'):
+            call_command('load_test', base_url='http://testserver', admin='bench_0000001',
+                         admin_password='benchmark', stdout=StringIO())
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsEndpointTests(ActiveInvestmentFixtures, TestCase):
+    """Test the Prometheus /api/metrics endpoint"""
+    
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer s3cret'
+    
+    def test_exposes_jobs_queues_and_backlog(self):
+        """Job runs, pending queues and due investments appear as samples"""
+        user = self.make_investment('alice')
+        Deposit.objects.create(user=user, amount=Decimal('50.00'), crypto_type='BTC')
+        distribute_daily_profits()
+        
+        response = self.client.get('/api/metrics')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('minersurb_job_runs_total{job="distribute_daily_profits"} 1.0', body)
+        self.assertIn('minersurb_job_rows_processed_total{job="distribute_daily_profits"} 1.0', body)
+        self.assertIn('minersurb_queue_depth{queue="deposit"} 1.0', body)
+        self.assertIn('minersurb_queue_depth{queue="withdrawal"} 0.0', body)
+        self.assertIn('minersurb_investments_due 0.0', body)
+    
+    def test_rollup_is_cached_between_scrapes(self):
+        """A second scrape within the rollup TTL runs no aggregate queries"""
+        self.client.get('/api/metrics')
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/metrics')
+        
+        self.assertEqual(len(queries), 0)
+    
+    def test_token_is_required_when_configured(self):
+        """Scrapes without the bearer token are rejected"""
+        self.assertEqual(self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+    
+    @override_settings(METRICS_TOKEN='')
+    def test_staff_only_without_token(self):
+        """With no token configured the endpoint fails closed for everyone but staff"""
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+        
+        self.client.force_login(self.make_investment('alice'))
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+        
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Per-view histograms are exported with cumulative le buckets"""
+        from .metrics import Exposition
+        out = Exposition()
+        out.histogram('latency_seconds', 'help', [({'view': 'v'}, [0.1, 1], [2, 1, 1], 3.5)])
+        
+        text = out.render()
+        
+        self.assertIn('latency_seconds_bucket{view="v",le="0.1"} 2.0', text)
+        self.assertIn('latency_seconds_bucket{view="v",le="1"} 3.0', text)
+        self.assertIn('latency_seconds_bucket{view="v",le="+Inf"} 4.0', text)
+        self.assertIn('latency_seconds_count{view="v"} 4.0', text)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES, QUERY_BUDGET_MODE='raise', QUERY_BUDGET_SAMPLE_RATE=1)
+class QueryBudgetTests(ActiveInvestmentFixtures, TestCase):
+    """Test that the hot views stay within their declared query budgets"""
+    
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_investment('alice')
+        User.objects.filter(pk=self.user.pk).update(active_balance=Decimal('400.00'))
+        for _ in range(4):
+            Investment.objects.create(user=self.user, plan=self.plan, amount=Decimal('100.00'))
+            Deposit.objects.create(user=self.user, amount=Decimal('100.00'), crypto_type='BTC')
+            Withdrawal.objects.create(
+                user=self.user, amount=Decimal('1.00'), crypto_type='BTC', crypto_address='addr'
+            )
+    
+    def test_customer_views(self):
+        """Overview, history and referrals don't grow with the user's rows"""
+        self.client.force_login(self.user)
+        for url in ('/dashboard/', '/dashboard/history/', '/dashboard/referrals/'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_overview_settles_several_investments(self):
+        """Collecting accrued profit on every investment fits the overview budget"""
+        from django.core.cache import cache
+        cache.clear()
+        Investment.objects.filter(user=self.user).update(start_date=timezone.now() - timedelta(days=2))
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.client.get('/dashboard/').status_code, 200)
+
+        profits = Transaction.objects.filter(user=self.user, transaction_type='profit')
+        self.assertEqual(profits.count(), 5)
+        tracker = UserProfitTracker.objects.get(user=self.user)
+        self.assertEqual(tracker.profit_calculation_count, 5)
+        self.assertEqual(tracker.total_profit_earned, profits.aggregate(Sum('amount'))['amount__sum'])
+
+    def test_admin_views(self):
+        """Admin lists and user detail don't query per row"""
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+        for url in (
+            '/admin-panel/',
+            f'/admin-panel/users/{self.user.pk}/',
+            '/admin-panel/deposits/',
+            '/admin-panel/withdrawals/',
+            '/admin-panel/reports/',
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_reports_group_by_day(self):
+        """The 30-day report totals each day from grouped queries"""
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        Deposit.objects.filter(user=self.user).update(status='APPROVED', approved_at=timezone.now())
+        Deposit.objects.filter(pk=Deposit.objects.filter(user=self.user).first().pk).update(
+            approved_at=timezone.now() - timedelta(days=2)
+        )
+        self.client.force_login(admin)
+
+        response = self.client.get('/admin-panel/reports/')
+
+        self.assertEqual(len(response.context['dates']), 31)
+        self.assertEqual(response.context['deposit_data'][-1], 300.0)
+        self.assertEqual(response.context['deposit_data'][-3], 100.0)
+        self.assertEqual(response.context['withdrawal_data'][-1], 0.0)
+        self.assertEqual(response.context['user_data'][-1], 2)
+
+
+@override_settings(STORAGES=PLAIN_STORAGES)
+class JobTelemetryTests(ActiveInvestmentFixtures, TestCase):
+    """Test batch job telemetry and the Job Runs admin page"""
+    
+    def test_records_phases_rows_queries_and_memory(self):
+        """A run is saved with chunk phases, throughput inputs and a tracemalloc peak"""
+        from admin_panel.models import JobRun
+        from .telemetry import job_run
+        self.make_investment('alice')
+        self.make_investment('bob')
+        
+        with job_run('distribute_daily_profits', trigger='test') as run:
+            run.record(distribute_daily_profits())
+        
+        saved = JobRun.objects.get()
+        self.assertEqual(saved.status, 'SUCCESS')
+        self.assertEqual(saved.trigger, 'test')
+        self.assertEqual(saved.rows, 2)
+        self.assertGreater(saved.queries, 0)
+        self.assertGreater(saved.peak_memory_bytes, 0)
+        self.assertEqual(set(saved.phases), {'select', 'process'})
+        self.assertEqual(saved.phases['select']['calls'], 1)
+    
+    def test_failures_are_saved_and_idle_runs_can_be_skipped(self):
+        """A raising job is stored as FAILED; keep_idle=False drops empty runs"""
+        from admin_panel.models import JobRun
+        from .telemetry import job_run
+        
+        with self.assertRaises(ValueError):
+            with job_run('broken'):
+                raise ValueError('boom')
+        with job_run('idle', keep_idle=False):
+            pass
+        
+        failed = JobRun.objects.get()
+        self.assertEqual((failed.job, failed.status), ('broken', 'FAILED'))
+        self.assertEqual(failed.error, 'ValueError: boom')
+    
+    def test_cron_cleanup_phases_nest(self):
+        """Engine phases are recorded under the cron cleanup's own phases"""
+        from admin_panel.models import JobRun
+        from api.cron import run_cleanup
+        
+        run_cleanup()
+        
+        saved = JobRun.objects.get(job='cron_cleanup')
+        self.assertIn('complete_expired.select', saved.phases)
+        self.assertIn('sync_trackers', saved.phases)
+    
+    def test_admin_page_charts_runs(self):
+        """Staff see the trend charts for the selected job"""
+        from .telemetry import job_run
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pass12345')
+        self.client.force_login(admin)
+        self.assertContains(self.client.get('/admin-panel/performance/jobs/'), 'No Job Runs Yet')
+        
+        for _ in range(3):
+            with job_run('distribute_daily_profits'):
+                distribute_daily_profits()
+        
+        response = self.client.get('/admin-panel/performance/jobs/?job=distribute_daily_profits')
+        self.assertContains(response, 'durationChart')
+        self.assertEqual(len(response.context['runs']), 3)
+        self.assertEqual(response.context['baseline_runs'], 2)
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class HealthCheckTests(TransactionTestCase):
+    """Test the /api/health probes (probes run on other threads, so no TestCase transaction)"""
+    
+    def setUp(self):
+        from . import health
+        self.health = health
+        health.reset()
+        self.addCleanup(health.reset)
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Bearer s3cret'
+    
+    def record_run(self, job, age):
+        from admin_panel.models import JobRun
+        JobRun.objects.create(
+            job=job, status='SUCCESS', duration_ms=10,
+            started_at=timezone.now() - timedelta(seconds=age),
+        )
+    
+    def test_healthy_deployment(self):
+        """All probes pass once both jobs have run recently"""
+        self.record_run('distribute_daily_profits[0/2]', 60)
+        self.record_run('cron_cleanup', 60)
+        
+        response = self.client.get('/api/health')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        result = response.json()
+        self.assertEqual(result['status'], 'ok', result)
+        self.assertEqual(set(result['checks']), set(self.health.PROBES))
+        self.assertIsNotNone(result['checks']['database']['latency_ms'])
+    
+    @override_settings(HEALTH_MAX_JOB_AGE=3600)
+    def test_stale_jobs_degrade_without_failing(self):
+        """Stale or missing job runs are reported but keep answering 200"""
+        self.record_run('distribute_daily_profits', 7200)
+        
+        response = self.client.get('/api/health')
+        
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['status'], 'degraded')
+        self.assertEqual(result['checks']['profit_distribution']['age_seconds'], 7200.0)
+        self.assertEqual(result['checks']['cleanup']['error'], 'no successful run recorded')
+    
+    @override_settings(HEALTH_PROBE_TIMEOUT=0.2)
+    def test_hung_critical_probe_answers_503(self):
+        """A critical probe that doesn't answer in time takes the instance out"""
+        from unittest import mock
+        hung = mock.Mock(side_effect=lambda: time.sleep(1), __name__='hung')
+        
+        with mock.patch.dict(self.health.PROBES, {'database': hung}):
+            started = time.monotonic()
+            response = self.client.get('/api/health')
+        
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database']['error'], 'timed out after 0.2s')
+    
+    def test_result_is_reused_within_ttl(self):
+        """A second check within HEALTH_CACHE_TTL runs no probes"""
+        from unittest import mock
+        counting = mock.Mock(return_value={}, __name__='counting')
+        
+        with mock.patch.dict(self.health.PROBES, {'database': counting}):
+            self.client.get('/api/health')
+            self.client.get('/api/health')
+        
+        self.assertEqual(counting.call_count, 1)
+    
+    @override_settings(HEALTH_MAX_JOB_AGE=3600)
+    def test_anonymous_callers_get_only_statuses(self):
+        """Without the metrics token probe details aren't disclosed"""
+        self.record_run('distribute_daily_profits', 7200)
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        
+        response = self.client.get('/api/health', HTTP_AUTHORIZATION='Bearer wrong')
+        
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['status'], 'degraded')
+        self.assertEqual(result['checks']['database'], {'status': 'ok', 'critical': True})
+        self.assertEqual(result['checks']['profit_distribution'], {'status': 'failed', 'critical': False})
+        self.assertNotIn('applied', response.content.decode())
+
+
+class SimulateDaysTests(TestCase):
+    """Test the simulate_days time-travel command"""
+    
+    def setUp(self):
+        from core import clock
+        self.start = timezone.now() - timedelta(days=30)
+        self.plan = Plan.objects.create(
+            name='SHORT',
+            min_amount=Decimal('100.00'),
+            daily_percentage=Decimal('2.00'),
+            duration_days=5,
+        )
+        with clock.frozen(self.start):
+            for name in ('alice', 'bob'):
+                user = User.objects.create_user(
+                    username=name, email=f'{name}@example.com', password='testpass123',
+                    active_balance=Decimal('200.00'),
+                )
+                Investment.objects.create(user=user, plan=self.plan, amount=Decimal('100.00'))
+    
+    def simulate(self, **options):
+        import json
+        import tempfile
+        from django.core.management import call_command
+        from io import StringIO
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('simulate_days', days=6, start=self.start.isoformat(),
+                         output=output.name, stdout=StringIO(), **options)
+            return json.load(open(output.name))
+    
+    def test_runs_whole_lifecycle_with_invariants(self):
+        """Every daily credit and the completion happen in simulated time"""
+        report = self.simulate(keep=True)
+        
+        self.assertEqual([day['profits_paid'] for day in report['days']], [2, 2, 2, 2, 2, 0])
+        self.assertEqual([day['completed'] for day in report['days']], [0, 0, 0, 0, 2, 0])
+        self.assertTrue(all(ok for _, ok, _ in report['invariants']), report['invariants'])
+        
+        alice = User.objects.get(username='alice')
+        self.assertEqual(alice.account_balance, Decimal('110.00'))
+        investment = alice.investments.get()
+        self.assertEqual(investment.status, 'COMPLETED')
+        self.assertEqual(investment.daily_profits.count(), 5)
+        self.assertEqual(
+            investment.daily_profits.order_by('date').first().date,
+            timezone.localdate(self.start + timedelta(days=1)),
+        )
+    
+    def test_rolls_back_by_default(self):
+        """Without --keep the simulated days leave no trace"""
+        report = self.simulate()
+        
+        self.assertEqual(len(report['days']), 6)
+        self.assertFalse(DailyProfit.objects.exists())
+        self.assertEqual(Investment.objects.filter(status='ACTIVE').count(), 2)
+    
+    def test_invariant_violation_fails_the_command(self):
+        """Any failed invariant makes the command exit with an error"""
+        from django.core.management.base import CommandError
+        broken = [('no_negative_balances', False, '1 users with a negative balance')]
+        with mock.patch('dashboard.management.commands.simulate_days.check_invariants', return_value=broken):
+            with self.assertRaisesMessage(CommandError, 'no_negative_balances'):
+                self.simulate()
+
+
 def run_all_tests():
     """Run all tests and print summary"""
     print("=" * 60)
@@ -4,24 +4,30 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum
 from decimal import Decimal
-from django.utils import timezone
+from core import clock
+from core.cache import single_flight
+from core.query_guards import allow_writes_on_get, query_budget
 from core.models import User, Plan
 from .models import Investment, Deposit, Withdrawal, DailyProfit, UserProfitTracker
+from .engine import settle_accrued_profits
+from . import balances
 from datetime import date, timedelta
 
 @login_required
+@allow_writes_on_get
+@query_budget(25)
 def overview(request):
     user = request.user
     
     # ========== REAL-TIME PROFIT CALCULATION ==========
-    # Update profits for all active investments
-    total_profit_added_now = Decimal('0')
-    active_investments = Investment.objects.filter(user=user, status='ACTIVE')
-    
-    for investment in active_investments:
-        # This calls the new update_profit_if_needed() method
-        profit_added = investment.update_profit_if_needed()
-        total_profit_added_now += profit_added
+    # Update profits for all active investments. Several tabs refreshing at
+    # once share a single settlement instead of racing on the same rows.
+    total_profit_added_now = single_flight(
+        f'settle_profits:{user.pk}', lambda: settle_accrued_profits(user), default=Decimal('0')
+    )
+    # Balances were credited through other instances of the user
+    user.refresh_from_db(fields=balances.BALANCE_FIELDS)
+    active_investments = Investment.objects.filter(user=user, status='ACTIVE').select_related('plan')
     
     # Get or create profit tracker
     try:
@@ -30,8 +36,9 @@ def overview(request):
         profit_tracker = UserProfitTracker.objects.create(user=user)
     
     # Update tracker stats
-    profit_tracker.total_profit_earned = user.total_earnings
-    profit_tracker.save()
+    if profit_tracker.total_profit_earned != user.total_earnings:
+        profit_tracker.total_profit_earned = user.total_earnings
+        profit_tracker.save(update_fields=['total_profit_earned', 'last_profit_calculation'])
     
     # Calculate real-time metrics
     real_time_profit = Decimal('0')
@@ -75,7 +82,7 @@ def overview(request):
     ).order_by('-created_at')[:5]
     
     # Get today's profit
-    today = timezone.now().date()
+    today = clock.today()
     today_profits = DailyProfit.objects.filter(
         investment__user=user,
         date=today
@@ -159,9 +166,10 @@ def deposit_view(request):
             if plan_id:
                 try:
                     plan = Plan.objects.get(id=plan_id, is_active=True)
+                    # Display-only attributes for the confirmation page;
+                    # they are not columns, so there is nothing to save
                     deposit.selected_plan = plan
                     deposit.create_investment = True
-                    deposit.save()
                 except Plan.DoesNotExist:
                     pass
             
@@ -190,6 +198,8 @@ def withdrawal_view(request):
         crypto_type = request.POST.get('crypto_type')
         crypto_address = request.POST.get('crypto_address')
         
+        # Nothing is reserved here: the balance is debited, with a
+        # conditional UPDATE, when the withdrawal is approved
         if amount > request.user.account_balance:
             messages.error(request, 'Insufficient balance')
             return redirect('dashboard:withdrawal')
@@ -215,22 +225,25 @@ def profile_view(request):
         user.trx_address = request.POST.get('trx_address', '')
         user.usdt_address = request.POST.get('usdt_address', '')
         user.full_name = request.POST.get('full_name', '')
-        user.save()
+        user.save(update_fields=[
+            'bitcoin_address', 'ethereum_address', 'trx_address', 'usdt_address', 'full_name',
+        ])
         messages.success(request, 'Profile updated successfully')
         return redirect('dashboard:profile')
     
     return render(request, 'dashboard/profile.html')
 
 @login_required
+@query_budget(15)
 def history_view(request):
     deposits = Deposit.objects.filter(user=request.user).order_by('-created_at')
     withdrawals = Withdrawal.objects.filter(user=request.user).order_by('-created_at')
-    investments = Investment.objects.filter(user=request.user).order_by('-start_date')
+    investments = Investment.objects.filter(user=request.user).select_related('plan').order_by('-start_date')
     
     # Calculate days active for each investment
-    from django.utils import timezone  # Add this import if not already at top
+    now = clock.now()
     for investment in investments:
-        investment.days_active = (timezone.now() - investment.start_date).days
+        investment.days_active = (now - investment.start_date).days
         if investment.days_active > investment.plan.duration_days:
             investment.days_active = investment.plan.duration_days
     
@@ -244,6 +257,7 @@ def history_view(request):
     return render(request, 'dashboard/history.html', context)
 
 @login_required
+@query_budget(10)
 def referrals_view(request):
     referrals = User.objects.filter(referred_by=request.user)
     referral_link = f"{request.build_absolute_uri('/')[:-1]}/signup/?ref={request.user.referral_code}"
@@ -322,11 +336,6 @@ def investment_view(request):
                 status='ACTIVE'
             )
             
-            # Deduct from balance
-            # request.user.account_balance -= amount
-            # request.user.active_balance += amount
-            request.user.save()
-            
             messages.success(request, 
                 f'Investment created successfully! You will earn ${investment.daily_profit} daily for {plan.duration_days} days.')
             
@@ -346,7 +355,7 @@ def investment_view(request):
 @login_required
 def investment_history(request):
     """View investment history"""
-    investments = Investment.objects.filter(user=request.user).order_by('-start_date')
+    investments = Investment.objects.filter(user=request.user).select_related('plan').order_by('-start_date')
     
     context = {
         'investments': investments,
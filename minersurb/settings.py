@@ -54,17 +54,35 @@ TIME_ZONE = 'Europe/Berlin'
 USE_TZ = True
 
 MIDDLEWARE = [
+    # Slow statements with EXPLAIN plans (SLOW_QUERY_MS)
+    'core.middleware.SlowQueryMiddleware',
+    
+    # Per-request query counts and timings (REQUEST_METRICS)
+    'core.middleware.RequestMetricsMiddleware',
+    
     'django.middleware.security.SecurityMiddleware',
     
+    # Template render profiling (TEMPLATE_PROFILING)
+    'core.middleware.TemplateProfilerMiddleware',
+    
     # Add whitenoise for Vercel static files
     'whitenoise.middleware.WhiteNoiseMiddleware',
     
+    # Prerendered landing/auth pages for anonymous visitors
+    'core.middleware.PrerenderedPageMiddleware',
+    
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    
+    # On-demand cProfile of a request for staff (REQUEST_PROFILING)
+    'core.middleware.RequestProfilerMiddleware',
+    
+    # Flag DB writes during GET requests (READ_ONLY_GET)
+    'core.middleware.ReadOnlyGetMiddleware',
 ]
 
 ROOT_URLCONF = 'minersurb.urls'
@@ -73,7 +91,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -81,23 +98,125 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Always parse each template once per process; runserver's
+            # autoreloader still resets this cache when a template changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
+# Log per-template/per-block render times for each request
+TEMPLATE_PROFILING = os.getenv('TEMPLATE_PROFILING', 'False') == 'True'
+
+# Count queries / DB time per request: Server-Timing header, one JSON log
+# line per request and in-memory per-view histograms
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'False') == 'True'
+
+# Store statements slower than this (ms, 0 = off) with their EXPLAIN plan in
+# the admin_panel SlowQuery table, keeping the newest SLOW_QUERY_KEEP rows.
+# EXPLAIN runs on SLOW_QUERY_EXPLAIN_DATABASE (point it at a replica to use
+# ANALYZE, which executes the SELECT again).
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_KEEP = int(os.getenv('SLOW_QUERY_KEEP', '500'))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE', 'False') == 'True'
+SLOW_QUERY_EXPLAIN_DATABASE = os.getenv('SLOW_QUERY_EXPLAIN_DATABASE', 'default')
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '60'))
+
+# /api/metrics: scrapers send this bearer token; without one configured the
+# endpoint is staff-only (open under DEBUG). The same rule guards the probe
+# details of /api/health. Queue/backlog counts are
+# recomputed at most every METRICS_ROLLUP_TTL seconds
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ROLLUP_TTL = int(os.getenv('METRICS_ROLLUP_TTL', '30'))
+
+# /api/health: every probe gets HEALTH_PROBE_TIMEOUT seconds and the result
+# is reused for HEALTH_CACHE_TTL seconds. Jobs without a successful run for
+# HEALTH_MAX_JOB_AGE seconds, or investments due for longer than
+# HEALTH_MAX_BACKLOG_LAG, mark the deployment degraded.
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', '2'))
+HEALTH_CACHE_TTL = float(os.getenv('HEALTH_CACHE_TTL', '5'))
+HEALTH_MAX_JOB_AGE = int(os.getenv('HEALTH_MAX_JOB_AGE', str(26 * 3600)))
+HEALTH_MAX_BACKLOG_LAG = int(os.getenv('HEALTH_MAX_BACKLOG_LAG', str(26 * 3600)))
+
+# Let staff profile a request with ?_profile=1 or an X-Profile: 1 header;
+# the newest REQUEST_PROFILE_KEEP profiles are kept for the admin panel
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False') == 'True'
+REQUEST_PROFILE_KEEP = int(os.getenv('REQUEST_PROFILE_KEEP', '50'))
+
+# 'log' or 'raise' on INSERT/UPDATE/DELETE during GET requests ('off' by
+# default); views that write on read by design use @allow_writes_on_get
+READ_ONLY_GET = os.getenv('READ_ONLY_GET', 'off')
+READ_ONLY_GET_EXEMPT_TABLES = ['django_session']
+
+# Log every save() of an existing User/Investment/Deposit/Withdrawal row
+# that doesn't pass update_fields (see core.mixins.DirtyFieldsMixin)
+FULL_ROW_SAVE_WARNINGS = os.getenv('FULL_ROW_SAVE_WARNINGS', str(DEBUG)) == 'True'
+
+# @query_budget(n) views are checked on this fraction of requests and log
+# overruns ('raise' fails the request instead; 'off' skips the check)
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log')
+QUERY_BUDGET_SAMPLE_RATE = float(os.getenv('QUERY_BUDGET_SAMPLE_RATE', '0.01'))
+
+# Cache backing single-flight results and other shared state. Set REDIS_URL so
+# every worker shares it; the default is per-process memory.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 WSGI_APPLICATION = 'minersurb.wsgi.application'
 
 # ==================== DATABASE CONFIGURATION ====================
-if IS_VERCEL:
-    # Use PostgreSQL on Vercel
+# DB_CONNECTION_MODE controls how Postgres connections are managed:
+#   serverless - connections are closed after every request so short-lived
+#                function instances never hold idle connections. Safe behind
+#                a transaction pooler (PgBouncer / Supavisor): no server-side
+#                cursors and no session state is relied upon. Code must not
+#                take session-level locks either (pg_advisory_lock): the
+#                unlock may run on another backend. JobLock uses its lease
+#                row in this mode.
+#   persistent - connections are reused for DB_CONN_MAX_AGE seconds with
+#                health checks (long-lived gunicorn workers).
+# Django's in-process psycopg pool needs Django 5.1+, so it isn't offered on
+# the pinned 5.0.
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'serverless' if IS_VERCEL else 'persistent')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+
+if IS_VERCEL or os.getenv('DATABASE_URL'):
+    # Use PostgreSQL on Vercel (or locally when DATABASE_URL is set)
     import dj_database_url
+    from django.core.exceptions import ImproperlyConfigured
+
+    if DB_CONNECTION_MODE not in ('serverless', 'persistent'):
+        raise ImproperlyConfigured(f"Unknown DB_CONNECTION_MODE: {DB_CONNECTION_MODE}")
+
     DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
-            ssl_require=True
+            conn_max_age=DB_CONN_MAX_AGE if DB_CONNECTION_MODE == 'persistent' else 0,
+            conn_health_checks=DB_CONNECTION_MODE == 'persistent',
+            ssl_require=os.getenv('DB_SSL_REQUIRE', str(IS_VERCEL)) == 'True'
         )
     }
+
+    if DB_CONNECTION_MODE == 'serverless':
+        # Transaction poolers hand each transaction to a different backend,
+        # so named cursors opened outside a transaction would be lost.
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
 else:
     # Use SQLite locally
     DATABASES = {
@@ -106,6 +225,7 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+
 # ==================== END DATABASE CONFIGURATION ====================
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -133,8 +253,53 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Whitenoise compression and caching
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Whitenoise compression and caching: collectstatic purges unused CSS
+# selectors, fingerprints every file and writes .gz/.br variants. WhiteNoise
+# serves the fingerprinted names with immutable, far-future cache headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'minersurb.storage.OptimizedStaticFilesStorage',
+    },
+}
+
+# Stylesheets purged of selectors no template or script references
+STATIC_PURGE_CSS = [
+    'css/bootstrap.min.css',
+    'css/splide.min.css',
+    'css/main.css',
+    'css/dashboard.css',
+    'css/core/*.css',
+    'css/dashboard/*.css',
+    'css/admin_panel/*.css',
+    'webfont/tabler-icons.min.css',
+]
+
+# Classes only ever added at runtime by third-party scripts
+STATIC_PURGE_SAFELIST = [
+    'show', 'showing', 'hiding', 'fade', 'collapsing', 'active', 'disabled',
+    'modal-open', 'modal-backdrop', 'offcanvas-backdrop', 'was-validated',
+]
+
+# Icon fonts subset to the glyphs left in their purged stylesheet
+STATIC_ICON_FONTS = {
+    'webfont/tabler-icons.min.css': 'webfont/fonts/tabler-icons',
+}
+
+# Raster images that get resized AVIF/WebP variants ({% picture %} tag)
+STATIC_IMAGE_VARIANTS = ['img/*.png', 'img/*.jpg']
+STATIC_IMAGE_WIDTHS = [160, 320, 640, 1024]
+STATIC_IMAGE_FORMATS = ['avif', 'webp']
+
+# Prerendered anonymous pages. On Vercel they are rendered at cold start
+# into /tmp, the function's only writable path; elsewhere run
+# python manage.py prerender_pages on deploy.
+PRERENDER_ROOT = Path('/tmp/prerendered') if IS_VERCEL else BASE_DIR / 'prerendered'
+PRERENDER_ENABLED = os.getenv('PRERENDER_PAGES', str(not DEBUG)) == 'True'
+PRERENDER_ON_STARTUP = os.getenv('PRERENDER_ON_STARTUP', str(IS_VERCEL)) == 'True'
+PRERENDER_CDN_MAX_AGE = int(os.getenv('PRERENDER_CDN_MAX_AGE', '3600'))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -186,6 +351,22 @@ else:
     CELERY_TIMEZONE = 'Europe/Berlin'
 # ==================== END CELERY CONFIGURATION ====================
 
+# ==================== BATCH JOB CONFIGURATION ====================
+# Seconds a cron/batch invocation may spend before it stops at a chunk
+# boundary and reports more_work. Keep it below the function timeout
+# (10s on Vercel Hobby) so the response is always written.
+BATCH_TIME_BUDGET = float(os.getenv('BATCH_TIME_BUDGET', '8'))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '500'))
+# Lease length of the job lock row, used instead of advisory locks on SQLite
+# and in serverless mode; renewed after every chunk, so it only bounds how long a crashed run blocks
+BATCH_LOCK_TTL = int(os.getenv('BATCH_LOCK_TTL', '300'))
+# Every batch run is saved as an admin_panel JobRun (phase timings, rows,
+# queries, tracemalloc peak); the newest JOB_RUN_KEEP rows are kept.
+# tracemalloc slows allocation-heavy code, so it can be switched off.
+JOB_RUN_KEEP = int(os.getenv('JOB_RUN_KEEP', '2000'))
+JOB_TELEMETRY_TRACEMALLOC = os.getenv('JOB_TELEMETRY_TRACEMALLOC', 'True') == 'True'
+# ==================== END BATCH JOB CONFIGURATION ====================
+
 # ==================== SECURITY SETTINGS FOR PRODUCTION ====================
 if IS_VERCEL:
     # Security settings for Vercel production
@@ -0,0 +1,304 @@
+# minersurb/storage.py
+"""
+Static files storage used by collectstatic.
+
+On top of WhiteNoise's CompressedManifestStaticFilesStorage (content-hashed
+names, gzip/brotli variants, immutable cache headers) this, before the files
+are hashed and compressed:
+
+- purges CSS selectors that no template or script can ever match
+- subsets icon fonts to the glyphs the purged icon CSS still references
+- writes resized AVIF/WebP variants of raster images for <picture> srcsets
+"""
+import io
+import logging
+import re
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+# Words that can appear as class names / ids in markup or scripts
+TOKEN_RE = re.compile(r'[A-Za-z_][\w-]*')
+
+# .class and #id references inside a selector (escaped characters allowed)
+SELECTOR_NAME_RE = re.compile(r'([.#])((?:\\.|[\w-])+)')
+
+# Functional pseudo-classes whose arguments must not be required to match
+FUNCTIONAL_PSEUDO_RE = re.compile(r':(?:not|is|where|has)\(')
+
+# Icon glyph codepoints, e.g. .ti-home:before{content:"\eac1"}
+GLYPH_CONTENT_RE = re.compile(r'content:\s*["\']\\([0-9a-fA-F]{2,6})["\']')
+
+
+def image_variant_name(path, width, image_format):
+    """Name of a resized variant, e.g. img/logo.png -> img/logo.w320.webp"""
+    path = PurePosixPath(path)
+    return str(path.with_name(f'{path.stem}.w{width}.{image_format}'))
+
+
+def collect_used_tokens():
+    """Collect every word used in templates and JavaScript sources"""
+    roots = []
+    for engine in settings.TEMPLATES:
+        roots.extend(Path(d) for d in engine.get('DIRS', []))
+    roots.extend(Path(settings.BASE_DIR).glob('*/templates'))
+    roots.extend(Path(d) for d in settings.STATICFILES_DIRS)
+
+    tokens = set()
+    for root in roots:
+        if not root.is_dir():
+            continue
+        for path in root.rglob('*'):
+            if path.suffix in ('.html', '.txt', '.js'):
+                tokens.update(TOKEN_RE.findall(path.read_text(encoding='utf-8', errors='ignore')))
+    tokens.update(getattr(settings, 'STATIC_PURGE_SAFELIST', []))
+    return tokens
+
+
+def _strip_functional_pseudos(selector):
+    """Drop the arguments of :not()/:is()/:where()/:has()"""
+    while True:
+        match = FUNCTIONAL_PSEUDO_RE.search(selector)
+        if not match:
+            return selector
+        depth, i = 1, match.end()
+        while i < len(selector) and depth:
+            depth += {'(': 1, ')': -1}.get(selector[i], 0)
+            i += 1
+        selector = selector[:match.start()] + selector[i:]
+
+
+def _name_is_used(name, tokens, prefixes):
+    name = name.replace('\\', '')
+    return name in tokens or any(name.startswith(p) for p in prefixes)
+
+
+def _split_top_level(text, sep=','):
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in '([':
+            depth += 1
+        elif ch in ')]':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _selector_is_used(selector, tokens, prefixes):
+    selector = re.sub(r'\[[^\]]*\]', '', _strip_functional_pseudos(selector))
+    return all(
+        _name_is_used(name, tokens, prefixes)
+        for _, name in SELECTOR_NAME_RE.findall(selector)
+    )
+
+
+def _read_block(css, start):
+    """Return the index just past the '}' matching the '{' at css[start]"""
+    depth, i, quote = 0, start, None
+    while i < len(css):
+        ch = css[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif css.startswith('/*', i):
+            end = css.find('*/', i + 2)
+            i = len(css) if end == -1 else end + 1
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(css)
+
+
+def _find_rule_start(css, pos):
+    """Return the index of the next '{' or ';' outside strings/comments"""
+    i, quote = pos, None
+    while i < len(css):
+        ch = css[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif css.startswith('/*', i):
+            end = css.find('*/', i + 2)
+            if end == -1:
+                return len(css)
+            i = end + 1
+        elif ch in '{;':
+            return i
+        i += 1
+    return len(css)
+
+
+def purge_css(css, tokens):
+    """
+    Remove rules whose selectors reference classes or ids that never appear
+    in ``tokens``. Tokens ending in '-' or '_' (e.g. from `card--${type}`)
+    keep every class that starts with them.
+    """
+    prefixes = tuple(t for t in tokens if t.endswith(('-', '_')) and len(t) > 2)
+    out, pos = [], 0
+
+    while pos < len(css):
+        brace = _find_rule_start(css, pos)
+        if brace >= len(css):
+            out.append(css[pos:])
+            break
+
+        prelude = css[pos:brace]
+        stripped = re.sub(r'/\*.*?\*/', '', prelude, flags=re.S).strip()
+
+        if css[brace] == ';':
+            # @charset / @import / stray declarations are kept verbatim
+            out.append(css[pos:brace + 1])
+            pos = brace + 1
+            continue
+
+        end = _read_block(css, brace)
+        body = css[brace + 1:end - 1]
+
+        # Keep license comments that precede the rule
+        comments = re.findall(r'/\*!.*?\*/', prelude, flags=re.S)
+        out.extend(comments)
+
+        if stripped.startswith(('@media', '@supports', '@container', '@layer')):
+            inner = purge_css(body, tokens)
+            if inner.strip():
+                out.append(f'{stripped}{{{inner}}}')
+        elif stripped.startswith('@'):
+            # @font-face, @keyframes, @page... are not selector based
+            out.append(f'{stripped}{{{body}}}')
+        else:
+            selectors = [
+                s.strip() for s in _split_top_level(stripped)
+                if _selector_is_used(s, tokens, prefixes)
+            ]
+            if selectors:
+                out.append(f'{",".join(selectors)}{{{body}}}')
+        pos = end
+
+    return ''.join(out)
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Manifest + compression storage that slims CSS, fonts and images first"""
+
+    # Vendored minified files point at .map files we don't ship, which
+    # would otherwise abort collectstatic with a MissingFileError
+    patterns = tuple(
+        (extension, tuple(p for p in extension_patterns if 'sourceMappingURL' not in str(p)))
+        for extension, extension_patterns in CompressedManifestStaticFilesStorage.patterns
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            patterns = getattr(settings, 'STATIC_PURGE_CSS', [])
+            targets = [p for p in paths if any(fnmatch(p, pat) for pat in patterns)]
+            if targets:
+                tokens = collect_used_tokens()
+                for path in targets:
+                    self._purge_file(paths, path, tokens)
+
+            for css_path, font_base in getattr(settings, 'STATIC_ICON_FONTS', {}).items():
+                if css_path in paths:
+                    self._subset_icon_font(paths, css_path, font_base)
+
+            patterns = getattr(settings, 'STATIC_IMAGE_VARIANTS', [])
+            for path in [p for p in paths if any(fnmatch(p, pat) for pat in patterns)]:
+                self._write_image_variants(paths, path)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+    def _read_source(self, paths, path):
+        source_storage, source_path = paths[path]
+        with source_storage.open(source_path) as f:
+            return f.read()
+
+    def _replace(self, paths, path, content):
+        if self.exists(path):
+            self.delete(path)
+        self.save(path, ContentFile(content))
+
+        # Hash and compress the rewritten copy instead of the source file
+        paths[path] = (self, path)
+
+    def _purge_file(self, paths, path, tokens):
+        original = self._read_source(paths, path).decode('utf-8')
+        self._replace(paths, path, purge_css(original, tokens).encode('utf-8'))
+
+    def _subset_icon_font(self, paths, css_path, font_base):
+        try:
+            from fontTools import subset
+        except ImportError:
+            logger.warning("fontTools is not installed; icon fonts were not subset")
+            return
+
+        css = self._read_source(paths, css_path).decode('utf-8')
+        unicodes = sorted({int(code, 16) for code in GLYPH_CONTENT_RE.findall(css)})
+
+        for extension, flavor in (('woff2', 'woff2'), ('woff', 'woff'), ('ttf', None)):
+            font_path = f'{font_base}.{extension}'
+            if font_path not in paths:
+                continue
+
+            options = subset.Options()
+            options.flavor = flavor
+            options.ignore_missing_unicodes = True
+            # Icons are addressed by codepoint; the ligature tables are unused
+            options.drop_tables += ['GSUB', 'GPOS', 'GDEF']
+            font = subset.load_font(io.BytesIO(self._read_source(paths, font_path)), options)
+
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(unicodes=unicodes)
+            subsetter.subset(font)
+
+            output = io.BytesIO()
+            subset.save_font(font, output, options)
+            self._replace(paths, font_path, output.getvalue())
+
+        logger.info(f"Subset {font_base} to {len(unicodes)} glyphs")
+
+    def _write_image_variants(self, paths, path):
+        from PIL import Image, features
+
+        widths = getattr(settings, 'STATIC_IMAGE_WIDTHS', [])
+        formats = [
+            f for f in getattr(settings, 'STATIC_IMAGE_FORMATS', [])
+            if features.check(f)
+        ]
+
+        with Image.open(io.BytesIO(self._read_source(paths, path))) as image:
+            image.load()
+            for width in widths:
+                if width > image.width:
+                    continue
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+                for image_format in formats:
+                    output = io.BytesIO()
+                    resized.save(output, format=image_format.upper(), quality=70)
+                    name = image_variant_name(path, width, image_format)
+                    self._replace(paths, name, output.getvalue())
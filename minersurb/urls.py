@@ -4,6 +4,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
+from dashboard.health import health_view
+from dashboard.metrics import metrics_view
 
 # Import cron functions directly from api/cron.py
 # Your api/cron.py contains cron_cleanup and cron_test functions
@@ -28,12 +30,11 @@ urlpatterns = [
     # Admin app URLs
     path('admin-panel/', include('admin_panel.urls')),
     
-    # Health check endpoint (always available)
-    path('api/health', lambda request: JsonResponse({
-        'status': 'healthy', 
-        'service': 'Minersurb',
-        'timestamp': '2024-01-30T12:00:00Z'
-    }), name='health_check'),
+    # Health check endpoint: probes DB, cache, migrations and job freshness
+    path('api/health', health_view, name='health_check'),
+    
+    # Prometheus metrics (jobs, queues, per-view latency)
+    path('api/metrics', metrics_view, name='metrics'),
 ]
 
 # Add cron endpoints if available
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minersurb.settings')
 
 application = get_wsgi_application()
+
+# Vercel functions can't see the static build's output: render the
+# anonymous pages here, once per cold start (see core/prerender.py)
+from core.prerender import prerender_on_startup  # noqa: E402
+
+prerender_on_startup()